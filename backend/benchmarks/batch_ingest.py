@@ -0,0 +1,88 @@
+"""
+Batch ingest benchmark: CPU per reading of POST /sensors/data vs POST /sensors/batch.
+
+Runs the app in-process (httpx ASGI transport, mongomock database, response
+cache and ingest buffer off) and inserts the same readings one request per
+reading and then in batches of each supported encoding. Prints one JSON
+document with the process CPU time per reading (µs) of each path.
+
+mongomock's own insert cost is included in every path, so the ratio against a
+real MongoDB is larger than the one reported here.
+
+Usage (from backend/):
+    python -m benchmarks.batch_ingest --readings 2000 --batch-size 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+import msgpack
+import numpy as np
+from httpx import AsyncClient
+from mongomock_motor import AsyncMongoMockClient
+from main import app
+from utils.auth import create_access_token
+from utils.batch_decoder import EPOCH, READING_DTYPE
+import services.sensors_service
+
+def make_readings(count):
+    start = datetime.utcnow() - timedelta(hours=1)
+    return [
+        {"equipmentId": f"STATION_{i % 10}", "timestamp": start + timedelta(milliseconds=250 * i), "value": float(i % 97)}
+        for i in range(count)
+    ]
+
+def encode(readings, kind):
+    rows = [[r["equipmentId"], r["timestamp"].isoformat(), r["value"]] for r in readings]
+    if kind == "json":
+        return "application/json", json.dumps(rows).encode()
+    if kind == "ndjson":
+        return "application/x-ndjson", "\n".join(json.dumps(row) for row in rows).encode()
+    if kind == "msgpack":
+        return "application/msgpack", msgpack.packb(rows)
+    records = np.zeros(len(readings), dtype=READING_DTYPE)
+    records["equipmentId"] = [r["equipmentId"].encode() for r in readings]
+    records["timestamp"] = [(r["timestamp"] - EPOCH) // timedelta(milliseconds=1) for r in readings]
+    records["value"] = [r["value"] for r in readings]
+    return "application/octet-stream", records.tobytes()
+
+async def measure(run, count):
+    services.sensors_service.db = AsyncMongoMockClient()["batch_ingest"]
+    started = time.process_time()
+    await run()
+    return round((time.process_time() - started) / count * 1e6, 1)
+
+async def main(args):
+    services.sensors_service.settings.INGEST_BUFFER_ENABLED = False
+    services.sensors_service.response_cache.enabled = False
+    readings = make_readings(args.readings)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'username': 'bench_user'})}"}
+    results = {}
+
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        async def single():
+            for r in readings:
+                payload = {"equipmentId": r["equipmentId"], "timestamp": r["timestamp"].isoformat(), "value": r["value"]}
+                (await client.post("/sensors/data", json=payload, headers=headers)).raise_for_status()
+
+        results["single_us_per_reading"] = await measure(single, len(readings))
+
+        for kind in ("json", "ndjson", "msgpack", "binary"):
+            bodies = [encode(readings[i:i + args.batch_size], kind) for i in range(0, len(readings), args.batch_size)]
+
+            async def batch():
+                for content_type, body in bodies:
+                    response = await client.post("/sensors/batch", content=body,
+                                                 headers={**headers, "Content-Type": content_type})
+                    response.raise_for_status()
+
+            results[f"batch_{kind}_us_per_reading"] = await measure(batch, len(readings))
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+"""
+CSV parser micro-benchmark: rows/s of the row parser vs the columnar parser.
+
+Generates a CSV of `--rows` readings (ISO timestamps with a `Z` suffix, like
+the stations send) and feeds it in `--chunk-size` chunks, as the upload does,
+to each parser: `rows` (`CSVStreamParser`), `columnar` (`ColumnarCSVParser`,
+in-process) and, with `--processes`, `columnar` with every chunk split across
+a process pool as `CSV_PARSE_PROCESSES` does. Only parsing is timed: the
+documents the storage inserts are built afterwards and checked to be the same
+for every parser. Prints one JSON document with seconds and rows/s per parser.
+
+Usage (from backend/):
+    python -m benchmarks.csv_parser --rows 500000 --chunk-size 4194304 --processes 4
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone
+import numpy as np
+from utils.csv_parser import ColumnarCSVParser, ReadingColumns, create_parser, parse_block
+
+def make_csv(rows, stations=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00:00.000")
+    timestamps = (start + rng.integers(0, 365 * 86400 * 1000, rows).astype("timedelta64[ms]")).astype(str)
+    values = rng.uniform(0, 100, rows)
+    lines = [f"STATION_{i % stations},{timestamp}Z,{value:.2f}" for i, (timestamp, value) in enumerate(zip(timestamps, values))]
+    return ("equipmentId,timestamp,value\n" + "\n".join(lines) + "\n").encode()
+
+def parse(data, kind, chunk_size, pool=None, parts=1):
+    parser = create_parser(kind)
+    # b"": fim do arquivo (close), como no upload
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] + [b""]
+    results = []
+    for chunk in chunks:
+        if pool is None:
+            rows, _ = parser.feed(chunk) if chunk else parser.close()
+        else:
+            blocks, errors = parser.split(chunk, parts) if chunk else parser.split_last(parts)
+            rows, _ = parser.merge(list(pool.map(parse_block, *zip(*blocks))) if blocks else [], errors)
+        results.append(rows)
+    return results
+
+def documents(results):
+    docs = []
+    for rows in results:
+        docs.extend(rows.to_documents() if isinstance(rows, ReadingColumns) else rows)
+    # Sem offset é UTC, como o Mongo guarda
+    return [(d["equipmentId"], d["timestamp"].replace(tzinfo=d["timestamp"].tzinfo or timezone.utc), d["value"]) for d in docs]
+
+def run(args):
+    data = make_csv(args.rows)
+    print(json.dumps({"rows": args.rows, "bytes": len(data)}), file=sys.stderr)
+    runs = [("rows", {}), ("columnar", {})]
+    pool = None
+    if args.processes:
+        pool = ProcessPoolExecutor(args.processes, mp_context=multiprocessing.get_context("spawn"))
+        # Aquece os processos fora da medição
+        list(pool.map(parse_block, *zip(*ColumnarCSVParser().split(data[:4096], args.processes)[0])))
+        runs.append((f"columnar_{args.processes}_processes", {"pool": pool, "parts": args.processes}))
+
+    results, reference = {}, None
+    try:
+        for name, options in runs:
+            kind = "rows" if name == "rows" else "columnar"
+            best = float("inf")
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                parsed = parse(data, kind, args.chunk_size, **options)
+                best = min(best, time.perf_counter() - started)
+            docs = documents(parsed)
+            if reference is None:
+                reference = docs
+            elif docs != reference:
+                raise RuntimeError(f"{name} parsed different readings than the row parser")
+            results[name] = {"seconds": round(best, 4), "rows_per_second": round(args.rows / best)}
+            print(json.dumps({name: results[name]}), file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    baseline = results["rows"]["seconds"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["seconds"], 2)
+    print(json.dumps({"chunk_size": args.chunk_size, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=1 << 20, help="Bytes per chunk (CSV_READ_CHUNK_SIZE)")
+    parser.add_argument("--processes", type=int, default=0, help="Also time the columnar parser with this many processes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parser; the fastest is reported")
+    run(parser.parse_args())
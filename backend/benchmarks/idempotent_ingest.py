@@ -0,0 +1,148 @@
+"""
+Idempotent ingest benchmark: cost of deduplicating readings at full ingest rate.
+
+Writes `--readings` readings in `--batch-size` batches through the service's
+write path (`_write_readings`: reorder window, storage insert, cache and
+realtime publish) for each storage backend, twice, on an empty database each time:
+
+- fresh: every reading is new;
+- retries: each batch also re-sends a `--duplicates` fraction of readings of
+  itself and of the previous batch (device retries after a timeout).
+
+The Mongo backend is also run without the unique (equipmentId, timestamp) index
+(`mongo_no_index`, the write path before ingest was idempotent) as the
+baseline. After each run the stored count is checked against the unique
+readings. The in-process steps (`unique_readings`, the reorder window) are
+timed on their own as µs per reading. Prints one JSON document.
+
+Runs against mongomock by default, whose own insert cost dominates and whose
+unique indexes scan the whole collection on every write: the `mongo` backend
+(unique index) only runs by default with `--mongo-uri`, a local mongod (its
+`--database` is dropped before each run).
+
+Usage (from backend/):
+    python -m benchmarks.idempotent_ingest --readings 20000 --batch-size 500 --duplicates 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from config.database import ensure_indexes
+from services.reorder_window import ReorderWindow
+from storage import BucketStorage, ColumnarStorage, MongoStorage
+from storage.base import unique_readings
+import services.sensors_service
+
+def make_readings(count, stations=100):
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+    return [
+        {"equipmentId": f"STATION_{i % stations}", "timestamp": start + timedelta(milliseconds=10 * i),
+         "value": float(i % 97)}
+        for i in range(count)
+    ]
+
+def make_batches(readings, batch_size, duplicates, rng):
+    """Batches of new readings, each with repeats of its own and of the previous batch's."""
+    batches = []
+    for i in range(0, len(readings), batch_size):
+        batch = readings[i:i + batch_size]
+        repeats = int(len(batch) * duplicates)
+        # Retries são de leituras recentes: dentro da janela de reordenação
+        sent = readings[max(i - batch_size, 0):i + len(batch)]
+        batch = batch + [rng.choice(sent) for _ in range(repeats)]
+        rng.shuffle(batch)
+        batches.append(batch)
+    return batches
+
+async def database(args):
+    if args.mongo_uri:
+        client = AsyncIOMotorClient(args.mongo_uri)
+        await client.drop_database(args.database)
+        return client[args.database]
+    return AsyncMongoMockClient()[args.database]
+
+async def write_all(batches):
+    write = services.sensors_service._write_readings
+    count = 0
+    started = time.perf_counter()
+    for batch in batches:
+        # Documentos novos a cada envio, como os que chegam pela API
+        await write([{**doc, "_id": ObjectId()} for doc in batch])
+        count += len(batch)
+    return count, time.perf_counter() - started
+
+async def run_backend(name, args, batches):
+    db = await database(args)
+    services.sensors_service.db = db
+    if name != "mongo_no_index":
+        await ensure_indexes(db)
+    root = tempfile.mkdtemp(prefix="idempotent_ingest_")
+    storage = services.sensors_service.storage = {
+        "mongo": lambda: MongoStorage(lambda: db),
+        "mongo_no_index": lambda: MongoStorage(lambda: db),
+        "buckets": lambda: BucketStorage(lambda: db),
+        "columnar": lambda: ColumnarStorage(root),
+    }[name]()
+    services.sensors_service.reorder_window = ReorderWindow(args.reorder_window)
+
+    count, seconds = await write_all(batches)
+    stored = await storage.summarize("STATION_0", datetime(1970, 1, 1))
+    return {"readings": count, "seconds": round(seconds, 3), "readings_per_second": round(count / seconds),
+            "station_0_stored": stored["count"]}
+
+def time_in_process(readings, batch_size, repeat=5):
+    window = ReorderWindow(60)
+    batches = [readings[i:i + batch_size] for i in range(0, len(readings), batch_size)]
+    timings = {}
+    for label, step in (("unique_readings", unique_readings),
+                        ("reorder_window", lambda batch: (window.late(batch), window.advance(batch)))):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for batch in batches:
+                step(batch)
+            best = min(best, time.perf_counter() - started)
+        timings[f"{label}_us_per_reading"] = round(best / len(readings) * 1e6, 3)
+    return timings
+
+async def main(args):
+    services.sensors_service.settings.INGEST_BUFFER_ENABLED = False
+    services.sensors_service.response_cache.enabled = False
+    rng = random.Random(args.seed)
+    readings = make_readings(args.readings)
+    fresh = make_batches(readings, args.batch_size, 0, rng)
+    retries = make_batches(readings, args.batch_size, args.duplicates, rng)
+    expected = sum(1 for doc in readings if doc["equipmentId"] == "STATION_0")
+
+    results = {"in_process": time_in_process(readings, args.batch_size)}
+    backends = args.backends or ("mongo_no_index,mongo,buckets,columnar" if args.mongo_uri else
+                                 "mongo_no_index,buckets,columnar")
+    for name in backends.split(","):
+        result = results[name] = {}
+        for label, batches in (("fresh", fresh), ("retries", retries)):
+            result[label] = await run_backend(name, args, batches)
+            stored = result[label]["station_0_stored"]
+            if name != "mongo_no_index" and stored != expected:
+                raise RuntimeError(f"{name} stored {stored} readings of STATION_0 ({label}), expected {expected}")
+        print(json.dumps({name: result}), file=sys.stderr)
+    print(json.dumps({"readings": args.readings, "batch_size": args.batch_size, "duplicates": args.duplicates,
+                      "results": results}, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Fraction of each batch re-sent in the retries run")
+    parser.add_argument("--reorder-window", type=float, default=60, help="INGEST_REORDER_WINDOW_SECONDS for the runs")
+    parser.add_argument("--backends", default="", help="Comma-separated; mongo_no_index,mongo,buckets,columnar")
+    parser.add_argument("--mongo-uri", default="", help="Local mongod instead of mongomock")
+    parser.add_argument("--database", default="idempotent_ingest_benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,323 @@
+"""
+Benchmark suite: throughput and latency of ingest, queries and CSV import.
+
+Runs the app in-process (httpx ASGI transport) against an in-memory mongomock
+database, or a local mongod with `--mongo-uri` (its `--database` is dropped
+first). The dataset is generated from `--seed`, so two runs with the same
+arguments read and write the same readings; timestamps are laid out backwards
+from the hour the run starts so the period queries always cover them.
+
+Scenarios (`--scenarios`, all by default), in this order:
+
+- station_average: GET /sensors/average of one station;
+- all_averages: GET /sensors/averages;
+- raw_fetch: every page of GET /sensors/{id}/values of one station;
+- single_insert: POST /sensors/data, one reading per request;
+- batch_insert: `--batches` POST /sensors/batch (msgpack) of `--batch-size` readings;
+- csv_upload: `--csv-uploads` POST /sensors/upload of a `--csv-mb` MB file, each
+  timed until its import job completes.
+
+The other scenarios run `--requests` operations (raw_fetch a tenth of them),
+all over `--concurrency` clients, with
+the response cache and the ingest buffer off. Results are one JSON document
+(stdout or `--output`) with, per scenario, operations and items per second and
+p50/p95/p99 (ms) of the operation latency.
+
+`compare` reads two results and flags every scenario whose throughput fell or
+whose p95/p99 rose by more than `--threshold` (a fraction); it exits with 1 when
+there is a regression.
+
+Usage (from backend/):
+    python -m benchmarks.suite run --stations 10 --readings 20000 --output baseline.json
+    python -m benchmarks.suite run --mongo-uri mongodb://localhost:27017 --output current.json
+    python -m benchmarks.suite compare baseline.json current.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+import msgpack
+import numpy as np
+from bson import ObjectId
+from httpx import AsyncClient
+from benchmarks.login_storm import percentiles
+from config import settings
+from config.database import ensure_indexes
+from main import app
+from services.import_jobs import import_jobs
+from utils.auth import create_access_token
+import services.sensors_service
+
+SCENARIOS = ("station_average", "all_averages", "raw_fetch", "single_insert", "batch_insert", "csv_upload")
+# Métricas comparadas e o sentido em que pioram
+COMPARED = {"ops_per_second": -1, "items_per_second": -1, "p95_ms": 1, "p99_ms": 1}
+
+class Dataset:
+    """
+    Deterministic readings of `stations` stations ending at `anchor`, with
+    values drawn from a generator seeded with `seed`.
+    """
+
+    def __init__(self, seed: int, stations: int, anchor: datetime):
+        self.rng = np.random.default_rng(seed)
+        self.stations = [f"STATION_{i}" for i in range(stations)]
+        self.anchor = anchor
+
+    def readings(self, count: int, span: timedelta):
+        """`count` readings spread evenly over the `span` before the anchor, stations interleaved."""
+        offsets = np.linspace(span.total_seconds(), 0, count, endpoint=False)
+        values = np.round(self.rng.normal(50.0, 15.0, count), 2)
+        return [
+            {"equipmentId": self.stations[i % len(self.stations)],
+             "timestamp": self.anchor - timedelta(seconds=float(offset)), "value": float(value)}
+            for i, (offset, value) in enumerate(zip(offsets.tolist(), values.tolist()))
+        ]
+
+    def csv(self, size_bytes: int, span: timedelta) -> bytes:
+        """A CSV upload of about `size_bytes` bytes."""
+        out = io.StringIO()
+        out.write("equipmentId,timestamp,value\n")
+        # Uma linha ocupa ~45 bytes: gera em blocos até passar do tamanho pedido
+        while out.tell() < size_bytes:
+            for r in self.readings(max(size_bytes // 45 // 10, 100), span):
+                out.write(f"{r['equipmentId']},{r['timestamp'].isoformat()},{r['value']}\n")
+        return out.getvalue().encode()
+
+async def run_clients(operations, concurrency: int):
+    """
+    Runs the `operations` (async callables returning the items they handled)
+    over `concurrency` clients.
+
+    Returns:
+    - dict: Latency percentiles, `ops_per_second` and `items_per_second`.
+    """
+    queue = list(reversed(operations))
+    latencies = []
+    items = [0]
+
+    async def worker():
+        while queue:
+            operation = queue.pop()
+            started = time.perf_counter()
+            handled = await operation()
+            items[0] += handled
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        **percentiles(latencies),
+        "items": items[0],
+        "seconds": round(elapsed, 3),
+        "ops_per_second": round(len(latencies) / elapsed, 2),
+        "items_per_second": round(items[0] / elapsed, 2),
+    }
+
+def scenarios(client, headers, dataset: Dataset, args):
+    """Builds the operations of each scenario; called lazily so writes see the data of earlier ones."""
+    station = dataset.stations[0]
+    # Uma hora a mais: a janela cobre todo o conjunto, seja qual for o minuto da execução
+    period = f"{args.span_hours + 1}h"
+
+    def get(url, **params):
+        async def operation():
+            response = await client.get(url, params=params, headers=headers)
+            response.raise_for_status()
+            return 1
+        return operation
+
+    async def fetch_all_pages():
+        count, cursor = 0, None
+        while True:
+            params = {"period": period, "limit": args.page_size}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get(f"/sensors/{station}/values", params=params, headers=headers)
+            response.raise_for_status()
+            page = response.json()
+            count += len(page["values"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return count
+
+    def single_inserts():
+        def insert(reading):
+            async def operation():
+                payload = {**reading, "timestamp": reading["timestamp"].isoformat()}
+                (await client.post("/sensors/data", json=payload, headers=headers)).raise_for_status()
+                return 1
+            return operation
+        return [insert(r) for r in dataset.readings(args.requests, timedelta(hours=1))]
+
+    def batch_inserts():
+        def insert(rows):
+            body = msgpack.packb(rows)
+
+            async def operation():
+                response = await client.post("/sensors/batch", content=body,
+                                             headers={**headers, "Content-Type": "application/msgpack"})
+                response.raise_for_status()
+                return len(rows)
+            return operation
+        readings = dataset.readings(args.batches * args.batch_size, timedelta(hours=1))
+        rows = [[r["equipmentId"], r["timestamp"].isoformat(), r["value"]] for r in readings]
+        return [insert(rows[i:i + args.batch_size]) for i in range(0, len(rows), args.batch_size)]
+
+    def csv_uploads():
+        body = dataset.csv(int(args.csv_mb * 1024 * 1024), timedelta(hours=args.span_hours))
+
+        async def operation():
+            files = {"file": ("bench.csv", body, "text/csv")}
+            response = await client.post("/sensors/upload", files=files, headers=headers)
+            response.raise_for_status()
+            job_id = response.json()["job_id"]
+            while True:
+                job = (await client.get(f"/sensors/upload/{job_id}", headers=headers)).json()
+                if job["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(0.01)
+            if job["status"] != "completed":
+                raise RuntimeError(f"CSV import {job_id} {job['status']}: {job['error']}")
+            return job["inserted_count"]
+
+        return [operation] * args.csv_uploads
+
+    return {
+        "station_average": lambda: [get("/sensors/average", equipmentId=station, period=period)] * args.requests,
+        "all_averages": lambda: [get("/sensors/averages", period=period)] * args.requests,
+        "raw_fetch": lambda: [fetch_all_pages] * max(args.requests // 10, 1),
+        "single_insert": single_inserts,
+        "batch_insert": batch_inserts,
+        "csv_upload": csv_uploads,
+    }
+
+async def run(args):
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo = AsyncIOMotorClient(args.mongo_uri)
+        await mongo.drop_database(args.database)
+        database = mongo[args.database]
+        await ensure_indexes(database)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        database = AsyncMongoMockClient()[args.database]
+    services.sensors_service.db = database
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Mede o trabalho de cada requisição: sem cache de respostas nem buffer de ingestão
+    services.sensors_service.response_cache.enabled = False
+    services.sensors_service.settings.INGEST_BUFFER_ENABLED = False
+    import_jobs.spool_dir = args.spool_dir
+
+    dataset = Dataset(args.seed, args.stations, datetime.utcnow().replace(minute=0, second=0, microsecond=0))
+    readings = dataset.readings(args.readings, timedelta(hours=args.span_hours))
+    for i in range(0, len(readings), 10000):
+        chunk = [{"_id": ObjectId(), **r} for r in readings[i:i + 10000]]
+        _, error = await services.sensors_service.storage.insert(chunk)
+        if error:
+            raise error
+
+    headers = {"Authorization": f"Bearer {create_access_token(data={'username': 'bench_user'})}"}
+    results = {}
+    async with AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        builders = scenarios(client, headers, dataset, args)
+        for name in args.scenarios:
+            results[name] = await run_clients(builders[name](), args.concurrency)
+            print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "database": "mongod" if args.mongo_uri else "mongomock",
+            "storage_backend": settings.STORAGE_BACKEND,
+            **{key: getattr(args, key) for key in
+               ("seed", "stations", "readings", "span_hours", "requests", "concurrency",
+                "batches", "batch_size", "page_size", "csv_mb", "csv_uploads")},
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+def compare(baseline: dict, current: dict, threshold: float) -> dict:
+    """
+    Relative change of the compared metrics of every scenario present in both runs.
+
+    Returns:
+    - dict: `{scenario: {metric: {"baseline", "current", "change", "regression"}}}`
+      and the list of regressions under `"regressions"`.
+    """
+    report = {"scenarios": {}, "regressions": []}
+    for name, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(name)
+        if after is None:
+            continue
+        rows = report["scenarios"][name] = {}
+        for metric, worse in COMPARED.items():
+            if not before.get(metric) or metric not in after:
+                continue
+            change = (after[metric] - before[metric]) / before[metric]
+            regression = change * worse > threshold
+            rows[metric] = {"baseline": before[metric], "current": after[metric],
+                            "change": round(change, 4), "regression": regression}
+            if regression:
+                report["regressions"].append(f"{name}.{metric}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the scenarios and emit the results as JSON")
+    run_parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS),
+                            help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    run_parser.add_argument("--mongo-uri", help="Local mongod to use instead of mongomock")
+    run_parser.add_argument("--database", default="sensor_benchmark")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--stations", type=int, default=10)
+    run_parser.add_argument("--readings", type=int, default=20000, help="Readings loaded before the scenarios")
+    run_parser.add_argument("--span-hours", type=int, default=24, help="Hours covered by the readings and queries")
+    run_parser.add_argument("--requests", type=int, default=200, help="Operations per scenario")
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--batches", type=int, default=20, help="Requests of the batch_insert scenario")
+    run_parser.add_argument("--batch-size", type=int, default=500)
+    run_parser.add_argument("--page-size", type=int, default=settings.PAGE_DEFAULT_LIMIT)
+    run_parser.add_argument("--csv-mb", type=float, default=1.0)
+    run_parser.add_argument("--csv-uploads", type=int, default=3)
+    run_parser.add_argument("--spool-dir", default=settings.IMPORT_SPOOL_DIR)
+    run_parser.add_argument("--output", help="File for the results (stdout by default)")
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions between two results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Tolerated relative change (0.1 = 10%%)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        unknown = set(args.scenarios) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        asyncio.run(run(args))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    report = compare(baseline, current, args.threshold)
+    print(json.dumps(report, indent=2))
+    return 1 if report["regressions"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Write-ahead log benchmark: ingest latency and replay throughput through a database stall.
+
+`--clients` concurrent clients send `--readings` readings in total, one at a
+time, to a simulated database whose inserts take `--db-latency-ms` per call
+(plus a microsecond per reading) and that is unavailable for `--stall-seconds`
+once a third of the readings have been sent. Scenarios:
+
+- direct: every reading is inserted by its request, as POST /sensors/data does
+  without the WAL; the requests during the stall fail and their readings are lost;
+- wal_<policy>: the request appends to a `WriteAheadLog` (in a temporary
+  directory) with each fsync policy and the drainer replays into the database,
+  retrying through the stall.
+
+Prints one JSON document with, per scenario, appends/s, p50/p99/max request
+latency (ms), readings lost, readings per group commit, and for the WAL the
+replay throughput, the largest lag seen and how long the replay took to
+catch up after the last append.
+
+Usage (from backend/):
+    python -m benchmarks.wal_ingest --readings 20000 --clients 64 --db-latency-ms 5 --stall-seconds 2
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import ServerSelectionTimeoutError
+from services import wal as wal_module
+from services.wal import FSYNC_POLICIES, WriteAheadLog
+
+class Database:
+    """Fake database: fixed latency per insert call, down for `stall_seconds` once `stall()` is called."""
+
+    def __init__(self, latency, stall_seconds):
+        self.latency = latency
+        self.stall_seconds = stall_seconds
+        self.stall_end = None
+        self.stored = 0
+
+    def stall(self):
+        self.stall_end = time.perf_counter() + self.stall_seconds
+
+    async def insert(self, docs):
+        if self.stall_end is not None and time.perf_counter() < self.stall_end:
+            # Como o driver: espera o timeout de seleção de servidor e falha
+            await asyncio.sleep(self.latency * 10)
+            raise ServerSelectionTimeoutError("database unavailable")
+        await asyncio.sleep(self.latency + len(docs) * 1e-6)
+        self.stored += len(docs)
+
+def make_readings(count):
+    start = datetime.utcnow().replace(microsecond=0)
+    return [
+        {"_id": ObjectId(), "equipmentId": f"STATION_{i % 100}", "timestamp": start + timedelta(milliseconds=i),
+         "value": float(i % 97)}
+        for i in range(count)
+    ]
+
+async def run_clients(readings, clients, send, database):
+    queue = asyncio.Queue()
+    for doc in readings:
+        queue.put_nowait(doc)
+    latencies, lost = [], 0
+    stall_at = len(readings) // 3
+
+    async def client():
+        nonlocal lost
+        while not queue.empty():
+            doc = queue.get_nowait()
+            if len(readings) - queue.qsize() == stall_at:
+                database.stall()
+            started = time.perf_counter()
+            try:
+                await send(doc)
+            except Exception:
+                lost += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    seconds = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    return {
+        "appends_per_second": round(len(readings) / seconds),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "lost": lost,
+    }
+
+async def run_direct(args, readings):
+    database = Database(args.db_latency_ms / 1000, args.stall_seconds)
+    result = await run_clients(readings, args.clients, lambda doc: database.insert([doc]), database)
+    result["stored"] = database.stored
+    return result
+
+async def run_wal(args, readings, policy):
+    database = Database(args.db_latency_ms / 1000, args.stall_seconds)
+    wal = WriteAheadLog(tempfile.mkdtemp(prefix="wal_bench_"), flush=database.insert, fsync=policy,
+                        drain_batch_size=args.drain_batch_size, drain_interval=0.01)
+    wal.start()
+    lag = {"bytes": 0, "seconds": 0.0}
+
+    async def watch():
+        while True:
+            lag["bytes"] = max(lag["bytes"], wal.lag_bytes)
+            lag["seconds"] = max(lag["seconds"], wal.lag_seconds)
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.get_running_loop().create_task(watch())
+    commits = wal_module.WAL_COMMIT_RECORDS.labels()
+    count_before = sum(commits.counts)
+    failures_before = wal_module.WAL_REPLAY_FAILURES.labels().value
+    result = await run_clients(readings, args.clients, wal.append, database)
+    appended = time.perf_counter()
+    while database.stored < len(readings):
+        await asyncio.sleep(0.005)
+    caught_up = time.perf_counter() - appended
+    watcher.cancel()
+    status = wal.status()
+    await wal.stop()
+    result.update({
+        "stored": database.stored,
+        "readings_per_commit": round(len(readings) / (sum(commits.counts) - count_before), 1),
+        "replay_seconds_after_last_append": round(caught_up, 3),
+        "last_replay_rate": round(status["last_replay_rate"] or 0),
+        "max_lag_bytes": lag["bytes"],
+        "max_lag_seconds": round(lag["seconds"], 3),
+        "replay_failures": int(wal_module.WAL_REPLAY_FAILURES.labels().value - failures_before),
+    })
+    return result
+
+async def main(args):
+    wal_module.RETRY_MIN_SECONDS = 0.1
+    wal_module.RETRY_MAX_SECONDS = 0.5
+    readings = make_readings(args.readings)
+    results = {"direct": await run_direct(args, readings)}
+    print(json.dumps({"direct": results["direct"]}), file=sys.stderr)
+    for policy in args.fsync.split(","):
+        results[f"wal_{policy}"] = await run_wal(args, readings, policy)
+        print(json.dumps({policy: results[f"wal_{policy}"]}), file=sys.stderr)
+    print(json.dumps({"readings": args.readings, "clients": args.clients, "db_latency_ms": args.db_latency_ms,
+                      "stall_seconds": args.stall_seconds, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--stall-seconds", type=float, default=2)
+    parser.add_argument("--drain-batch-size", type=int, default=5000)
+    parser.add_argument("--fsync", default=",".join(FSYNC_POLICIES), help="Comma-separated fsync policies to run")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,158 @@
+"""
+Worker scaling benchmark: throughput of the production server by number of workers.
+
+For each worker count, starts the server as in production (gunicorn with
+`gunicorn.conf.py`, or `uvicorn --workers` when gunicorn is not installed)
+against `--mongo-uri`, then drives it with `--load-processes` client processes
+of `--connections` keep-alive connections each (closed loop) for `--duration`
+seconds. Prints one JSON document with requests/s, p50/p99 (ms), the speedup
+over the first worker count and the scaling efficiency (speedup divided by
+the worker ratio, 1.0 = linear).
+
+The clients run on the same machine: give them cores of their own (e.g.
+`taskset`) or the load generator, not the server, sets the ceiling.
+
+Usage (from backend/):
+    python -m benchmarks.worker_scaling --mongo-uri mongodb://localhost:27017 --workers 1,2,4 --scenario average
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+import httpx
+from benchmarks.login_storm import percentiles
+from utils.auth import create_access_token
+
+SCENARIOS = ("average", "insert")
+
+def request_for(scenario, counter):
+    if scenario == "average":
+        return "GET", "/sensors/average", {"params": {"equipmentId": f"STATION_{counter % 10}", "period": "24h"}}
+    reading = {"equipmentId": f"STATION_{counter % 10}", "timestamp": datetime.utcnow().isoformat(), "value": float(counter % 97)}
+    return "POST", "/sensors/data", {"json": reading}
+
+async def drive(url, token, scenario, connections, duration):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    latencies = []
+    errors = [0]
+    deadline = time.monotonic() + duration
+
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=30) as client:
+        async def connection(index):
+            counter = index
+            while time.monotonic() < deadline:
+                method, path, options = request_for(scenario, counter)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **options)
+                    if response.status_code >= 400:
+                        errors[0] += 1
+                except httpx.HTTPError:
+                    errors[0] += 1
+                latencies.append(time.perf_counter() - started)
+                counter += connections
+
+        await asyncio.gather(*[connection(i) for i in range(connections)])
+    return latencies, errors[0]
+
+def load_process(url, token, scenario, connections, duration):
+    return asyncio.run(drive(url, token, scenario, connections, duration))
+
+def server_command(args, workers):
+    if args.server == "gunicorn":
+        return ["gunicorn", "-c", "gunicorn.conf.py", args.app], {"WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{args.port}"}
+    return [sys.executable, "-m", "uvicorn", args.app, "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(workers), "--log-level", "warning"], {}
+
+def port_in_use(url):
+    try:
+        httpx.get(url + "/", timeout=1)
+        return True
+    except httpx.HTTPError:
+        return False
+
+def wait_until_ready(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(url + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+def seed(url, token):
+    # Um dia de leituras de 10 estações para as médias terem o que agregar
+    start = datetime.utcnow() - timedelta(hours=23)
+    readings = [{"equipmentId": f"STATION_{i % 10}", "timestamp": (start + timedelta(seconds=8 * i)).isoformat(),
+                 "value": float(i % 97)} for i in range(10000)]
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(0, len(readings), 5000):
+        httpx.post(url + "/sensors/batch", json=readings[i:i + 5000], headers=headers, timeout=60).raise_for_status()
+
+def run(args):
+    url = f"http://127.0.0.1:{args.port}"
+    token = create_access_token(data={"sub": "bench_user"})
+    env = {**os.environ, "SERVER_MODE": "production", "INGEST_BUFFER_ENABLED": "false", "CACHE_ENABLED": "false"}
+    if args.mongo_uri:
+        env["MONGO_URI"] = args.mongo_uri
+
+    results = []
+    for workers in args.workers:
+        if port_in_use(url):
+            raise RuntimeError(f"Something is already listening on {url}; pick another --port")
+        command, extra_env = server_command(args, workers)
+        process = subprocess.Popen(command, env={**env, **extra_env})
+        try:
+            wait_until_ready(url, process)
+            if not results and args.scenario == "average":
+                seed(url, token)
+            with multiprocessing.get_context("spawn").Pool(args.load_processes) as pool:
+                started = time.perf_counter()
+                outcomes = pool.starmap(load_process, [(url, token, args.scenario, args.connections, args.duration)] * args.load_processes)
+                elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+        latencies = [latency for outcome, _ in outcomes for latency in outcome]
+        result = {
+            "workers": workers,
+            "requests_per_second": round(len(latencies) / elapsed, 2),
+            "errors": sum(errors for _, errors in outcomes),
+            **{key: value for key, value in percentiles(latencies).items() if key in ("p50_ms", "p99_ms")},
+        }
+        baseline = results[0] if results else result
+        speedup = result["requests_per_second"] / baseline["requests_per_second"]
+        result["speedup"] = round(speedup, 2)
+        result["efficiency"] = round(speedup / (workers / baseline["workers"]), 2)
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    print(json.dumps({"scenario": args.scenario, "server": args.server, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=lambda value: [int(n) for n in value.split(",")],
+                        default=sorted({1, max(cores // 2, 1), cores}), help="Comma-separated worker counts")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="average")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn"),
+                        default="gunicorn" if shutil.which("gunicorn") else "uvicorn")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per worker count")
+    parser.add_argument("--load-processes", type=int, default=max(cores // 2, 1))
+    parser.add_argument("--connections", type=int, default=32, help="Connections per load process")
+    run(parser.parse_args())
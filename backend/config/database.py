@@ -1,6 +1,8 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
 from dotenv import load_dotenv
 import os
+from config import settings
 from logs.logger import get_logger
 
 logger = get_logger("RealtimeSensorDataAPI")
@@ -8,8 +10,116 @@ logger = get_logger("RealtimeSensorDataAPI")
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/sensor_data")
-client = AsyncIOMotorClient(MONGO_URI)
+
+def client_options() -> dict:
+    """Pool, timeouts and read/write concerns of the Motor client (`MONGO_*` settings)."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    optional = {
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "readConcernLevel": settings.MONGO_READ_CONCERN or None,
+    }
+    options.update({key: value for key, value in optional.items() if value is not None})
+    if settings.MONGO_WRITE_CONCERN:
+        w = settings.MONGO_WRITE_CONCERN
+        options["w"] = int(w) if w.isdigit() else w
+    if settings.MONGO_WRITE_JOURNAL:
+        options["journal"] = settings.MONGO_WRITE_JOURNAL in ("1", "true", "yes", "on")
+    return options
+
+# O Motor só abre conexões na primeira operação, já no event loop do worker: criar o
+# cliente na importação é seguro mesmo com o app pré-carregado antes do fork
+client = AsyncIOMotorClient(MONGO_URI, **client_options())
 db = client["sensor_data"]
 
+# Índices usados pelas consultas dos serviços: (coleção, chaves, opções)
+INDEXES = [
+    # _id desempata a paginação por (timestamp, _id) sem ordenação em memória
+    ("sensors", [("equipmentId", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], {}),
+    ("sensors", [("timestamp", ASCENDING)], {}),
+    # Ingestão idempotente: uma leitura por estação e instante (repetições viram duplicatas).
+    # Falha se já houver duplicatas: rode `python -m storage.mongo` antes. Obrigatório (REQUIRED_INDEXES)
+    ("sensors", [("equipmentId", ASCENDING), ("timestamp", ASCENDING)], {"unique": True}),
+    ("users", [("username", ASCENDING)], {"unique": True}),
+    ("sensor_aggregates", [("equipmentId", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], {"unique": True}),
+    ("sensor_aggregates", [("granularity", ASCENDING), ("bucket", ASCENDING)], {}),
+    # Layout em buckets por hora (STORAGE_BACKEND=buckets)
+    ("sensor_buckets", [("equipmentId", ASCENDING), ("start", ASCENDING)], {"unique": True}),
+    ("sensor_buckets", [("start", ASCENDING)], {}),
+    # Rollups por hora/dia das leituras além do horizonte de retenção
+    ("sensor_rollups", [("equipmentId", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], {"unique": True}),
+    ("sensor_rollups", [("granularity", ASCENDING), ("bucket", ASCENDING)], {}),
+]
+
+# Índices sem os quais o serviço não pode subir: a deduplicação da ingestão depende do único
+REQUIRED_INDEXES = [
+    ("sensors", [("equipmentId", ASCENDING), ("timestamp", ASCENDING)]),
+]
+
+# Índices não únicos de versões anteriores com as mesmas chaves (e nome) de um índice único
+# atual: `create_index` falharia com conflito de opções enquanto existirem
+LEGACY_INDEXES = [
+    ("sensors", [("equipmentId", ASCENDING), ("timestamp", ASCENDING)]),
+]
+
+# TTL opcional do arquivo e dos rollups (RETENTION_*_TTL_DAYS)
+if settings.RETENTION_ARCHIVE_TTL_DAYS:
+    INDEXES.append(("sensors_archive", [("timestamp", ASCENDING)],
+                    {"expireAfterSeconds": settings.RETENTION_ARCHIVE_TTL_DAYS * 86400}))
+if settings.RETENTION_ROLLUP_TTL_DAYS:
+    INDEXES.append(("sensor_rollups", [("bucket", ASCENDING)],
+                    {"expireAfterSeconds": settings.RETENTION_ROLLUP_TTL_DAYS * 86400}))
+
 def initialize_db():
-    logger.info(f"Connected to MongoDB at {MONGO_URI}")
\ No newline at end of file
+    logger.info(f"Connected to MongoDB at {MONGO_URI}")
+
+def close_db():
+    """Closes the pool of this process (on shutdown); the client reconnects if used again."""
+    client.close()
+    logger.info("MongoDB connections closed.")
+
+async def drop_legacy_indexes(database) -> int:
+    """
+    Drops the non-unique indexes of `LEGACY_INDEXES` left by previous versions.
+
+    Returns:
+    - int: Number of indexes dropped.
+    """
+    dropped = 0
+    for collection, keys in LEGACY_INDEXES:
+        for name, info in (await database[collection].index_information()).items():
+            if list(info["key"]) == keys and not info.get("unique"):
+                await database[collection].drop_index(name)
+                logger.info(f"Legacy index {collection}.{name} dropped.")
+                dropped += 1
+    return dropped
+
+async def ensure_indexes(database=None):
+    """
+    Creates the indexes required by the service queries.
+
+    `create_index` is a no-op for indexes that already exist, so this is safe to
+    run on every startup. Legacy indexes that conflict with the current ones are
+    dropped first. A failing index (e.g. duplicated usernames) is logged and does
+    not prevent the others from being created, unless it is in `REQUIRED_INDEXES`.
+
+    Raises:
+    - RuntimeError: If a required index cannot be created (e.g. repeated readings
+      stored before ingest was idempotent: run `python -m storage.mongo`).
+    """
+    database = db if database is None else database
+    await drop_legacy_indexes(database)
+    for collection, keys, options in INDEXES:
+        try:
+            name = await database[collection].create_index(keys, **options)
+            logger.info(f"Index {collection}.{name} ready.")
+        except Exception as e:
+            logger.error(f"Error creating index on {collection} {keys}: {e}")
+            if (collection, keys) in REQUIRED_INDEXES:
+                raise RuntimeError(f"Required index on {collection} {keys} could not be created: {e}") from e
@@ -0,0 +1,158 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def _get_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+def _get_optional_int(name: str):
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+def _query_budget(name: str, max_time_ms: int, allow_disk_use: bool) -> dict:
+    prefix = f"QUERY_{name.upper()}_"
+    return {
+        "max_time_ms": int(os.getenv(prefix + "MAX_TIME_MS", str(max_time_ms))),
+        "allow_disk_use": _get_bool(prefix + "ALLOW_DISK_USE", allow_disk_use),
+    }
+
+# Pool e garantias do cliente Motor (vazio = padrão do PyMongo). Cada worker tem o seu
+# pool: o total de conexões é workers × MONGO_MAX_POOL_SIZE
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = _get_optional_int("MONGO_MAX_IDLE_TIME_MS")
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_SOCKET_TIMEOUT_MS = _get_optional_int("MONGO_SOCKET_TIMEOUT_MS")
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _get_optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+# Write concern ("1", "majority", ...), journal e read concern ("local", "majority", ...)
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "").strip()
+MONGO_WRITE_JOURNAL = os.getenv("MONGO_WRITE_JOURNAL", "").strip().lower()
+MONGO_READ_CONCERN = os.getenv("MONGO_READ_CONCERN", "").strip()
+# Leituras analíticas (médias, dados das estações, estatísticas, páginas e exportação):
+# read preference ("primary", "primaryPreferred", "secondary", "secondaryPreferred" ou
+# "nearest") e defasagem máxima aceita de um secundário (-1 = sem limite; mínimo 90).
+# As gravações vão sempre para o primário
+ANALYTICS_READ_PREFERENCE = os.getenv("ANALYTICS_READ_PREFERENCE", "primary").strip()
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "-1"))
+# Orçamento de cada tipo de consulta: QUERY_<TIPO>_MAX_TIME_MS (0 = sem limite) e
+# QUERY_<TIPO>_ALLOW_DISK_USE. A consulta que estoura o tempo responde 503
+QUERY_BUDGETS = {
+    "average": _query_budget("average", 10000, False),
+    "averages": _query_budget("averages", 30000, True),
+    "station_data": _query_budget("station_data", 15000, True),
+    "page": _query_budget("page", 5000, False),
+    "export": _query_budget("export", 0, False),
+}
+
+# Buffer de ingestão (write-behind) para POST /sensors/data
+INGEST_BUFFER_ENABLED = _get_bool("INGEST_BUFFER_ENABLED", False)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "50"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "20000"))
+INGEST_ENQUEUE_TIMEOUT_MS = int(os.getenv("INGEST_ENQUEUE_TIMEOUT_MS", "1000"))
+# "enqueue": responde assim que a leitura entra na fila.
+# "flush": responde somente depois que o insert_many foi confirmado pelo MongoDB.
+INGEST_ACK_MODE = os.getenv("INGEST_ACK_MODE", "flush").strip().lower()
+# Janela de reordenação: leituras mais antigas que a mais nova da estação menos
+# esta janela são recusadas como atrasadas (0 desliga, p.ex. para backfill)
+INGEST_REORDER_WINDOW_SECONDS = float(os.getenv("INGEST_REORDER_WINDOW_SECONDS", "0"))
+
+# Write-ahead log local para POST /sensors/data: a leitura é confirmada ao entrar no
+# log e gravada no banco em segundo plano (o buffer de ingestão deixa de ser usado)
+WAL_ENABLED = _get_bool("WAL_ENABLED", False)
+WAL_DIR = os.getenv("WAL_DIR", "spool/wal")
+WAL_SEGMENT_BYTES = int(os.getenv("WAL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+WAL_MAX_BYTES = int(os.getenv("WAL_MAX_BYTES", str(1024 * 1024 * 1024)))
+# "always": fsync antes de confirmar (em grupo); "interval": a cada WAL_FSYNC_INTERVAL_MS; "off": nunca
+WAL_FSYNC = os.getenv("WAL_FSYNC", "always").strip().lower()
+WAL_FSYNC_INTERVAL_MS = int(os.getenv("WAL_FSYNC_INTERVAL_MS", "100"))
+WAL_GROUP_COMMIT_MS = int(os.getenv("WAL_GROUP_COMMIT_MS", "0"))
+WAL_DRAIN_BATCH_SIZE = int(os.getenv("WAL_DRAIN_BATCH_SIZE", "5000"))
+WAL_DRAIN_INTERVAL_MS = int(os.getenv("WAL_DRAIN_INTERVAL_MS", "100"))
+
+# Buckets pré-agregados (count/sum/min/max por minuto e por hora) por equipmentId
+AGGREGATES_ENABLED = _get_bool("AGGREGATES_ENABLED", False)
+
+# POST /sensors/batch: limites por requisição
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Upload de CSV em streaming
+CSV_READ_CHUNK_SIZE = int(os.getenv("CSV_READ_CHUNK_SIZE", str(1024 * 1024)))
+CSV_BATCH_SIZE = int(os.getenv("CSV_BATCH_SIZE", "5000"))
+CSV_MAX_REPORTED_ERRORS = int(os.getenv("CSV_MAX_REPORTED_ERRORS", "100"))
+# Decodificação: "columnar" (blocos inteiros em arrays NumPy) ou "rows" (linha a linha)
+CSV_PARSER = os.getenv("CSV_PARSER", "columnar").strip().lower()
+# Processos que dividem cada bloco lido entre si (0 = uma thread do próprio worker);
+# compensa com blocos de vários MB (CSV_READ_CHUNK_SIZE)
+CSV_PARSE_PROCESSES = int(os.getenv("CSV_PARSE_PROCESSES", "0"))
+
+# Importação de CSV em segundo plano
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR", "spool/imports")
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+# Por quanto tempo o status de um job encerrado continua consultável
+IMPORT_JOB_RETENTION_HOURS = float(os.getenv("IMPORT_JOB_RETENTION_HOURS", "24"))
+
+# Push em tempo real (WebSocket/SSE): tamanho da fila de cada assinante
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "15"))
+# Origem dos eventos: "local" (leituras gravadas por este processo) ou "change_stream"
+# (change stream de `sensors`: leituras de todos os workers; exige replica set)
+REALTIME_FEED = os.getenv("REALTIME_FEED", "local").strip().lower()
+
+# Regras de alerta avaliadas a cada leitura publicada (arquivo JSON; vazio = sem alertas)
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+ALERT_HISTORY_SIZE = int(os.getenv("ALERT_HISTORY_SIZE", "1000"))
+
+# Downsampling de GET /sensors/{equipmentId}/data (resolution/max_points)
+DOWNSAMPLE_MAX_POINTS = int(os.getenv("DOWNSAMPLE_MAX_POINTS", "5000"))
+DOWNSAMPLE_FETCH_BATCH_SIZE = int(os.getenv("DOWNSAMPLE_FETCH_BATCH_SIZE", "10000"))
+
+# Paginação por cursor e exportação em streaming dos valores brutos
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "1000"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "10000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# Média de todas as estações em faixas de equipmentId consultadas em paralelo;
+# cada faixa em andamento ocupa uma conexão do pool do Mongo
+AVERAGES_PARTITIONS = int(os.getenv("AVERAGES_PARTITIONS", "8"))
+AVERAGES_CONCURRENCY = int(os.getenv("AVERAGES_CONCURRENCY", "4"))
+
+# Cache das respostas de /sensors/average, /sensors/averages e /sensors/{equipmentId}/data
+CACHE_ENABLED = _get_bool("CACHE_ENABLED", True)
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "5"))
+# /sensors/averages não é invalidado pela ingestão: fica até este tempo desatualizado
+CACHE_ALL_STATIONS_TTL_SECONDS = float(os.getenv("CACHE_ALL_STATIONS_TTL_SECONDS", "5"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Memória compartilhada com as gerações do cache entre workers (definida pelo gunicorn.conf.py);
+# vazio = invalidação só no próprio processo
+CACHE_SHARED_MEMORY = os.getenv("CACHE_SHARED_MEMORY", "").strip()
+
+# Autenticação: payloads de JWT já verificados em cache e pool do bcrypt
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Padrão: metade dos núcleos, deixando CPU para o event loop durante rajadas de login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Retenção: leituras com mais de RETENTION_RAW_DAYS dias viram rollups por hora/dia
+# e saem de `sensors` em lotes ("delete" apaga, "archive" move para sensors_archive)
+RETENTION_ENABLED = _get_bool("RETENTION_ENABLED", False)
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "90"))
+RETENTION_MODE = os.getenv("RETENTION_MODE", "delete").strip().lower()
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_BATCH_PAUSE_MS = int(os.getenv("RETENTION_BATCH_PAUSE_MS", "200"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+# Índices TTL opcionais (0 desativa), contados a partir da data da leitura/do bucket
+RETENTION_ARCHIVE_TTL_DAYS = int(os.getenv("RETENTION_ARCHIVE_TTL_DAYS", "0"))
+RETENTION_ROLLUP_TTL_DAYS = int(os.getenv("RETENTION_ROLLUP_TTL_DAYS", "0"))
+
+# Métricas no formato Prometheus em GET /metrics (latência por rota e por operação de storage)
+METRICS_ENABLED = _get_bool("METRICS_ENABLED", True)
+METRICS_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+# Armazenamento das leituras: "mongo" (um documento por leitura), "buckets" (um documento
+# por estação e hora) ou "columnar" (segmentos locais)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").strip().lower()
+COLUMNAR_DATA_DIR = os.getenv("COLUMNAR_DATA_DIR", "data/columnar")
@@ -0,0 +1,38 @@
+# Modo de produção: `gunicorn -c gunicorn.conf.py main:app` (SERVER_MODE=production no start.sh)
+import os
+from config import settings
+from utils.cache import SharedGenerations
+
+def _available_cores() -> int:
+    # Respeita a afinidade de CPU do contêiner/processo, não só os núcleos da máquina
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = os.getenv("BIND", f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', '8000')}")
+# Um worker por núcleo: cada um é um event loop, o I/O com o MongoDB já é assíncrono
+workers = int(os.getenv("WEB_CONCURRENCY", str(_available_cores())))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Tempo para o flush do buffer de ingestão e o fechamento das conexões no desligamento
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+accesslog = os.getenv("ACCESS_LOG") or None
+
+_cache_generations = None
+
+def on_starting(server):
+    """Creates the shared cache generations before the workers fork (they inherit the name)."""
+    global _cache_generations
+    if settings.STORAGE_BACKEND == "columnar" and server.cfg.workers > 1:
+        server.log.warning("STORAGE_BACKEND=columnar supports a single writer process: use WEB_CONCURRENCY=1.")
+    name = settings.CACHE_SHARED_MEMORY or f"sensor_api_cache_{os.getpid()}"
+    # `settings` já foi importado aqui: os workers herdam o módulo no fork, não relêem o ambiente
+    settings.CACHE_SHARED_MEMORY = os.environ["CACHE_SHARED_MEMORY"] = name
+    _cache_generations = SharedGenerations(name)
+    server.log.info(f"Response cache generations shared through {name}.")
+
+def on_exit(server):
+    if _cache_generations is not None:
+        _cache_generations.unlink()
@@ -1,10 +1,16 @@
 from fastapi import FastAPI, Depends
 from middlewares.auth_middleware import get_current_user
 from fastapi.middleware.cors import CORSMiddleware
-from config.database import initialize_db
-from routers.sensors import router as sensors_router
+from config.database import initialize_db, ensure_indexes, close_db
+from routers.sensors import router as sensors_router, ws_router as sensors_ws_router
 from routers.auth import auth_router as auth_router
+from routers.metrics import metrics_router
+from middlewares.metrics_middleware import MetricsMiddleware
+from utils import metrics
 from logs.logger import get_logger
+from config import settings
+from services.sensors_service import csv_pool, ingest_buffer, realtime_feed, retention_scheduler, wal
+from services.import_jobs import import_jobs
 
 logger = get_logger("RealtimeSensorDataAPI")
 
@@ -38,13 +44,100 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth_router)
 app.include_router(sensors_router, dependencies=[Depends(get_current_user)])
+app.include_router(sensors_ws_router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router)
 logger.info("Routes added.")
 
 initialize_db()
 logger.info("MongoDB initialized.")
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+    logger.info("MongoDB indexes ensured.")
+
+@app.on_event("startup")
+async def resume_import_jobs():
+    await import_jobs.resume_pending()
+
+@app.on_event("startup")
+async def start_wal():
+    # Também replaya o que ficou no log da execução anterior
+    if settings.WAL_ENABLED:
+        wal.start()
+        logger.info("Write-ahead log started.")
+
+loop_lag_monitor = metrics.LoopLagMonitor(
+    metrics.histogram("event_loop_lag_seconds", "How late the event loop wakes up from a timed sleep."),
+    interval=settings.METRICS_LOOP_LAG_INTERVAL_SECONDS,
+)
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    if settings.METRICS_ENABLED:
+        loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_loop_lag_monitor():
+    await loop_lag_monitor.stop()
+
+@app.on_event("startup")
+async def start_retention():
+    if not settings.RETENTION_ENABLED:
+        return
+    # A retenção trabalha sobre a coleção `sensors` do backend Mongo
+    if settings.STORAGE_BACKEND != "mongo":
+        logger.warning(f"Retention is only supported with STORAGE_BACKEND=mongo, not {settings.STORAGE_BACKEND}.")
+        return
+    retention_scheduler.start()
+    logger.info("Retention scheduler started.")
+
+@app.on_event("shutdown")
+async def stop_retention():
+    await retention_scheduler.stop()
+
+@app.on_event("startup")
+async def start_realtime_feed():
+    if settings.REALTIME_FEED != "change_stream":
+        return
+    # Nos outros backends as leituras não são inserções em `sensors`
+    if settings.STORAGE_BACKEND != "mongo":
+        logger.warning(f"REALTIME_FEED=change_stream requires STORAGE_BACKEND=mongo, not {settings.STORAGE_BACKEND}.")
+        return
+    realtime_feed.start()
+    logger.info("Realtime hub fed by the sensors change stream.")
+
+@app.on_event("shutdown")
+async def stop_realtime_feed():
+    await realtime_feed.stop()
+
+@app.on_event("shutdown")
+async def stop_import_jobs():
+    await import_jobs.stop()
+    if csv_pool is not None:
+        csv_pool.shutdown(cancel_futures=True)
+
+@app.on_event("shutdown")
+async def flush_ingest_buffer():
+    await ingest_buffer.stop()
+    logger.info("Ingest buffer flushed.")
+
+@app.on_event("shutdown")
+async def stop_wal():
+    # O que não foi replayado fica no log para a próxima execução
+    await wal.stop()
+
+@app.on_event("shutdown")
+async def close_database():
+    # Por último: o flush do buffer ainda grava no banco
+    close_db()
+
 @app.get("/", summary="API Root")
 async def root():
     logger.info("Root endpoint accessed.")
@@ -0,0 +1,48 @@
+import time
+from utils import metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")
+)
+REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")
+)
+IN_FLIGHT = metrics.gauge("http_requests_in_flight", "HTTP requests being handled.")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status of every HTTP request.
+
+    Requests are labeled with the route template (e.g. `/sensors/{equipmentId}/data`)
+    matched by the router, never the raw path, so the number of series stays
+    bounded; unmatched paths share the "unmatched" label. Plain ASGI instead of
+    `BaseHTTPMiddleware`, which would add a task and a stream per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        IN_FLIGHT.labels().inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.labels().dec()
+            # O roteador grava a rota encontrada no scope compartilhado
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+            REQUESTS.labels(method, route, str(status_code)).inc()
@@ -1,11 +1,30 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import List, Optional
 
 class SensorData(BaseModel):
     equipmentId: str
     timestamp: datetime
     value: float
 
-class CSVUploadResponse(BaseModel):
-    message: str
-    inserted_count: int
\ No newline at end of file
+class CSVRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportJobStatus(BaseModel):
+    job_id: str
+    status: str
+    filename: Optional[str]
+    rows_parsed: int
+    inserted_count: int
+    duplicate_count: int = 0
+    rejected_count: int
+    errors: List[CSVRowError] = []
+    error: Optional[str]
+    bytes_processed: int
+    total_bytes: int
+    rows_per_second: Optional[float]
+    eta_seconds: Optional[float]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
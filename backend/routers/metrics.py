@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from utils.metrics import CONTENT_TYPE, REGISTRY
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+@metrics_router.get("/metrics", summary="Prometheus Metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Exports request and storage latency histograms, ingest counters, queue
+    depths and event-loop lag of this worker in the Prometheus text format.
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -1,14 +1,33 @@
-from fastapi import APIRouter, Query, UploadFile, File, status
+import asyncio
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File, WebSocket, status
+from fastapi.responses import StreamingResponse
+from config import settings
 from services.sensors_service import (
     insert_sensor_data,
-    process_csv_upload,
+    insert_sensor_batch,
     calculate_average,
     get_average_all_stations,
-    get_station_data
+    stream_average_all_stations,
+    get_station_data,
+    query_statistics,
+    DEFAULT_QUERY_STATS,
+    get_station_page,
+    export_station_data,
+    realtime_hub,
+    alert_engine,
+    response_cache,
+    retention_scheduler,
+    wal
 )
-from models.sensor_data import SensorData
+from services.import_jobs import import_jobs
+from models.sensor_data import SensorData, ImportJobStatus
+from utils.auth import decode_access_token
 
 router = APIRouter(prefix="/sensors", tags=["Sensors"])
+# WebSockets não passam pelo OAuth2PasswordBearer: o token vai na query string
+ws_router = APIRouter(prefix="/sensors", tags=["Sensors"])
 
 @router.post("/data", status_code=status.HTTP_201_CREATED, summary="Insert Sensor Data", description="Insert individual sensor data into the database.")
 async def create_sensor_data(sensor: SensorData):
@@ -18,20 +37,59 @@ async def create_sensor_data(sensor: SensorData):
     - **equipmentId**: Unique identifier of the equipment.
     - **timestamp**: Date and time of the event (including timezone).
     - **value**: Sensor value with precision up to two decimal places.
+
+    Re-sending a reading (same equipmentId and timestamp) does not store it twice.
     """
     return await insert_sensor_data(sensor)
 
-@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, summary="Upload Sensor Data CSV", description="Uploads a CSV file containing sensor data for batch insertion.")
+@router.post("/batch", summary="Insert a Batch of Sensor Data", description="Inserts many readings in one request (JSON array, NDJSON, msgpack or fixed-width binary).")
+async def create_sensor_batch(request: Request):
+    """
+    Inserts a batch of readings with a single bulk write.
+
+    - **application/json**: array of `{"equipmentId", "timestamp", "value"}` objects (or `[equipmentId, timestamp, value]` arrays).
+    - **application/x-ndjson**: one object per line.
+    - **application/msgpack**: msgpack array of the same objects or arrays.
+    - **application/octet-stream**: 32-byte little-endian records: equipmentId (16 bytes, NUL-padded UTF-8),
+      timestamp (int64, epoch milliseconds UTC), value (float64).
+
+    Timestamps are ISO 8601 strings or epoch milliseconds. The response has one result per item, in order;
+    invalid items are rejected without failing the others, and readings already stored are reported as duplicates.
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > settings.BATCH_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch body is larger than {settings.BATCH_MAX_BYTES} bytes."
+            )
+    return await insert_sensor_batch(bytes(body), request.headers.get("content-type"))
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, response_model=ImportJobStatus, summary="Upload Sensor Data CSV", description="Uploads a CSV file containing sensor data for batch insertion.")
 async def upload_csv(file: UploadFile = File(...)):
     """
-    Processes and inserts sensor data from a CSV file.
+    Queues the import of sensor data from a CSV file.
 
     - The CSV must contain the following fields: `equipmentId`, `timestamp`, `value`.
+    - The file is stored and imported in the background; the response carries the `job_id`
+      to follow at `GET /sensors/upload/{job_id}`.
+    - Invalid rows are skipped and reported by line number.
     """
-    return await process_csv_upload(file)
+    return await import_jobs.submit(file)
+
+@router.get("/upload/{job_id}", response_model=ImportJobStatus, summary="Get CSV Import Status")
+async def get_upload_status(job_id: str):
+    """
+    Returns the progress of a CSV import: rows parsed, inserted and rejected, throughput and ETA.
+    """
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found.")
+    return job
 
 @router.get("/average", status_code=status.HTTP_200_OK, summary="Calculate Sensor Data Average", description="Calculates the average values of a sensor over a specific period.")
-async def get_average(equipmentId: str, period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m)")):
+async def get_average(equipmentId: str, period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m, 1y or a duration such as 36h)")):
     """
     Calculates the average values of a sensor over a defined period.
 
@@ -41,19 +99,191 @@ async def get_average(equipmentId: str, period: str = Query("24h", description="
     return await calculate_average(equipmentId, period)
 
 @router.get("/averages", summary="Get Average Data for All Stations")
-async def fetch_average_all_stations(period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m)")):
+async def fetch_average_all_stations(
+    period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m, 1y or a duration such as 36h)"),
+    top_k: Optional[int] = Query(None, ge=1, description="Only the stations with the highest averages"),
+    min_average: Optional[float] = Query(None, description="Only stations whose average is at least this"),
+    max_average: Optional[float] = Query(None, description="Only stations whose average is at most this"),
+    format: str = Query("json", description="Output format (json, ndjson)")
+):
     """
     Returns the average data of all stations for the specified time interval.
+
+    - **top_k**: The `top_k` stations with the highest averages, highest first.
+    - **min_average** / **max_average**: Only stations whose average is within these bounds.
+    - **format=ndjson**: One station per line, streamed as each range of stations is computed.
+    """
+    if format == "ndjson":
+        chunks = stream_average_all_stations(period, top_k, min_average, max_average)
+        return StreamingResponse(chunks, media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid format. Use 'json' or 'ndjson'.")
+    return await get_average_all_stations(period, top_k, min_average, max_average)
+
+@router.get("/cache/stats", summary="Get Response Cache Statistics")
+async def get_cache_stats():
+    """
+    Returns hit/miss counters, size and evictions of this worker's response cache.
+    """
+    return response_cache.stats()
+
+@router.get("/retention/status", summary="Get Retention Status")
+async def get_retention_status():
+    """
+    Returns the retention settings, this worker's run counters and the lag of the
+    oldest raw reading behind the retention horizon.
+    """
+    return await retention_scheduler.status()
+
+@router.get("/wal/status", summary="Get Write-Ahead Log Status")
+async def get_wal_status():
     """
-    return await get_average_all_stations(period)
+    Returns this worker's write-ahead log settings, append/replay counters, last
+    replay throughput and the replay lag (bytes and age of the oldest reading not
+    yet in the database).
+    """
+    return wal.status()
+
+def _event_stream(subscription, unsubscribe) -> StreamingResponse:
+    """Server-Sent Events response of a hub subscription, with keep-alive comments while idle."""
+    async def events():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.next_message(), settings.REALTIME_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                for line in message.split("\n"):
+                    yield f"data: {line}\n\n"
+        finally:
+            unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/alerts", summary="Get Alerts")
+async def get_alerts(
+    equipmentId: Optional[str] = Query(None, description="Station to report; all stations when omitted"),
+    limit: int = Query(100, ge=1, le=settings.ALERT_HISTORY_SIZE, description="Number of recent events")
+):
+    """
+    Returns the alert rules, the alerts firing now and the latest firing/resolved events (newest first).
+
+    - Rules are evaluated on every stored reading of this worker's realtime feed (`ALERT_RULES_FILE`).
+    """
+    return {
+        "rules": [rule.describe() for rule in alert_engine.rules],
+        "active": alert_engine.active(equipmentId),
+        "events": alert_engine.events(equipmentId, limit),
+    }
+
+@router.get("/alerts/stream", summary="Stream Alert Events (SSE)")
+async def stream_alerts(equipmentId: Optional[str] = Query(None, description="Station to follow; all stations when omitted")):
+    """
+    Server-Sent Events stream of alert events as rules fire and resolve.
+
+    - Slow clients lose the oldest events; a `dropped` event reports how many.
+    """
+    return _event_stream(alert_engine.subscribe(equipmentId), alert_engine.unsubscribe)
+
+@router.get("/query", summary="Query Statistics for a Time Range")
+async def query_sensor_statistics(
+    equipmentId: str,
+    start: Optional[datetime] = Query(None, description="Start of the range (ISO 8601)"),
+    end: Optional[datetime] = Query(None, description="End of the range (ISO 8601, default: now)"),
+    duration: Optional[str] = Query(None, description="Range ending at end when start is omitted (e.g. 36h, 90d, 1w)"),
+    group_by: Optional[str] = Query(None, description="Interval of each group (e.g. 15min, 1h, 1d); one group when omitted"),
+    stats: str = Query(DEFAULT_QUERY_STATS, description="Comma-separated statistics: count, mean, min, max, stddev, pNN")
+):
+    """
+    Returns count, mean, min, max, standard deviation and percentiles of a station
+    over `[start, end)`, per `group_by` interval.
+
+    - Percentiles (e.g. **p50**, **p99**) are estimated within 1% of the exact value.
+    """
+    return await query_statistics(equipmentId, start, end, duration, group_by, stats)
 
 @router.get("/{equipmentId}/data", summary="Get Data for a Station")
 async def fetch_station_data(
     equipmentId: str,
-    period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m)")
+    period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m, 1y or a duration such as 36h)"),
+    resolution: Optional[str] = Query(None, description="Bucket width for downsampling (e.g. 30s, 5min, 1h, 1d)"),
+    max_points: Optional[int] = Query(None, ge=3, le=settings.DOWNSAMPLE_MAX_POINTS, description="Maximum number of points returned"),
+    method: str = Query("buckets", description="Downsampling method (buckets, lttb)")
 ):
     """
     Returns the collected values and the average of a station for the specified interval.
+
+    - Without **resolution** and **max_points**, every raw value is returned.
+    - **method=buckets**: fixed intervals with `value` (average), `min`, `max` and `count`.
+    - **method=lttb**: at most `max_points` raw points chosen to preserve the shape of the series.
     """
-    return await get_station_data(equipmentId, period)
+    return await get_station_data(equipmentId, period, resolution, max_points, method)
+
+@router.get("/{equipmentId}/values", summary="Get Raw Data for a Station (Paginated)")
+async def fetch_station_page(
+    equipmentId: str,
+    period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m, 1y or a duration such as 36h)"),
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT, description="Page size"),
+    cursor: Optional[str] = Query(None, description="`next_cursor` of the previous page")
+):
+    """
+    Returns one page of the raw values of a station, oldest first.
+
+    - Pass the `next_cursor` of a response as **cursor** to get the next page; it is `null` on the last page.
+    """
+    return await get_station_page(equipmentId, period, limit, cursor)
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+@router.get("/{equipmentId}/export", summary="Export Raw Data for a Station")
+async def export_station(
+    equipmentId: str,
+    period: str = Query("24h", description="Time interval (24h, 48h, 1w, 1m, 1y or a duration such as 36h)"),
+    format: str = Query("ndjson", description="Output format (ndjson, json)")
+):
+    """
+    Streams every raw value of a station in the period, oldest first, as NDJSON or a JSON array.
+    """
+    chunks = export_station_data(equipmentId, period, format)
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[format])
+
+@router.get("/stream", summary="Stream New Readings (SSE)")
+async def stream_readings(equipmentId: Optional[str] = Query(None, description="Station to follow; all stations when omitted")):
+    """
+    Server-Sent Events stream of newly stored readings and the station's rolling 24h average.
+
+    - **equipmentId**: Station to follow. When omitted, readings of every station are sent.
+    - Slow clients lose the oldest events; a `dropped` event reports how many.
+    """
+    return _event_stream(realtime_hub.subscribe(equipmentId), realtime_hub.unsubscribe)
+
+@ws_router.websocket("/ws")
+async def websocket_readings(websocket: WebSocket, token: str, equipmentId: Optional[str] = None):
+    """
+    WebSocket stream of newly stored readings (same events as `/sensors/stream`).
+
+    - **token**: Access token from `/auth/login`.
+    - **equipmentId**: Station to follow. When omitted, readings of every station are sent.
+    """
+    if decode_access_token(token) is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    subscription = realtime_hub.subscribe(equipmentId)
+
+    async def push():
+        while True:
+            message = await subscription.next_message()
+            for line in message.split("\n"):
+                await websocket.send_text(line)
 
+    # O envio roda em outra task para que a desconexão seja percebida mesmo sem novas leituras
+    sender = asyncio.create_task(push())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        realtime_hub.unsubscribe(subscription)
@@ -0,0 +1,246 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from pymongo import UpdateOne
+import logging
+
+logger = logging.getLogger("SensorDataAPI")
+
+COLLECTION = "sensor_aggregates"
+STATE_COLLECTION = "sensor_aggregates_state"
+MINUTE = "minute"
+HOUR = "hour"
+GRANULARITIES = {
+    MINUTE: timedelta(minutes=1),
+    HOUR: timedelta(hours=1),
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+def to_utc_naive(ts: datetime) -> datetime:
+    """Normalizes a timestamp to naive UTC, the form MongoDB returns dates in."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def floor_time(ts: datetime, granularity: str) -> datetime:
+    step = GRANULARITIES[granularity]
+    return _EPOCH + ((to_utc_naive(ts) - _EPOCH) // step) * step
+
+def ceil_time(ts: datetime, granularity: str) -> datetime:
+    floored = floor_time(ts, granularity)
+    return floored if floored == to_utc_naive(ts) else floored + GRANULARITIES[granularity]
+
+def empty_summary() -> dict:
+    return {"count": 0, "sum": 0.0, "min": None, "max": None}
+
+def merge_summary(target: dict, other: dict) -> dict:
+    """Merges the count/sum/min/max of `other` into `target` in place."""
+    if not other or not other.get("count"):
+        return target
+    target["count"] += other["count"]
+    target["sum"] += other["sum"]
+    target["min"] = other["min"] if target["min"] is None else min(target["min"], other["min"])
+    target["max"] = other["max"] if target["max"] is None else max(target["max"], other["max"])
+    return target
+
+def average(summary: dict):
+    return summary["sum"] / summary["count"] if summary["count"] else None
+
+async def record_readings(database, docs, collection: str = COLLECTION):
+    """
+    Adds readings to the per-minute and per-hour buckets of their station.
+
+    Readings are first combined per bucket in memory, so a batch costs one upsert
+    per touched bucket instead of one per reading.
+
+    Parameters:
+    - database: Motor database holding the aggregate collection.
+    - docs (list[dict]): Readings with `equipmentId`, `timestamp` and `value`.
+    - collection (str): Bucket collection to update (used by `rebuild`).
+    """
+    combined = {}
+    for doc in docs:
+        value = float(doc["value"])
+        for granularity in GRANULARITIES:
+            key = (doc["equipmentId"], granularity, floor_time(doc["timestamp"], granularity))
+            merge_summary(combined.setdefault(key, empty_summary()),
+                          {"count": 1, "sum": value, "min": value, "max": value})
+
+    if not combined:
+        return
+
+    operations = [
+        UpdateOne(
+            {"equipmentId": equipment_id, "granularity": granularity, "bucket": bucket},
+            {
+                "$inc": {"count": summary["count"], "sum": summary["sum"]},
+                "$min": {"min": summary["min"]},
+                "$max": {"max": summary["max"]},
+            },
+            upsert=True,
+        )
+        for (equipment_id, granularity, bucket), summary in combined.items()
+    ]
+    await database[collection].bulk_write(operations, ordered=False)
+
+def _window_parts(start: datetime):
+    """
+    Splits the window `[start, +inf)` into the parts served by each source.
+
+    Returns:
+    - tuple: (raw_end, minute_end). Raw readings cover `[start, raw_end)`, minute
+      buckets cover `[raw_end, minute_end)` and hour buckets cover `[minute_end, +inf)`.
+    """
+    return ceil_time(start, MINUTE), ceil_time(start, HOUR)
+
+def _bucket_match(raw_end: datetime, minute_end: datetime):
+    return {"$or": [
+        {"granularity": MINUTE, "bucket": {"$gte": raw_end, "$lt": minute_end}},
+        {"granularity": HOUR, "bucket": {"$gte": minute_end}},
+    ]}
+
+def summary_group(key):
+    """`$group` stage computing count/sum/min/max of raw readings per `key`."""
+    return {"$group": {
+        "_id": key,
+        "count": {"$sum": 1},
+        "sum": {"$sum": "$value"},
+        "min": {"$min": "$value"},
+        "max": {"$max": "$value"},
+    }}
+
+def bucket_group(key):
+    return {"$group": {
+        "_id": key,
+        "count": {"$sum": "$count"},
+        "sum": {"$sum": "$sum"},
+        "min": {"$min": "$min"},
+        "max": {"$max": "$max"},
+    }}
+
+def to_summary(doc) -> dict:
+    return {"count": doc["count"], "sum": float(doc["sum"]), "min": doc["min"], "max": doc["max"]}
+
+async def summarize(database, equipmentId: str, start: datetime) -> dict:
+    """
+    Returns count/sum/min/max of a station's readings with `timestamp >= start`.
+
+    Whole minutes and hours are read from the bucket collection; only the
+    readings before the first minute boundary are read from `sensors`, so the
+    result is exact while touching at most a few hundred bucket documents.
+    """
+    raw_end, minute_end = _window_parts(start)
+    summary = empty_summary()
+
+    raw_pipeline = [
+        {"$match": {"equipmentId": equipmentId, "timestamp": {"$gte": start, "$lt": raw_end}}},
+        summary_group(None),
+    ]
+    async for doc in database["sensors"].aggregate(raw_pipeline):
+        merge_summary(summary, to_summary(doc))
+
+    bucket_pipeline = [
+        {"$match": {"equipmentId": equipmentId, **_bucket_match(raw_end, minute_end)}},
+        bucket_group(None),
+    ]
+    async for doc in database[COLLECTION].aggregate(bucket_pipeline):
+        merge_summary(summary, to_summary(doc))
+
+    return summary
+
+async def summarize_all(database, start: datetime, stations: Optional[dict] = None) -> dict:
+    """
+    Returns `{equipmentId: summary}` for every station with readings since `start`.
+
+    Uses the same raw/minute/hour split as `summarize`. `stations` is an
+    optional filter on `equipmentId` (e.g. one range of the stations).
+    """
+    raw_end, minute_end = _window_parts(start)
+    stations = stations or {}
+    summaries = {}
+
+    raw_pipeline = [
+        {"$match": {**stations, "timestamp": {"$gte": start, "$lt": raw_end}}},
+        summary_group("$equipmentId"),
+    ]
+    async for doc in database["sensors"].aggregate(raw_pipeline):
+        merge_summary(summaries.setdefault(doc["_id"], empty_summary()), to_summary(doc))
+
+    bucket_pipeline = [
+        {"$match": {**stations, **_bucket_match(raw_end, minute_end)}},
+        bucket_group("$equipmentId"),
+    ]
+    async for doc in database[COLLECTION].aggregate(bucket_pipeline):
+        merge_summary(summaries.setdefault(doc["_id"], empty_summary()), to_summary(doc))
+
+    return summaries
+
+async def mark_stale(database, reason: str):
+    """
+    Flags the bucket collection as out of sync with `sensors`.
+
+    Set when a bucket update fails after its readings were stored; the flag is
+    cleared by `rebuild`.
+    """
+    try:
+        await database[STATE_COLLECTION].update_one(
+            {"_id": COLLECTION},
+            {"$set": {"stale": True, "reason": reason, "since": datetime.utcnow()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"Error flagging sensor aggregates as stale: {e}")
+
+async def is_stale(database) -> bool:
+    state = await database[STATE_COLLECTION].find_one({"_id": COLLECTION})
+    return bool(state and state.get("stale"))
+
+async def rebuild(database, batch_size: int = 10000):
+    """
+    Rebuilds the bucket collection from the raw `sensors` collection.
+
+    Required once before enabling `AGGREGATES_ENABLED` on a database that
+    already holds readings, and whenever `is_stale` reports a failed bucket update.
+
+    The buckets are built in a temporary collection that replaces the live one at
+    the end, so readers never see a partial result. Ingest must be stopped while
+    it runs: readings written during the rebuild may be missing from the result.
+    """
+    from config.database import INDEXES
+
+    target = database[f"{COLLECTION}_rebuild"]
+    await target.drop()
+    # O rename substitui a coleção inteira, inclusive os índices
+    for collection, keys, options in INDEXES:
+        if collection == COLLECTION:
+            await target.create_index(keys, **options)
+    batch = []
+    total = 0
+    cursor = database["sensors"].find({}, {"_id": 0, "equipmentId": 1, "timestamp": 1, "value": 1},
+                                      batch_size=batch_size)
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await record_readings(database, batch, collection=target.name)
+            total += len(batch)
+            batch = []
+    if batch:
+        await record_readings(database, batch, collection=target.name)
+        total += len(batch)
+
+    if total:
+        await target.rename(COLLECTION, dropTarget=True)
+    else:
+        await database[COLLECTION].drop()
+    await database[STATE_COLLECTION].delete_one({"_id": COLLECTION})
+    logger.info(f"Rebuilt sensor aggregates from {total} readings.")
+    return total
+
+async def _main():
+    from config.database import db
+    await rebuild(db)
+
+if __name__ == "__main__":
+    # Uso (com a ingestão parada): python -m services.aggregates
+    import asyncio
+    asyncio.run(_main())
@@ -0,0 +1,322 @@
+import json
+import logging
+import math
+from array import array
+from collections import deque
+from typing import Optional
+from services.aggregates import to_utc_naive
+from services.realtime_hub import Subscription
+from storage.base import to_millis
+from utils import metrics
+
+logger = logging.getLogger("SensorDataAPI")
+
+ALERT_EVENTS = metrics.counter("alert_events_total", "Alert events by rule and status.", ("rule", "status"))
+
+FIRING = "firing"
+RESOLVED = "resolved"
+
+class Rule:
+    """
+    One alert rule evaluated on every reading of the stations it applies to.
+
+    The state of each station lives in typed arrays indexed by the station's
+    slot in the engine (`AlertEngine.slot_of`), so a rule costs a few bytes per
+    station and O(1) per reading. A station fires once `sustain` consecutive
+    readings violate the rule, and resolves on the first reading that does not.
+
+    Parameters:
+    - name (str): Unique name, reported in the events.
+    - stations (list[str], optional): equipmentIds the rule applies to; all when omitted.
+    - sustain (int): Consecutive violating readings before firing.
+    """
+
+    kind = None
+
+    def __init__(self, name: str, stations=None, sustain: int = 1):
+        if sustain < 1:
+            raise ValueError(f"Alert rule {name!r}: sustain must be at least 1.")
+        self.name = name
+        self.stations = None if stations is None else frozenset(stations)
+        self.sustain = sustain
+        self.firing = bytearray()
+        self.streak = array("I")
+
+    def grow(self, size: int):
+        """Adds state for the stations up to slot `size - 1`."""
+        missing = size - len(self.firing)
+        if missing > 0:
+            self.firing.extend(bytes(missing))
+            self.streak.extend([0] * missing)
+            self._grow(missing)
+
+    def _grow(self, missing: int):
+        pass
+
+    def check(self, slot: int, seconds: float, value: float):
+        """
+        Evaluates one reading and updates the station's state.
+
+        Returns:
+        - tuple: `(violated, detail)`; `violated` is `None` when the reading
+          cannot be judged yet (e.g. warm-up), which leaves the alert as it is.
+        """
+        raise NotImplementedError
+
+    def evaluate(self, slot: int, seconds: float, value: float):
+        """Returns the new status of the station (`FIRING`/`RESOLVED`) and its detail, or `None` if unchanged."""
+        violated, detail = self.check(slot, seconds, value)
+        if violated is None:
+            return None
+        if not violated:
+            self.streak[slot] = 0
+            if self.firing[slot]:
+                self.firing[slot] = 0
+                return RESOLVED, detail
+            return None
+        streak = self.streak[slot] + 1
+        self.streak[slot] = streak
+        if not self.firing[slot] and streak >= self.sustain:
+            self.firing[slot] = 1
+            return FIRING, detail
+        return None
+
+    def describe(self) -> dict:
+        return {"name": self.name, "type": self.kind, "stations": None if self.stations is None else sorted(self.stations),
+                "sustain": self.sustain}
+
+class ThresholdRule(Rule):
+    """Fires while readings are above `above` or below `below`."""
+
+    kind = "threshold"
+
+    def __init__(self, name: str, above: Optional[float] = None, below: Optional[float] = None, **options):
+        super().__init__(name, **options)
+        if above is None and below is None:
+            raise ValueError(f"Alert rule {name!r}: a threshold needs 'above' and/or 'below'.")
+        self.above = math.inf if above is None else float(above)
+        self.below = -math.inf if below is None else float(below)
+
+    def check(self, slot, seconds, value):
+        return value > self.above or value < self.below, None
+
+    def describe(self):
+        return {**super().describe(), "above": None if self.above == math.inf else self.above,
+                "below": None if self.below == -math.inf else self.below}
+
+class RateOfChangeRule(Rule):
+    """
+    Fires while a station's value changes faster than `max_rate` units per
+    second between consecutive readings (in time order: late and duplicated
+    timestamps are not judged).
+    """
+
+    kind = "rate_of_change"
+
+    def __init__(self, name: str, max_rate: float, **options):
+        super().__init__(name, **options)
+        if max_rate <= 0:
+            raise ValueError(f"Alert rule {name!r}: max_rate must be positive.")
+        self.max_rate = float(max_rate)
+        self.last_seconds = array("d")
+        self.last_value = array("d")
+
+    def _grow(self, missing):
+        self.last_seconds.extend([-math.inf] * missing)
+        self.last_value.extend([0.0] * missing)
+
+    def check(self, slot, seconds, value):
+        elapsed = seconds - self.last_seconds[slot]
+        if elapsed <= 0:
+            return None, None
+        first = self.last_seconds[slot] == -math.inf
+        rate = (value - self.last_value[slot]) / elapsed
+        self.last_seconds[slot] = seconds
+        self.last_value[slot] = value
+        if first:
+            return None, None
+        return abs(rate) > self.max_rate, {"rate": rate}
+
+    def describe(self):
+        return {**super().describe(), "max_rate": self.max_rate}
+
+class ZScoreRule(Rule):
+    """
+    Fires while readings deviate more than `z` standard deviations from the
+    station's exponentially weighted moving average.
+
+    Mean and variance are EWMAs with weight `alpha` per reading; each reading is
+    scored against the state before it, then folded in. Stations are not judged
+    during their first `warmup` readings.
+    """
+
+    kind = "zscore"
+
+    def __init__(self, name: str, z: float = 3.0, alpha: float = 0.1, warmup: int = 30, **options):
+        super().__init__(name, **options)
+        if z <= 0 or not 0 < alpha <= 1 or warmup < 2:
+            raise ValueError(f"Alert rule {name!r}: needs z > 0, 0 < alpha <= 1 and warmup >= 2.")
+        self.z = float(z)
+        self.alpha = float(alpha)
+        self.warmup = warmup
+        self.mean = array("d")
+        self.variance = array("d")
+        self.count = array("I")
+
+    def _grow(self, missing):
+        self.mean.extend([0.0] * missing)
+        self.variance.extend([0.0] * missing)
+        self.count.extend([0] * missing)
+
+    def check(self, slot, seconds, value):
+        count = self.count[slot]
+        mean = self.mean[slot]
+        variance = self.variance[slot]
+        if count == 0:
+            self.mean[slot] = value
+            self.count[slot] = 1
+            return None, None
+        diff = value - mean
+        score = diff / math.sqrt(variance) if variance > 0 else (0.0 if diff == 0 else math.inf)
+        increment = self.alpha * diff
+        self.mean[slot] = mean + increment
+        self.variance[slot] = (1 - self.alpha) * (variance + diff * increment)
+        if count < self.warmup:
+            self.count[slot] = count + 1
+            return None, None
+        return abs(score) > self.z, {"zscore": score if math.isfinite(score) else None, "mean": mean}
+
+    def describe(self):
+        return {**super().describe(), "z": self.z, "alpha": self.alpha, "warmup": self.warmup}
+
+RULE_TYPES = {rule.kind: rule for rule in (ThresholdRule, RateOfChangeRule, ZScoreRule)}
+
+def build_rules(definitions) -> list:
+    """
+    Builds rules from their JSON definitions, e.g.
+    `{"name": "overheat", "type": "threshold", "above": 80, "stations": ["STATION_1"], "sustain": 3}`.
+
+    Raises:
+    - ValueError: For an unknown type, a duplicated name or invalid parameters.
+    """
+    rules, names = [], set()
+    for definition in definitions:
+        definition = dict(definition)
+        kind = definition.pop("type", None)
+        name = definition.get("name")
+        if kind not in RULE_TYPES:
+            raise ValueError(f"Alert rule {name!r}: unknown type {kind!r}; use one of {', '.join(RULE_TYPES)}.")
+        if not name or name in names:
+            raise ValueError(f"Alert rule names must be unique and non-empty: {name!r}.")
+        names.add(name)
+        try:
+            rules.append(RULE_TYPES[kind](**definition))
+        except TypeError as e:
+            raise ValueError(f"Alert rule {name!r}: {e}")
+    return rules
+
+def load_rules(path: str) -> list:
+    """Rules of the JSON file `path` (a list of definitions, see `build_rules`); none when `path` is empty."""
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        return build_rules(json.load(f))
+
+class AlertEngine:
+    """
+    Evaluates the alert rules on every stored reading, as it is published.
+
+    Each station gets a slot on first sight; the rules keep their per-station
+    state in arrays indexed by it. Status changes become events, kept in a
+    bounded history, tracked as active alerts while firing and pushed to the
+    subscribers (same bounded, drop-oldest queues as the realtime hub).
+
+    Each worker evaluates the readings its hub publishes: with several workers,
+    use `REALTIME_FEED=change_stream` so that every worker sees every reading
+    and keeps the same state.
+
+    Parameters:
+    - rules (list[Rule]): Rules to evaluate.
+    - history (int): Events kept for `events`.
+    - max_queue (int): Queue size of each subscriber.
+    """
+
+    def __init__(self, rules, history: int = 1000, max_queue: int = 100):
+        self.rules = list(rules)
+        self.max_queue = max_queue
+        self._slots = {}
+        self._history = deque(maxlen=history)
+        self._active = {}
+        self._subscribers = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rules)
+
+    def slot_of(self, equipment_id: str) -> int:
+        slot = self._slots.get(equipment_id)
+        if slot is None:
+            slot = self._slots[equipment_id] = len(self._slots)
+            # Cresce em blocos para não realocar os arrays a cada estação nova
+            if slot >= len(self.rules[0].firing):
+                for rule in self.rules:
+                    rule.grow(max(2 * slot, 64))
+        return slot
+
+    def evaluate(self, docs):
+        """Evaluates stored readings in order; called by the realtime hub for each published batch."""
+        if not self.rules:
+            return
+        for doc in docs:
+            equipment_id = doc["equipmentId"]
+            slot = self.slot_of(equipment_id)
+            value = float(doc["value"])
+            seconds = to_millis(doc["timestamp"]) / 1000
+            for rule in self.rules:
+                if rule.stations is not None and equipment_id not in rule.stations:
+                    continue
+                change = rule.evaluate(slot, seconds, value)
+                if change is not None:
+                    self._emit(rule, change, doc, value)
+
+    def _emit(self, rule: Rule, change, doc, value: float):
+        status, detail = change
+        event = {
+            "type": "alert",
+            "status": status,
+            "rule": rule.name,
+            "kind": rule.kind,
+            "equipmentId": doc["equipmentId"],
+            "timestamp": to_utc_naive(doc["timestamp"]).isoformat(),
+            "value": value,
+            **(detail or {}),
+        }
+        key = (rule.name, doc["equipmentId"])
+        if status == FIRING:
+            self._active[key] = event
+        else:
+            event["since"] = self._active.pop(key, {}).get("timestamp")
+        self._history.append(event)
+        ALERT_EVENTS.labels(rule.name, status).inc()
+
+        message = json.dumps(event)
+        for subscription in self._subscribers:
+            if subscription.equipment_id is None or subscription.equipment_id == doc["equipmentId"]:
+                subscription.offer(message)
+
+    def subscribe(self, equipment_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(equipment_id, self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def active(self, equipment_id: Optional[str] = None) -> list:
+        """Firing alerts (their firing events), oldest first."""
+        return [event for event in self._active.values() if equipment_id in (None, event["equipmentId"])]
+
+    def events(self, equipment_id: Optional[str] = None, limit: Optional[int] = None) -> list:
+        """Latest firing/resolve events, newest first."""
+        events = [event for event in reversed(self._history) if equipment_id in (None, event["equipmentId"])]
+        return events[:limit] if limit else events
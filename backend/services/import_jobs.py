@@ -0,0 +1,331 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import UploadFile
+from config import settings
+from services import sensors_service
+from utils import metrics
+from utils.csv_parser import CSVFormatError, create_parser
+
+logger = logging.getLogger("SensorDataAPI")
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+class ImportJobManager:
+    """
+    Runs CSV imports in the background with a bounded pool of workers.
+
+    Each upload is spooled to `<spool_dir>/<job_id>.csv` next to a JSON manifest
+    holding its status and progress. The manifest is rewritten after every chunk
+    is stored (see `sensors_service.import_csv_stream`), recording the byte offset
+    reached, so a job interrupted by a restart resumes from its last committed
+    chunk instead of starting over. Rows of the chunk that was being written when
+    the process stopped may be inserted again on resume.
+
+    A finished job keeps its manifest (and, if it failed, its upload) for
+    `retention_seconds`, so its status can still be read; `purge_finished` then
+    deletes them, after every job and on startup.
+
+    Parameters:
+    - spool_dir (str): Directory for spooled uploads and manifests.
+    - workers (int): Maximum number of imports running at the same time.
+    - retention_seconds (float): How long finished jobs are kept.
+    """
+
+    def __init__(self, spool_dir: str, workers: int = 2, retention_seconds: float = 86400):
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        """Imports queued and not yet picked up by a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _data_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.csv")
+
+    def _manifest_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _lock_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.lock")
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._tasks and all(not task.done() and task.get_loop() is loop for task in self._tasks):
+            return
+        old_queue, self._queue = self._queue, asyncio.Queue()
+        # Jobs ainda na fila dos workers antigos passam para a nova fila
+        while old_queue is not None and not old_queue.empty():
+            self._queue.put_nowait(old_queue.get_nowait())
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _save(self, job: dict):
+        # Grava em arquivo temporário e renomeia para nunca deixar um manifesto pela metade
+        path = self._manifest_path(job["job_id"])
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(job, f, default=str)
+        os.replace(f"{path}.tmp", path)
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self._manifest_path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    async def submit(self, file: UploadFile) -> dict:
+        """
+        Spools an upload to disk and queues its import.
+
+        Returns:
+        - dict: The new job (see `status`).
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        total_bytes = 0
+        with open(self._data_path(job_id), "wb") as out:
+            while True:
+                chunk = await file.read(settings.CSV_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(out.write, chunk)
+                total_bytes += len(chunk)
+
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "filename": file.filename,
+            "total_bytes": total_bytes,
+            "committed_offset": 0,
+            "committed_line": 0,
+            "header": None,
+            "inserted_count": 0,
+            "duplicate_count": 0,
+            "rejected_count": 0,
+            "errors": [],
+            "error": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "elapsed_seconds": 0.0,
+        }
+        await asyncio.to_thread(self._save, job)
+        self._ensure_started()
+        await self._queue.put(job_id)
+        logger.info(f"Import job {job_id} queued ({total_bytes} bytes).")
+        return self.status(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Returns the status of a job, or `None` if it does not exist."""
+        if not _JOB_ID.match(job_id):
+            return None
+        job = self._load(job_id)
+        return self.status(job) if job else None
+
+    def status(self, job: dict) -> dict:
+        """
+        Public view of a job manifest, with throughput and ETA.
+
+        Throughput is the rows processed per second of import time; the ETA
+        extrapolates the bytes still to be read at the observed byte rate.
+        """
+        processed = job["inserted_count"] + job.get("duplicate_count", 0) + job["rejected_count"]
+        elapsed = job["elapsed_seconds"]
+        throughput = processed / elapsed if elapsed > 0 else None
+        eta = None
+        if job["status"] in (QUEUED, RUNNING) and elapsed > 0 and job["committed_offset"] > 0:
+            remaining = job["total_bytes"] - job["committed_offset"]
+            eta = remaining / (job["committed_offset"] / elapsed)
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "filename": job["filename"],
+            "rows_parsed": processed,
+            "inserted_count": job["inserted_count"],
+            "duplicate_count": job.get("duplicate_count", 0),
+            "rejected_count": job["rejected_count"],
+            "errors": job["errors"],
+            "error": job["error"],
+            "bytes_processed": job["committed_offset"],
+            "total_bytes": job["total_bytes"],
+            "rows_per_second": throughput,
+            "eta_seconds": eta,
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+        }
+
+    def purge_finished(self) -> int:
+        """
+        Deletes the files of the jobs finished more than `retention_seconds` ago.
+
+        Returns:
+        - int: Number of jobs deleted.
+        """
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention_seconds)
+        purged = 0
+        for name in os.listdir(self.spool_dir):
+            job_id, ext = os.path.splitext(name)
+            if ext != ".json" or not _JOB_ID.match(job_id):
+                continue
+            job = self._load(job_id)
+            if not job or job["status"] in (QUEUED, RUNNING) or not job["finished_at"]:
+                continue
+            if datetime.fromisoformat(job["finished_at"]) > cutoff:
+                continue
+            # Manifesto por último: sem ele o job não é mais listado nem retomado
+            for path in (self._data_path(job_id), self._lock_path(job_id), self._manifest_path(job_id)):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+            purged += 1
+        if purged:
+            logger.info(f"Purged {purged} finished import jobs.")
+        return purged
+
+    async def resume_pending(self):
+        """Queues every job that was queued or running when the process stopped."""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        await asyncio.to_thread(self.purge_finished)
+        pending = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            job_id, ext = os.path.splitext(name)
+            if ext != ".json" or not _JOB_ID.match(job_id):
+                continue
+            job = self._load(job_id)
+            if job and job["status"] in (QUEUED, RUNNING):
+                pending.append(job_id)
+        if pending:
+            self._ensure_started()
+            for job_id in pending:
+                await self._queue.put(job_id)
+            logger.info(f"Resuming {len(pending)} import jobs.")
+        return len(pending)
+
+    async def stop(self):
+        """Stops the workers; running jobs resume from their last chunk on restart."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Unexpected error in import job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, job_id: str) -> Optional[int]:
+        """Takes the job's lock file, or returns `None` if another worker process runs it."""
+        fd = os.open(self._lock_path(job_id), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    async def _run(self, job_id: str):
+        # Com vários workers, todos retomam os jobs pendentes na inicialização: o lock
+        # (liberado pelo sistema se o processo morrer) garante uma única execução
+        lock = self._claim(job_id)
+        if lock is None:
+            logger.info(f"Import job {job_id} is running in another process.")
+            return
+        try:
+            await self._run_claimed(job_id)
+        finally:
+            job = self._load(job_id)
+            if job is None or job["status"] not in (QUEUED, RUNNING):
+                # Job encerrado: quem abrir o lock depois relê o manifesto e desiste
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._lock_path(job_id))
+            os.close(lock)
+        await asyncio.to_thread(self.purge_finished)
+
+    async def _run_claimed(self, job_id: str):
+        # Relido com o lock: outro processo pode ter terminado o job
+        job = self._load(job_id)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return
+        job["status"] = RUNNING
+        job["started_at"] = job["started_at"] or datetime.utcnow().isoformat()
+        await asyncio.to_thread(self._save, job)
+
+        # Manifestos anteriores à ingestão idempotente não têm duplicate_count
+        base = {key: job.get(key, 0) for key in ("inserted_count", "duplicate_count", "rejected_count")}
+        base_errors = list(job["errors"])
+        base_elapsed = job["elapsed_seconds"]
+        started = time.monotonic()
+        parser = create_parser(settings.CSV_PARSER, offset=job["committed_offset"],
+                               line_number=job["committed_line"], header=job["header"])
+
+        async def commit(totals):
+            job["committed_offset"] = parser.offset
+            job["committed_line"] = parser.line_number
+            job["header"] = parser.header
+            for key in base:
+                job[key] = base[key] + totals[key]
+            room = settings.CSV_MAX_REPORTED_ERRORS - len(base_errors)
+            job["errors"] = base_errors + totals["errors"][:max(room, 0)]
+            job["elapsed_seconds"] = base_elapsed + time.monotonic() - started
+            await asyncio.to_thread(self._save, job)
+
+        try:
+            with open(self._data_path(job_id), "rb") as f:
+                f.seek(job["committed_offset"])
+
+                async def read_chunk(size):
+                    return await asyncio.to_thread(f.read, size)
+
+                await sensors_service.import_csv_stream(read_chunk, parser, on_chunk=commit)
+            job["status"] = COMPLETED
+            os.remove(self._data_path(job_id))
+        except CSVFormatError as e:
+            job["status"] = FAILED
+            job["error"] = f"Invalid CSV format. {e}"
+        except sensors_service.CSVImportError as e:
+            # O offset não avança: o bloco que falhou não foi confirmado
+            for key in base:
+                job[key] = base[key] + e.totals[key]
+            job["status"] = FAILED
+            job["error"] = str(e)
+        except asyncio.CancelledError:
+            # Interrompido no desligamento: permanece "running" para ser retomado
+            raise
+        except Exception as e:
+            job["status"] = FAILED
+            job["error"] = str(e)
+        job["finished_at"] = datetime.utcnow().isoformat()
+        job["elapsed_seconds"] = base_elapsed + time.monotonic() - started
+        await asyncio.to_thread(self._save, job)
+        logger.info(f"Import job {job_id} {job['status']}: {job['inserted_count']} inserted, "
+                    f"{job.get('duplicate_count', 0)} duplicates, {job['rejected_count']} rejected.")
+
+import_jobs = ImportJobManager(settings.IMPORT_SPOOL_DIR, settings.IMPORT_WORKERS,
+                               settings.IMPORT_JOB_RETENTION_HOURS * 3600)
+
+metrics.gauge("import_jobs_queue_depth", "CSV imports waiting for a worker.", function=lambda: import_jobs.depth)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from pymongo.errors import BulkWriteError
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("SensorDataAPI")
+
+ACK_ON_ENQUEUE = "enqueue"
+ACK_ON_FLUSH = "flush"
+
+_STOP = object()
+
+class IngestBufferFull(Exception):
+    """Raised when a reading cannot be enqueued before the enqueue timeout."""
+
+class IngestBuffer:
+    """
+    In-process write-behind buffer for sensor readings.
+
+    Readings are queued and written by a single background task with one
+    `insert_many` per batch. A batch is flushed when it reaches `max_batch_size`
+    or when `flush_interval` seconds have passed since its first reading.
+
+    Parameters:
+    - flush (callable): Coroutine that persists a list of documents; it may return
+      a `{index: outcome}` dict for documents not stored (e.g. duplicates), which
+      `submit` hands back to their producers.
+    - max_batch_size (int): Maximum number of documents per flush.
+    - flush_interval (float): Maximum time (seconds) a reading waits in a batch.
+    - max_queue_size (int): Queue capacity; producers wait when it is full.
+    - ack_mode (str): "enqueue" or "flush" (see `submit`).
+    - enqueue_timeout (float): How long `submit` waits for room in the queue.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[dict]], Awaitable[Optional[dict]]],
+        max_batch_size: int = 500,
+        flush_interval: float = 0.05,
+        max_queue_size: int = 20000,
+        ack_mode: str = ACK_ON_FLUSH,
+        enqueue_timeout: float = 1.0,
+    ):
+        if ack_mode not in (ACK_ON_ENQUEUE, ACK_ON_FLUSH):
+            raise ValueError(f"Invalid ack mode: {ack_mode}")
+        self._flush = flush
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.ack_mode = ack_mode
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Lote em formação, fora da fila mas ainda não entregue ao flush
+        self._collecting: list = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        old_queue = self._queue
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        if old_queue is not None:
+            self._carry_over(old_queue, loop)
+        self._task = loop.create_task(self._run())
+
+    def _carry_over(self, old_queue, loop):
+        """
+        Moves readings left by a stopped task (the batch it was collecting and
+        its queue) into the new queue.
+
+        Waiters created on the current loop keep waiting for the new task; waiters
+        bound to another loop are failed there, since their requests cannot be
+        resumed from this loop.
+        """
+        leftovers, self._collecting = self._collecting, []
+        while True:
+            try:
+                leftovers.append(old_queue.get_nowait())
+            except (asyncio.QueueEmpty, RuntimeError):
+                break
+        for item in leftovers:
+            if item is _STOP:
+                continue
+            doc, waiter = item
+            if waiter is not None and waiter.get_loop() is not loop:
+                _fail(waiter, RuntimeError("Ingest buffer restarted on another event loop."))
+                waiter = None
+            self._queue.put_nowait((doc, waiter))
+
+    async def submit(self, doc: dict):
+        """
+        Enqueues a document for the next batch.
+
+        With ack mode "enqueue" this returns as soon as the document is queued.
+        With ack mode "flush" it returns only after the batch containing the
+        document has been written, re-raising any error from the write.
+
+        Returns:
+        - The outcome `flush` reported for the document, or `None` (always with
+          ack mode "enqueue").
+
+        Raises:
+        - IngestBufferFull: If the queue stays full for `enqueue_timeout` seconds.
+        """
+        self._ensure_started()
+        waiter = None
+        if self.ack_mode == ACK_ON_FLUSH:
+            waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._queue.put((doc, waiter)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise IngestBufferFull("Ingest queue is full.")
+        if waiter is not None:
+            return await waiter
+        return None
+
+    async def stop(self):
+        """Flushes every queued document and stops the background task."""
+        if self._task is None:
+            return
+        if self._task.done():
+            if not self._collecting and self._queue.empty():
+                return
+            self._ensure_started()
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = self._collecting = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._collecting = []
+            await self._write(batch)
+
+    async def _write(self, batch):
+        docs = [doc for doc, _ in batch]
+        errors = {}
+        outcomes = None
+        try:
+            outcomes = await self._flush(docs)
+        except BulkWriteError as e:
+            # Com ordered=False apenas os documentos listados em writeErrors falharam
+            for write_error in e.details.get("writeErrors", []):
+                errors[write_error["index"]] = e
+            logger.error(f"{len(errors)} of {len(docs)} buffered readings rejected: {e}")
+        except Exception as e:
+            logger.error(f"Error flushing {len(docs)} buffered readings: {e}")
+            errors = dict.fromkeys(range(len(docs)), e)
+        for index, (_, waiter) in enumerate(batch):
+            if waiter is None or waiter.done():
+                continue
+            if index in errors:
+                waiter.set_exception(errors[index])
+            else:
+                waiter.set_result(outcomes.get(index) if outcomes else None)
+
+def _fail(waiter, error):
+    if waiter.done():
+        return
+    waiter_loop = waiter.get_loop()
+    if waiter_loop.is_closed():
+        return
+    waiter_loop.call_soon_threadsafe(
+        lambda: waiter.done() or waiter.set_exception(error)
+    )
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+from services.aggregates import floor_time, to_utc_naive
+
+logger = logging.getLogger("SensorDataAPI")
+
+ROLLING_WINDOW = timedelta(hours=24)
+ROLLING_SLOT = timedelta(minutes=15)
+
+class RollingAverage:
+    """
+    Running average of one station over the last `ROLLING_WINDOW`.
+
+    Readings are summed into `ROLLING_SLOT` slots, so memory per station is
+    bounded (96 slots for 24h) and each update is O(1) amortized. The window
+    ends at the current time, not at the station's newest reading: slots are
+    dropped as they fall out of it, also when the station stops sending, and
+    a late reading still inside it is counted in its slot.
+    """
+
+    __slots__ = ("slots", "count", "total")
+
+    def __init__(self):
+        self.slots = deque()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, timestamp, value: float, now: Optional[datetime] = None):
+        slot = _slot_of(timestamp)
+        horizon = self.prune(now)
+        if slot <= horizon:
+            return
+        if not self.slots or slot > self.slots[-1][0]:
+            self.slots.append([slot, 1, value])
+        else:
+            # Leitura atrasada: procura o slot a partir do mais novo e cria-o em ordem se faltar
+            position = len(self.slots)
+            while position and self.slots[position - 1][0] > slot:
+                position -= 1
+            if position and self.slots[position - 1][0] == slot:
+                self.slots[position - 1][1] += 1
+                self.slots[position - 1][2] += value
+            else:
+                self.slots.insert(position, [slot, 1, value])
+        self.count += 1
+        self.total += value
+
+    def prune(self, now: Optional[datetime] = None):
+        """Drops the slots that left the window ending at `now` (default: current UTC time); returns its edge."""
+        horizon = _slot_of(now or datetime.utcnow()) - ROLLING_WINDOW
+        while self.slots and self.slots[0][0] <= horizon:
+            _, count, total = self.slots.popleft()
+            self.count -= count
+            self.total -= total
+        return horizon
+
+    @property
+    def average(self):
+        self.prune()
+        return self.total / self.count if self.count else None
+
+def _slot_of(timestamp):
+    timestamp = to_utc_naive(timestamp)
+    minute = floor_time(timestamp, "minute")
+    return minute - timedelta(minutes=minute.minute % (ROLLING_SLOT.seconds // 60))
+
+class Subscription:
+    """
+    One subscriber of the hub, with a bounded queue of serialized events.
+
+    When the client falls behind and the queue is full, the oldest event is
+    dropped; the number of dropped events is reported with the next event the
+    client receives, so a slow consumer never blocks ingest or other clients.
+    """
+
+    def __init__(self, equipment_id: Optional[str], max_queue: int):
+        self.equipment_id = equipment_id
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, message: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def next_message(self) -> str:
+        message = await self.queue.get()
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return json.dumps({"type": "dropped", "count": dropped}) + "\n" + message
+        return message
+
+class RealtimeHub:
+    """
+    In-process fan-out of newly stored readings to WebSocket/SSE subscribers.
+
+    Subscribers are indexed by equipmentId, so publishing a reading only touches
+    the clients interested in that station plus the "all stations" clients, and
+    each event is serialized once whatever the number of subscribers.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._by_station = {}
+        self._all = set()
+        self._averages = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Calls `listener(docs)` with every published batch (e.g. the alert engine), before the fan-out."""
+        self._listeners.append(listener)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._all) + sum(len(subs) for subs in self._by_station.values())
+
+    @property
+    def queued_events(self) -> int:
+        """Events waiting in the subscriber queues, i.e. not yet sent to slow clients."""
+        return sum(subscription.queue.qsize() for subscription in self._all) + sum(
+            subscription.queue.qsize() for subs in self._by_station.values() for subscription in subs
+        )
+
+    def subscribe(self, equipment_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(equipment_id, self.max_queue)
+        if equipment_id is None:
+            self._all.add(subscription)
+        else:
+            self._by_station.setdefault(equipment_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.equipment_id is None:
+            self._all.discard(subscription)
+            return
+        subscribers = self._by_station.get(subscription.equipment_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._by_station[subscription.equipment_id]
+
+    def publish(self, docs):
+        """
+        Updates the rolling averages and pushes one event per reading.
+
+        Never blocks: it only enqueues into the subscribers' bounded queues.
+        """
+        for listener in self._listeners:
+            try:
+                listener(docs)
+            except Exception as e:
+                logger.error(f"Error in realtime listener {listener!r}: {e}")
+        for doc in docs:
+            equipment_id = doc["equipmentId"]
+            rolling = self._averages.get(equipment_id)
+            if rolling is None:
+                rolling = self._averages[equipment_id] = RollingAverage()
+            rolling.add(doc["timestamp"], float(doc["value"]))
+
+            station_subscribers = self._by_station.get(equipment_id)
+            if not station_subscribers and not self._all:
+                continue
+            message = json.dumps({
+                "type": "reading",
+                "equipmentId": equipment_id,
+                "timestamp": to_utc_naive(doc["timestamp"]).isoformat(),
+                "value": doc["value"],
+                "average_24h": rolling.average,
+            })
+            for subscription in station_subscribers or ():
+                subscription.offer(message)
+            for subscription in self._all:
+                subscription.offer(message)
+
+class ChangeStreamFeed:
+    """
+    Feeds a hub from a MongoDB change stream on the raw readings collection.
+
+    With several workers, each one only publishes the readings it stored
+    itself; following the inserts of the collection instead gives every
+    worker's subscribers (and rolling averages) the readings of all workers.
+    Change streams require a replica set. After an error the stream is
+    reopened after the last event seen, so no reading is skipped.
+
+    Parameters:
+    - hub (RealtimeHub): Hub receiving the readings.
+    - get_database (callable): Returns the Motor database to watch.
+    - collection (str): Collection of raw readings.
+    - retry_delay (float): Seconds before reopening a failed stream.
+    """
+
+    def __init__(self, hub: RealtimeHub, get_database, collection: str = "sensors", retry_delay: float = 1.0):
+        self.hub = hub
+        self._get_database = get_database
+        self.collection = collection
+        self.retry_delay = retry_delay
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the hub is fed by this stream (and not by the local writes)."""
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.enabled:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                collection = self._get_database()[self.collection]
+                async with collection.watch(pipeline, resume_after=self._resume_token) as stream:
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self.hub.publish([change["fullDocument"]])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime change stream failed, reopening: {e}")
+                await asyncio.sleep(self.retry_delay)
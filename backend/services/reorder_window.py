@@ -0,0 +1,72 @@
+from datetime import datetime
+from storage.base import to_millis
+
+# Estações com watermark guardado; além disso as mais antigas são esquecidas
+MAX_STATIONS = 100_000
+
+class ReorderWindow:
+    """
+    Bounded per-station reorder window for incoming readings.
+
+    Each station has a watermark, the newest timestamp stored for it. A reading
+    up to `seconds` older than the watermark is accepted (devices and gateways
+    deliver slightly out of order); an older one is late and is rejected, so
+    that what was derived from the station's past (aggregate buckets,
+    retention rollups, alert state) is not changed by arbitrarily old data.
+
+    A watermark never goes past the current time: a reading dated in the future
+    (device clock error) is stored, but does not make the station's real readings
+    late. Memory is one integer per station, for at most `max_stations` stations;
+    beyond that the stations with the oldest watermarks are forgotten, and their
+    next reading starts a new watermark.
+
+    The watermarks live in the process: with several workers, each one judges
+    the readings it receives.
+
+    Parameters:
+    - seconds (float): Window size; 0 disables it (nothing is late).
+    - max_stations (int): Most watermarks kept.
+    """
+
+    def __init__(self, seconds: float = 0, max_stations: int = MAX_STATIONS):
+        self.window_ms = int(seconds * 1000)
+        self.max_stations = max_stations
+        self._watermarks = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    def late(self, docs) -> list:
+        """Positions of the readings of `docs` that fall behind their station's window."""
+        if not self.enabled:
+            return []
+        watermarks = self._watermarks
+        late = []
+        for position, doc in enumerate(docs):
+            watermark = watermarks.get(doc["equipmentId"])
+            if watermark is not None and to_millis(doc["timestamp"]) < watermark - self.window_ms:
+                late.append(position)
+        return late
+
+    def advance(self, docs):
+        """Moves the watermarks forward with stored readings, up to the current time."""
+        if not self.enabled:
+            return
+        watermarks = self._watermarks
+        now = to_millis(datetime.utcnow())
+        for doc in docs:
+            ms = min(to_millis(doc["timestamp"]), now)
+            if ms > watermarks.get(doc["equipmentId"], ms - 1):
+                watermarks[doc["equipmentId"]] = ms
+        if len(watermarks) > self.max_stations:
+            self._evict()
+
+    def _evict(self):
+        # Amortizado: desce para 90% do limite, esquecendo as estações caladas há mais tempo
+        keep = sorted(self._watermarks.items(), key=lambda item: item[1])[-int(self.max_stations * 0.9):]
+        self._watermarks = dict(keep)
+
+    def watermark(self, equipment_id: str):
+        """Newest timestamp (ms since the epoch) stored for the station, or `None`."""
+        return self._watermarks.get(equipment_id)
@@ -0,0 +1,326 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from config import settings
+from services.aggregates import bucket_group, empty_summary, merge_summary, to_summary, to_utc_naive
+from utils.sketch import QuantileSketch
+
+logger = logging.getLogger("SensorDataAPI")
+
+ROLLUP_COLLECTION = "sensor_rollups"
+ARCHIVE_COLLECTION = "sensors_archive"
+STATE_COLLECTION = "sensor_rollups_state"
+HOUR = "hour"
+DAY = "day"
+STEPS = {
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+}
+MODES = ("delete", "archive")
+
+_EPOCH = datetime(1970, 1, 1)
+_DUPLICATE_KEY = 11000
+_LEASE_ID = "lease"
+_PENDING_ID = "pending"
+_LEASE_SECONDS = 300
+
+def floor_step(ts: datetime, granularity: str) -> datetime:
+    step = STEPS[granularity]
+    return _EPOCH + ((to_utc_naive(ts) - _EPOCH) // step) * step
+
+def ceil_step(ts: datetime, granularity: str) -> datetime:
+    floored = floor_step(ts, granularity)
+    return floored if floored == to_utc_naive(ts) else floored + STEPS[granularity]
+
+def raw_horizon(raw_days: Optional[int] = None, now: Optional[datetime] = None) -> datetime:
+    """Readings older than this are only kept in the rollups (`RETENTION_RAW_DAYS`)."""
+    raw_days = settings.RETENTION_RAW_DAYS if raw_days is None else raw_days
+    return (now or datetime.utcnow()) - timedelta(days=raw_days)
+
+def _rollup_match(start: datetime):
+    # Dias inteiros vêm dos rollups diários; as horas inteiras antes do primeiro dia, dos horários
+    day_start = ceil_step(start, DAY)
+    return {"$or": [
+        {"granularity": DAY, "bucket": {"$gte": day_start}},
+        {"granularity": HOUR, "bucket": {"$gte": ceil_step(start, HOUR), "$lt": day_start}},
+    ]}
+
+async def summarize_rollups(database, start: datetime, equipment_id: Optional[str] = None,
+                            stations: Optional[dict] = None) -> dict:
+    """
+    Returns `{equipmentId: summary}` of the rolled-up readings since `start`.
+
+    Rollups have a one-hour resolution: rolled-up readings in the partial hour
+    at the start of the window are left out. `stations` is an optional filter
+    on `equipmentId` (e.g. one range of the stations).
+    """
+    match = {**(stations or {}), **_rollup_match(start)}
+    if equipment_id is not None:
+        match["equipmentId"] = equipment_id
+    summaries = {}
+    async for doc in database[ROLLUP_COLLECTION].aggregate([{"$match": match}, bucket_group("$equipmentId")]):
+        merge_summary(summaries.setdefault(doc["_id"], empty_summary()), to_summary(doc))
+    return summaries
+
+async def hourly_rollups(database, equipment_id: str, start: datetime, end: Optional[datetime] = None):
+    """
+    Hourly rollups of a station for the whole hours in `[start, end)`, oldest first.
+
+    Each has `bucket`, `count`, `sum`, `sumsq`, `min`, `max` and `sketch`
+    (`QuantileSketch` bins).
+    """
+    bucket = {"$gte": ceil_step(start, HOUR)}
+    if end is not None:
+        bucket["$lte"] = floor_step(end, HOUR) - STEPS[HOUR]
+    cursor = database[ROLLUP_COLLECTION].find(
+        {"equipmentId": equipment_id, "granularity": HOUR, "bucket": bucket},
+        {"_id": 0, "bucket": 1, "count": 1, "sum": 1, "sumsq": 1, "min": 1, "max": 1, "sketch": 1},
+        sort=[("bucket", 1)],
+    )
+    return [doc async for doc in cursor]
+
+def _raise_unless_duplicates(error: BulkWriteError):
+    # Chave duplicada numa repetição do lote = já aplicado; qualquer outro erro é real
+    details = error.details
+    if details.get("writeConcernErrors") or any(
+        write_error.get("code") != _DUPLICATE_KEY for write_error in details.get("writeErrors", [])
+    ):
+        raise error
+
+async def apply_rollups(database, docs, batch_id: ObjectId):
+    """
+    Adds readings to the hourly and daily rollups of their station.
+
+    Besides count/sum/min/max, rollups keep the sum of squares and the bins of
+    a `QuantileSketch`, so the standard deviation and percentiles of rolled-up
+    windows stay available.
+
+    Every rollup touched by the batch records `batch_id`; replaying the same
+    batch matches no document and its upsert hits the unique index, so the
+    readings are never counted twice.
+    """
+    combined = {}
+    values = {}
+    for doc in docs:
+        value = float(doc["value"])
+        for granularity in STEPS:
+            key = (doc["equipmentId"], granularity, floor_step(doc["timestamp"], granularity))
+            merge_summary(combined.setdefault(key, empty_summary()),
+                          {"count": 1, "sum": value, "min": value, "max": value})
+            values.setdefault(key, []).append(value)
+    if not combined:
+        return
+
+    operations = []
+    for (equipment_id, granularity, bucket), summary in combined.items():
+        key_values = values[(equipment_id, granularity, bucket)]
+        increments = {
+            "count": summary["count"],
+            "sum": summary["sum"],
+            "sumsq": sum(value * value for value in key_values),
+        }
+        # Os bins do sketch somam com $inc, como os contadores
+        for bin, count in QuantileSketch().add(key_values).to_dict().items():
+            increments[f"sketch.{bin}"] = count
+        operations.append(UpdateOne(
+            {"equipmentId": equipment_id, "granularity": granularity, "bucket": bucket, "batch": {"$ne": batch_id}},
+            {
+                "$inc": increments,
+                "$min": {"min": summary["min"]},
+                "$max": {"max": summary["max"]},
+                "$set": {"batch": batch_id},
+            },
+            upsert=True,
+        ))
+    try:
+        await database[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        _raise_unless_duplicates(e)
+
+class RetentionScheduler:
+    """
+    Background maintenance of the raw `sensors` collection.
+
+    Every `interval` seconds, readings older than `raw_days` are rolled up into
+    hourly and daily count/sum/min/max documents (`sensor_rollups`), then
+    deleted ("delete") or moved to `sensors_archive` ("archive"). The work is
+    done oldest first in batches of `batch_size` readings, sleeping
+    `batch_pause` seconds between batches so foreground queries keep the database.
+
+    Each batch is journaled in the state collection before it is applied and
+    replayed after a restart (see `apply_rollups`). A lease in the same
+    collection keeps the maintenance to one process at a time.
+
+    Parameters:
+    - get_database (callable): Returns the Motor database to use.
+    - raw_days (int): Days of raw readings kept in `sensors`.
+    - mode (str): "delete" or "archive".
+    - batch_size (int): Readings per batch.
+    - batch_pause (float): Seconds between batches.
+    - interval (float): Seconds between runs.
+    """
+
+    def __init__(self, get_database, raw_days: int = 90, mode: str = "delete", batch_size: int = 5000,
+                 batch_pause: float = 0.2, interval: float = 3600.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown retention mode: {mode}. Use one of {', '.join(MODES)}.")
+        self._get_database = get_database
+        self.raw_days = raw_days
+        self.mode = mode
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self._owner = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "runs": 0,
+            "rolled_up": 0,
+            "batches": 0,
+            "last_run_started": None,
+            "last_run_seconds": None,
+            "last_run_rolled_up": 0,
+            "last_error": None,
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error running retention: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _acquire_lease(self, database) -> bool:
+        now = datetime.utcnow()
+        try:
+            await database[STATE_COLLECTION].find_one_and_update(
+                {"_id": _LEASE_ID, "$or": [{"until": {"$lt": now}}, {"owner": self._owner}]},
+                {"$set": {"owner": self._owner, "until": now + timedelta(seconds=_LEASE_SECONDS)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Outro processo detém o lease
+            return False
+
+    async def _release_lease(self, database):
+        await database[STATE_COLLECTION].update_one(
+            {"_id": _LEASE_ID, "owner": self._owner},
+            {"$set": {"until": datetime.utcnow()}},
+        )
+
+    async def _archive(self, database, docs):
+        try:
+            await database[ARCHIVE_COLLECTION].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            _raise_unless_duplicates(e)
+
+    async def _process(self, database, batch_id: ObjectId, ids) -> int:
+        """Rolls up, archives and removes the journaled batch, then clears the journal."""
+        docs = await database["sensors"].find({"_id": {"$in": ids}}).to_list(length=None)
+        if docs:
+            await apply_rollups(database, docs, batch_id)
+            if self.mode == "archive":
+                await self._archive(database, docs)
+            await database["sensors"].delete_many({"_id": {"$in": ids}})
+        await database[STATE_COLLECTION].delete_one({"_id": _PENDING_ID})
+        self._stats["batches"] += 1
+        self._stats["rolled_up"] += len(docs)
+        return len(docs)
+
+    async def run_once(self) -> int:
+        """
+        Rolls up and removes every raw reading older than the horizon.
+
+        Returns:
+        - int: Number of readings rolled up, or 0 if another process holds the lease.
+        """
+        database = self._get_database()
+        if not await self._acquire_lease(database):
+            logger.info("Retention skipped: another process holds the lease.")
+            return 0
+
+        started = time.monotonic()
+        self._stats["runs"] += 1
+        self._stats["last_run_started"] = datetime.utcnow()
+        total = 0
+        try:
+            # Lote interrompido por um reinício: reaplicado antes dos próximos
+            pending = await database[STATE_COLLECTION].find_one({"_id": _PENDING_ID})
+            if pending:
+                total += await self._process(database, pending["batch"], pending["ids"])
+
+            horizon = raw_horizon(self.raw_days)
+            while True:
+                docs = await database["sensors"].find(
+                    {"timestamp": {"$lt": horizon}},
+                    {"_id": 1},
+                    sort=[("timestamp", 1)],
+                    limit=self.batch_size,
+                ).to_list(length=self.batch_size)
+                if not docs:
+                    break
+                batch_id = ObjectId()
+                ids = [doc["_id"] for doc in docs]
+                await database[STATE_COLLECTION].replace_one(
+                    {"_id": _PENDING_ID}, {"batch": batch_id, "ids": ids}, upsert=True
+                )
+                total += await self._process(database, batch_id, ids)
+                if len(docs) < self.batch_size:
+                    break
+                await asyncio.sleep(self.batch_pause)
+                if not await self._acquire_lease(database):
+                    break
+            self._stats["last_error"] = None
+        except Exception as e:
+            self._stats["last_error"] = str(e)
+            raise
+        finally:
+            self._stats["last_run_seconds"] = time.monotonic() - started
+            self._stats["last_run_rolled_up"] = total
+            await self._release_lease(database)
+        logger.info(f"Retention rolled up {total} readings older than {horizon}.")
+        return total
+
+    async def status(self) -> dict:
+        """
+        Returns the configuration, this process's counters and the retention lag.
+
+        `lag_seconds` is how far the oldest raw reading is behind the horizon:
+        0 when the maintenance is caught up.
+        """
+        database = self._get_database()
+        horizon = raw_horizon(self.raw_days)
+        oldest = await database["sensors"].find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        oldest_raw = oldest["timestamp"] if oldest else None
+        lag = max((horizon - oldest_raw).total_seconds(), 0.0) if oldest_raw else 0.0
+        pending = await database[STATE_COLLECTION].find_one({"_id": _PENDING_ID}, {"ids": 0})
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "mode": self.mode,
+            "raw_days": self.raw_days,
+            "horizon": horizon,
+            "oldest_raw": oldest_raw,
+            "lag_seconds": lag,
+            "pending_batch": str(pending["batch"]) if pending else None,
+            **self._stats,
+        }
@@ -1,15 +1,235 @@
 from config.database import db
-from utils.csv_parser import parse_csv
+from config import settings
+from services import aggregates, retention
+from services.alerts import AlertEngine, load_rules
+from services.ingest_buffer import IngestBuffer, IngestBufferFull
+from services.realtime_hub import ChangeStreamFeed, RealtimeHub
+from services.retention import RetentionScheduler
+from services.reorder_window import ReorderWindow
+from services.wal import WALFull, WriteAheadLog
+from utils.csv_parser import PARSERS, CSVStreamParser, ColumnarCSVParser, ReadingColumns, parse_block
+from utils.batch_decoder import BatchFormatError, decode_batch, media_type
+from utils.cache import ResponseCache, SharedGenerations
+from utils import metrics
+from utils.downsampling import lttb
+from utils.statistics import grouped_statistics
+from storage import create_storage
+from storage.instrumented import InstrumentedStorage
+from storage.base import from_millis, to_millis
+from bson import ObjectId
+from concurrent.futures import ProcessPoolExecutor
+from pymongo.errors import BulkWriteError, ExecutionTimeout
 from datetime import datetime, timedelta
-from fastapi import HTTPException, UploadFile, status
+from typing import Optional
+from fastapi import HTTPException, status
+import asyncio
+import base64
+import binascii
+import heapq
+import json
 import logging
+import math
+import multiprocessing
+import re
+import numpy as np
 
 logger = logging.getLogger("SensorDataAPI")
 
+PERIODS = {
+    "24h": timedelta(hours=24),
+    "48h": timedelta(hours=48),
+    "1w": timedelta(weeks=1),
+    "1m": timedelta(days=30),
+    "1y": timedelta(days=365),
+}
+
+DURATION_UNITS = {"s": 1, "min": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def _parse_duration(value: str) -> Optional[timedelta]:
+    """Parses '<n><unit>' (s, min, h, d, w), e.g. '90d'. Returns `None` if invalid."""
+    match = re.fullmatch(r"(\d+)(s|min|h|d|w)", value.strip())
+    if not match or int(match.group(1)) == 0:
+        return None
+    return timedelta(seconds=int(match.group(1)) * DURATION_UNITS[match.group(2)])
+
+def _period_span(period: str) -> timedelta:
+    span = PERIODS.get(period) or _parse_duration(period)
+    if span is None:
+        logger.warning(f"Invalid period: {period}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid period. Use '24h', '48h', '1w', '1m', '1y' or a duration such as '36h' or '90d'."
+        )
+    return span
+
+def _period_start(period: str) -> datetime:
+    return datetime.utcnow() - _period_span(period)
+
+def _over_budget(query: str, error: ExecutionTimeout) -> HTTPException:
+    # maxTimeMS estourado (QUERY_BUDGETS): sobrecarga, não falha interna
+    logger.warning(f"{query} query exceeded its time budget: {error}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Query exceeded its time budget; try a shorter period."
+    )
+
+# Cache das respostas de média/dados por estação, invalidado a cada ingestão (em todos
+# os workers quando o gunicorn.conf.py define CACHE_SHARED_MEMORY); as médias de todas
+# as estações só expiram
+response_cache = ResponseCache(
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    max_bytes=settings.CACHE_MAX_BYTES,
+    ttl=settings.CACHE_TTL_SECONDS,
+    all_stations_ttl=settings.CACHE_ALL_STATIONS_TTL_SECONDS,
+    enabled=settings.CACHE_ENABLED,
+    generations=SharedGenerations(settings.CACHE_SHARED_MEMORY) if settings.CACHE_SHARED_MEMORY else None,
+)
+
+# Onde as leituras ficam (STORAGE_BACKEND); o Mongo lê `db` a cada operação
+storage = create_storage(settings.STORAGE_BACKEND, lambda: db, settings.COLUMNAR_DATA_DIR)
+if settings.METRICS_ENABLED:
+    storage = InstrumentedStorage(storage, settings.STORAGE_BACKEND)
+
+READINGS_STORED = metrics.counter("sensor_readings_stored_total", "Readings stored.")
+READINGS_REJECTED = metrics.counter("sensor_readings_rejected_total", "Readings rejected by the storage write.")
+READINGS_SKIPPED = metrics.counter(
+    "sensor_readings_skipped_total", "Readings not stored because they were duplicates or late.", ("reason",)
+)
+WRITE_BATCH_SIZE = metrics.histogram(
+    "sensor_write_batch_size", "Readings per storage write (buffer flush, batch request or CSV chunk).",
+    buckets=metrics.SIZE_BUCKETS,
+)
+BATCH_REQUEST_SIZE = metrics.histogram(
+    "sensor_batch_request_items", "Items per POST /sensors/batch request.", buckets=metrics.SIZE_BUCKETS
+)
+
+DUPLICATE = "duplicate"
+LATE = "late"
+LATE_MESSAGE = "Reading is older than the station's reorder window."
+
+async def _write_readings(docs):
+    """
+    Persists a batch of readings and updates everything derived from them.
+
+    Ingest is idempotent: a reading whose equipmentId and timestamp are already
+    stored (or repeated in `docs`) is a duplicate and is skipped. With
+    `INGEST_REORDER_WINDOW_SECONDS`, readings that fall behind their station's
+    reorder window are skipped as late.
+
+    Only the readings actually stored are cached, pushed in time order (and
+    evaluated by the alert rules) and (with the Mongo backend) added to the
+    aggregate buckets: on a `BulkWriteError` the rejected ones are skipped and
+    the error is re-raised, its `writeErrors` indexing `docs` and including the
+    late readings. A failed bucket update does not fail the write (the readings
+    are already stored); it is logged and the buckets are flagged for
+    `aggregates.rebuild`.
+
+    Returns:
+    - dict: Position in `docs` -> `DUPLICATE` or `LATE`, for the readings skipped.
+    """
+    late = reorder_window.late(docs)
+    positions = range(len(docs))
+    if late:
+        rejected = set(late)
+        positions = [position for position in positions if position not in rejected]
+    accepted = [docs[position] for position in positions] if late else docs
+    stored, error = await storage.insert(accepted) if accepted else ([], None)
+    WRITE_BATCH_SIZE.labels().observe(len(docs))
+    READINGS_STORED.labels().inc(len(stored))
+
+    failed = {write_error["index"] for write_error in error.details.get("writeErrors", [])} if error else set()
+    # O storage devolve as próprias leituras gravadas: o que não foi gravado nem falhou é duplicata
+    written = {id(doc) for doc in stored}
+    skipped = {
+        positions[index]: DUPLICATE
+        for index, doc in enumerate(accepted) if index not in failed and id(doc) not in written
+    }
+    skipped.update(dict.fromkeys(late, LATE))
+    if failed:
+        READINGS_REJECTED.labels().inc(len(failed))
+    if skipped:
+        READINGS_SKIPPED.labels(DUPLICATE).inc(len(skipped) - len(late))
+        READINGS_SKIPPED.labels(LATE).inc(len(late))
+
+    if stored:
+        reorder_window.advance(stored)
+        response_cache.invalidate({doc["equipmentId"] for doc in stored})
+        # Com REALTIME_FEED=change_stream os eventos vêm do change stream, de todos os workers
+        if not realtime_feed.enabled:
+            try:
+                realtime_hub.publish(sorted(stored, key=lambda doc: to_millis(doc["timestamp"])))
+            except Exception as e:
+                logger.error(f"Error publishing {len(stored)} readings to subscribers: {e}")
+
+    if error is not None:
+        write_errors = [
+            {**write_error, "index": positions[write_error["index"]]}
+            for write_error in error.details.get("writeErrors", [])
+        ]
+        write_errors.extend({"index": position, "errmsg": LATE_MESSAGE} for position in late)
+        write_errors.sort(key=lambda write_error: write_error["index"])
+        raise BulkWriteError({**error.details, "writeErrors": write_errors})
+    return skipped
+
+reorder_window = ReorderWindow(settings.INGEST_REORDER_WINDOW_SECONDS)
+realtime_hub = RealtimeHub(max_queue=settings.REALTIME_QUEUE_SIZE)
+realtime_feed = ChangeStreamFeed(realtime_hub, lambda: db)
+
+# Regras inválidas impedem a subida do app, como as demais configurações
+alert_engine = AlertEngine(load_rules(settings.ALERT_RULES_FILE), history=settings.ALERT_HISTORY_SIZE,
+                           max_queue=settings.REALTIME_QUEUE_SIZE)
+if alert_engine.enabled:
+    realtime_hub.add_listener(alert_engine.evaluate)
+
+retention_scheduler = RetentionScheduler(
+    lambda: db,
+    raw_days=settings.RETENTION_RAW_DAYS,
+    mode=settings.RETENTION_MODE,
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    batch_pause=settings.RETENTION_BATCH_PAUSE_MS / 1000,
+    interval=settings.RETENTION_INTERVAL_SECONDS,
+)
+
+ingest_buffer = IngestBuffer(
+    flush=metrics.track("ingest_buffer_flush")(_write_readings),
+    max_batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_MS / 1000,
+    max_queue_size=settings.INGEST_QUEUE_SIZE,
+    ack_mode=settings.INGEST_ACK_MODE,
+    enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT_MS / 1000,
+)
+
+wal = WriteAheadLog(
+    settings.WAL_DIR,
+    flush=metrics.track("wal_replay")(_write_readings),
+    segment_bytes=settings.WAL_SEGMENT_BYTES,
+    max_bytes=settings.WAL_MAX_BYTES,
+    fsync=settings.WAL_FSYNC,
+    fsync_interval=settings.WAL_FSYNC_INTERVAL_MS / 1000,
+    group_commit_delay=settings.WAL_GROUP_COMMIT_MS / 1000,
+    drain_batch_size=settings.WAL_DRAIN_BATCH_SIZE,
+    drain_interval=settings.WAL_DRAIN_INTERVAL_MS / 1000,
+)
+
+metrics.gauge("ingest_buffer_depth", "Readings waiting in the ingest buffer.", function=lambda: ingest_buffer.depth)
+metrics.gauge("realtime_subscribers", "WebSocket/SSE subscribers.", function=lambda: realtime_hub.subscriber_count)
+metrics.gauge("realtime_queued_events", "Events waiting in subscriber queues.", function=lambda: realtime_hub.queued_events)
+metrics.gauge("wal_lag_bytes", "Bytes in this worker's WAL not yet replayed.", function=lambda: wal.lag_bytes)
+metrics.gauge("wal_lag_seconds", "Age of the oldest reading not yet replayed.", function=lambda: wal.lag_seconds)
+metrics.gauge("response_cache_entries", "Entries in the response cache.", function=lambda: response_cache.stats()["entries"])
+
+@metrics.track("insert_sensor_data")
 async def insert_sensor_data(sensor):
     """
     Inserts individual sensor data into the database.
 
+    When `INGEST_BUFFER_ENABLED` is set, the reading goes through the write-behind
+    `ingest_buffer` and is persisted with the next bulk insert instead of its own
+    `insert_one`. When `WAL_ENABLED` is set, it is acknowledged once appended to
+    the local write-ahead log (`wal`) and stored when the log is replayed: the
+    response says "Data accepted" and duplicates and late readings are only
+    told apart on replay.
+
     Parameters:
     - sensor (SensorData): Object containing sensor data:
         - equipmentId (str): Unique identifier of the equipment.
@@ -17,15 +237,43 @@ async def insert_sensor_data(sensor):
         - value (float): Sensor value.
 
     Returns:
-    - dict: Success message and ID of the inserted record.
+    - dict: Success message and ID of the inserted record. A reading already
+      stored (same equipmentId and timestamp, e.g. a device retry) is not
+      stored again: the message says so and there is no ID.
 
     Raises:
+    - HTTPException (422): If the reading is older than the station's reorder window.
+    - HTTPException (503): If the ingest buffer or the write-ahead log is full.
     - HTTPException (500): If an error occurs while inserting the data.
     """
     try:
-        result = await db["sensors"].insert_one(sensor.dict())
-        logger.info(f"Data inserted for equipmentId {sensor.equipmentId}.")
-        return {"message": "Data inserted", "id": str(result.inserted_id)}
+        doc = sensor.dict()
+        doc["_id"] = ObjectId()
+        if settings.WAL_ENABLED:
+            await wal.append(doc)
+            logger.debug("Data accepted for equipmentId %s.", sensor.equipmentId)
+            return {"message": "Data accepted", "id": str(doc["_id"])}
+        if settings.INGEST_BUFFER_ENABLED:
+            skipped = await ingest_buffer.submit(doc)
+        else:
+            skipped = (await _write_readings([doc])).get(0)
+        if skipped == LATE:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=LATE_MESSAGE)
+        if skipped == DUPLICATE:
+            logger.debug("Duplicate reading for equipmentId %s.", sensor.equipmentId)
+            return {"message": "Data already stored", "id": None}
+        # Caminho quente: formatação preguiçosa, só quando DEBUG está ativo
+        logger.debug("Data inserted for equipmentId %s.", sensor.equipmentId)
+        return {"message": "Data inserted", "id": str(doc["_id"])}
+    except HTTPException:
+        raise
+    except (IngestBufferFull, WALFull) as e:
+        logger.warning(f"{e} Rejecting reading.")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest queue is full. Retry later.",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.error(f"Error inserting data: {e}")
         raise HTTPException(
@@ -33,44 +281,198 @@ async def insert_sensor_data(sensor):
             detail="Internal server error."
         )
 
-async def process_csv_upload(file: UploadFile):
+@metrics.track("insert_sensor_batch")
+async def insert_sensor_batch(body: bytes, content_type: str):
     """
-    Processes a CSV file and inserts the data into the database.
+    Inserts a batch of readings sent by a gateway in a single unordered bulk write.
+
+    The body is a JSON array, NDJSON, a msgpack array or fixed-width binary
+    records (see `utils.batch_decoder`). Items are validated in bulk, without a
+    Pydantic model per reading; invalid items are reported and the valid ones
+    are still inserted.
 
     Parameters:
-    - file (UploadFile): CSV file uploaded by the client.
+    - body (bytes): Request body.
+    - content_type (str): Content-Type header of the request.
 
     Returns:
-    - dict: Success message and the number of records inserted.
+    - dict: `inserted_count`, `duplicate_count`, `rejected_count` and one result
+      per item, in order (`{"index", "status": "inserted", "id"}`,
+      `{"index", "status": "duplicate"}` for a reading already stored, or
+      `{"index", "status": "rejected", "error"}`, late readings included).
 
     Raises:
-    - HTTPException (400): If the CSV has an invalid format.
-    - HTTPException (500): If an error occurs during processing or insertion.
-
-    Example of CSV format:
-    - Columns: equipmentId, timestamp, value
-    - Values: EQ-12345, 2024-12-05T15:00:00.000Z, 42.75
+    - HTTPException (400): If the body cannot be decoded.
+    - HTTPException (413): If the body exceeds `BATCH_MAX_BYTES` or has more than `BATCH_MAX_ITEMS` items.
+    - HTTPException (415): If the Content-Type is not supported.
+    - HTTPException (500): If the bulk write fails as a whole.
     """
+    kind = media_type(content_type)
+    if kind is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Unsupported Content-Type. Use application/json, application/x-ndjson, "
+                   "application/msgpack or application/octet-stream."
+        )
+    if len(body) > settings.BATCH_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch body is larger than {settings.BATCH_MAX_BYTES} bytes."
+        )
     try:
-        data = await file.read()
-        parsed_data = parse_csv(data)
-        if not parsed_data:
-            logger.warning("Invalid CSV format received.")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid CSV format."
-            )
-        
-        result = await db["sensors"].insert_many(parsed_data)
-        logger.info(f"CSV processed successfully. Inserted {len(result.inserted_ids)} records.")
-        return {"message": "CSV processed", "inserted_count": len(result.inserted_ids)}
-    except Exception as e:
-        logger.error(f"Error processing CSV: {e}")
+        docs, errors = await asyncio.to_thread(decode_batch, body, kind)
+    except BatchFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if len(docs) > settings.BATCH_MAX_ITEMS:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Internal server error."
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch has {len(docs)} readings; the limit is {settings.BATCH_MAX_ITEMS}."
         )
+    BATCH_REQUEST_SIZE.labels().observe(len(docs))
+
+    results = [{"index": error["index"], "status": "rejected", "error": error["error"]} for error in errors]
+    indexes = []
+    valid = []
+    for index, doc in enumerate(docs):
+        if doc is not None:
+            doc["_id"] = ObjectId()
+            indexes.append(index)
+            valid.append(doc)
+
+    failed = {}
+    skipped = {}
+    if valid:
+        try:
+            skipped = await _write_readings(valid)
+        except BulkWriteError as e:
+            # Com ordered=False apenas os itens de writeErrors não foram gravados
+            failed = {error["index"]: error.get("errmsg", "write error") for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            logger.error(f"Error inserting batch of {len(valid)} readings: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Internal server error."
+            )
 
+    for position, (index, doc) in enumerate(zip(indexes, valid)):
+        if position in failed:
+            results.append({"index": index, "status": "rejected", "error": failed[position]})
+        elif skipped.get(position) == LATE:
+            failed[position] = LATE_MESSAGE
+            results.append({"index": index, "status": "rejected", "error": LATE_MESSAGE})
+        elif skipped.get(position) == DUPLICATE:
+            results.append({"index": index, "status": "duplicate"})
+        else:
+            results.append({"index": index, "status": "inserted", "id": str(doc["_id"])})
+    results.sort(key=lambda result: result["index"])
+
+    duplicates = sum(1 for reason in skipped.values() if reason == DUPLICATE)
+    inserted = len(valid) - len(failed) - duplicates
+    rejected = len(results) - inserted - duplicates
+    logger.info("Batch ingested: %d inserted, %d duplicates, %d rejected.", inserted, duplicates, rejected)
+    return {"inserted_count": inserted, "duplicate_count": duplicates, "rejected_count": rejected, "results": results}
+
+class CSVImportError(Exception):
+    """
+    Raised when a batch fails to be written in the middle of a CSV import.
+
+    The import is not atomic: batches written before the failure stay stored.
+    `totals` holds the counts up to the failure, so the client can tell what was
+    stored instead of re-uploading the whole file.
+    """
+
+    def __init__(self, totals: dict, cause: Exception):
+        super().__init__(str(cause))
+        self.totals = totals
+
+if settings.CSV_PARSER not in PARSERS:
+    raise ValueError(f"Unknown CSV_PARSER {settings.CSV_PARSER!r}; use one of {', '.join(PARSERS)}.")
+
+# Processos da decodificação de CSV (CSV_PARSE_PROCESSES). "spawn": os filhos não
+# herdam o event loop nem o cliente do banco do worker
+csv_pool = ProcessPoolExecutor(
+    settings.CSV_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+) if settings.CSV_PARSE_PROCESSES else None
+
+async def _parse_chunk(parser: CSVStreamParser, chunk: bytes):
+    """Parses a chunk (`b""` at the end of the file) off the event loop, across `csv_pool` when set."""
+    if csv_pool is None or not isinstance(parser, ColumnarCSVParser):
+        if chunk:
+            return await asyncio.to_thread(parser.feed, chunk)
+        return await asyncio.to_thread(parser.close)
+    parts = settings.CSV_PARSE_PROCESSES
+    if chunk:
+        blocks, errors = await asyncio.to_thread(parser.split, chunk, parts)
+    else:
+        blocks, errors = await asyncio.to_thread(parser.split_last, parts)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*[loop.run_in_executor(csv_pool, parse_block, *block) for block in blocks])
+    return parser.merge(results, errors)
+
+@metrics.track("import_csv_stream")
+async def import_csv_stream(read_chunk, parser: CSVStreamParser, on_chunk=None):
+    """
+    Streams a CSV through `parser` and inserts the parsed rows in bounded batches.
+
+    Each chunk is parsed in a worker thread (or, with a `ColumnarCSVParser` and
+    `CSV_PARSE_PROCESSES`, split across the `csv_pool` processes) so the event
+    loop keeps serving other requests, and every row parsed from a chunk is
+    written before the next chunk is read. Memory use is therefore bounded by
+    `CSV_READ_CHUNK_SIZE`, whatever the size of the file. Columnar chunks only
+    become documents one `CSV_BATCH_SIZE` batch at a time, right before the insert.
+
+    Parameters:
+    - read_chunk (callable): Coroutine `read_chunk(size) -> bytes`, returning `b""` at EOF.
+    - parser (CSVStreamParser): Parser positioned where reading starts.
+    - on_chunk (callable, optional): Coroutine called with the running totals after
+      every row of a chunk has been written. At that point everything before
+      `parser.offset` is stored, so it is a safe point to resume from.
+
+    Returns:
+    - dict: `inserted_count`, `duplicate_count` (rows already stored, e.g. when
+      a file is imported again), `rejected_count` (late rows included) and the
+      first `CSV_MAX_REPORTED_ERRORS` row errors.
+
+    Raises:
+    - CSVFormatError: If the header is invalid or the file is empty.
+    - CSVImportError: If a batch fails to be written; carries the totals so far.
+    """
+    totals = {"inserted_count": 0, "duplicate_count": 0, "rejected_count": 0, "errors": []}
+    eof = False
+    while not eof:
+        chunk = await read_chunk(settings.CSV_READ_CHUNK_SIZE)
+        rows, errors = await _parse_chunk(parser, chunk)
+        eof = not chunk
+
+        totals["rejected_count"] += len(errors)
+        room = settings.CSV_MAX_REPORTED_ERRORS - len(totals["errors"])
+        if room > 0:
+            totals["errors"].extend(errors[:room])
+
+        for i in range(0, len(rows), settings.CSV_BATCH_SIZE):
+            batch = rows[i:i + settings.CSV_BATCH_SIZE]
+            if isinstance(batch, ReadingColumns):
+                batch = batch.to_documents()
+            try:
+                skipped = await _write_readings(batch)
+            except BulkWriteError as e:
+                # Com ordered=False os demais documentos do lote foram gravados (ou eram duplicatas)
+                rejected = len(e.details.get("writeErrors", []))
+                totals["inserted_count"] += len(batch) - rejected
+                raise CSVImportError(totals, e)
+            except Exception as e:
+                raise CSVImportError(totals, e)
+            late = sum(1 for reason in skipped.values() if reason == LATE)
+            totals["inserted_count"] += len(batch) - len(skipped)
+            totals["duplicate_count"] += len(skipped) - late
+            totals["rejected_count"] += late
+
+        if on_chunk is not None:
+            await on_chunk(totals)
+    return totals
+
+@response_cache.cached("average", station_arg="equipmentId")
+@metrics.track("calculate_average")
 async def calculate_average(equipmentId: str, period: str):
     """
     Calculates the average values of a sensor within a specific period.
@@ -82,6 +484,7 @@ async def calculate_average(equipmentId: str, period: str):
         - "48h": Last 48 hours.
         - "1w": Last week.
         - "1m": Last month.
+        - "1y": Last year (older readings come from the retention rollups).
 
     Returns:
     - dict: Average values for the specified equipment and period:
@@ -91,34 +494,23 @@ async def calculate_average(equipmentId: str, period: str):
     Raises:
     - HTTPException (400): If the provided period is invalid.
     - HTTPException (500): If an error occurs during the query or calculation.
+    - HTTPException (503): If the query exceeds its time budget (`QUERY_<TYPE>_MAX_TIME_MS`).
     """
     try:
-        now = datetime.utcnow()
-        period_mapping = {
-            "24h": now - timedelta(hours=24),
-            "48h": now - timedelta(hours=48),
-            "1w": now - timedelta(weeks=1),
-            "1m": now - timedelta(days=30),
-        }
+        start_time = _period_start(period)
+        summary = await storage.summarize(equipmentId, start_time)
 
-        if period not in period_mapping:
-            logger.warning(f"Invalid period: {period}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid period. Use '24h', '48h', '1w', or '1m'."
-            )
-
-        start_time = period_mapping[period]
-        cursor = db["sensors"].find({"equipmentId": equipmentId, "timestamp": {"$gte": start_time}})
-        values = [doc["value"] async for doc in cursor]
-
-        if not values:
-            logger.info(f"No data found for equipmentId {equipmentId} in period {period}.")
+        if not summary["count"]:
+            logger.debug("No data found for equipmentId %s in period %s.", equipmentId, period)
             return {"equipmentId": equipmentId, "average": None}
 
-        average = sum(values) / len(values)
-        logger.info(f"Average calculated for equipmentId {equipmentId} in period {period}: {average}")
+        average = aggregates.average(summary)
+        logger.debug("Average calculated for equipmentId %s in period %s: %s", equipmentId, period, average)
         return {"equipmentId": equipmentId, "average": average}
+    except HTTPException:
+        raise
+    except ExecutionTimeout as e:
+        raise _over_budget("average", e)
     except Exception as e:
         logger.error(f"Error calculating average: {e}")
         raise HTTPException(
@@ -126,12 +518,59 @@ async def calculate_average(equipmentId: str, period: str):
             detail="Internal server error."
         )
 
-async def get_average_all_stations(period: str):
+async def _partition_averages(start_time: datetime, min_average: Optional[float] = None,
+                              max_average: Optional[float] = None):
+    """
+    Async generator of the station averages, one list per equipmentId range.
+
+    The stations are split into `AVERAGES_PARTITIONS` ranges (`storage.station_ranges`)
+    whose count/sum summaries are queried at most `AVERAGES_CONCURRENCY` at a time;
+    each range is yielded as soon as its query completes, keeping only the
+    averages within `[min_average, max_average]`.
+    """
+    ranges = await storage.station_ranges(start_time, settings.AVERAGES_PARTITIONS)
+    limit = asyncio.Semaphore(max(settings.AVERAGES_CONCURRENCY, 1))
+
+    async def summarize(low, high):
+        async with limit:
+            return await storage.summaries(start_time, low, high)
+
+    tasks = [asyncio.ensure_future(summarize(low, high)) for low, high in ranges]
+    try:
+        for done in asyncio.as_completed(tasks):
+            averages = []
+            for equipment_id, summary in (await done).items():
+                average = aggregates.average(summary)
+                if average is None or (min_average is not None and average < min_average) \
+                        or (max_average is not None and average > max_average):
+                    continue
+                averages.append({"equipmentId": equipment_id, "average": average})
+            yield averages
+    finally:
+        # Uma faixa que falhou (ou um cliente que desconectou) cancela as que faltam
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _top_averages(best: list, averages: list, top_k: int) -> list:
+    return heapq.nlargest(top_k, best + averages, key=lambda row: row["average"])
+
+@response_cache.cached("averages")
+@metrics.track("get_average_all_stations")
+async def get_average_all_stations(period: str, top_k: Optional[int] = None, min_average: Optional[float] = None,
+                                   max_average: Optional[float] = None):
     """
     Calculates the average values for all stations within the specified period.
 
+    The stations are queried in concurrent equipmentId ranges (see
+    `_partition_averages`); with `top_k` each range only adds its best
+    stations to the result, so memory holds `top_k` rows instead of every station.
+
     Parameters:
-    - period (str): Time interval (24h, 48h, 1w, 1m).
+    - period (str): Time interval (24h, 48h, 1w, 1m, 1y).
+    - top_k (int, optional): Only the `top_k` stations with the highest averages, highest first.
+    - min_average (float, optional): Only stations whose average is at least this.
+    - max_average (float, optional): Only stations whose average is at most this.
 
     Returns:
     - list[dict]: A list of dictionaries containing equipmentId and the average.
@@ -139,85 +578,415 @@ async def get_average_all_stations(period: str):
     Raises:
     - HTTPException (400): If the provided period is invalid.
     - HTTPException (500): If an error occurs during the query.
+    - HTTPException (503): If the query exceeds its time budget (`QUERY_<TYPE>_MAX_TIME_MS`).
     """
     try:
-        now = datetime.utcnow()
-        period_mapping = {
-            "24h": now - timedelta(hours=24),
-            "48h": now - timedelta(hours=48),
-            "1w": now - timedelta(weeks=1),
-            "1m": now - timedelta(days=30),
+        start_time = _period_start(period)
+
+        results = []
+        async for averages in _partition_averages(start_time, min_average, max_average):
+            if top_k:
+                results = _top_averages(results, averages, top_k)
+            else:
+                results.extend(averages)
+        logger.debug("Fetched average data for %d stations.", len(results))
+        return results
+    except HTTPException:
+        raise
+    except ExecutionTimeout as e:
+        raise _over_budget("averages", e)
+    except Exception as e:
+        logger.error(f"Error fetching station averages: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error."
+        )
+
+def stream_average_all_stations(period: str, top_k: Optional[int] = None, min_average: Optional[float] = None,
+                                max_average: Optional[float] = None):
+    """
+    Streams the averages of all stations as NDJSON, one range of stations at a time.
+
+    Same filters as `get_average_all_stations`. The period is validated before
+    anything is sent; the rows of each equipmentId range are then sent as soon
+    as its query completes, so the first stations arrive before the slowest
+    range finishes. With `top_k` the rows can only be sent once every range is
+    done, highest average first.
+
+    Returns:
+    - AsyncIterator[str]: Chunks of the response body.
+
+    Raises:
+    - HTTPException: 400 for an invalid period.
+    """
+    start_time = _period_start(period)
+
+    async def chunks():
+        best = []
+        try:
+            async for averages in _partition_averages(start_time, min_average, max_average):
+                if top_k:
+                    best = _top_averages(best, averages, top_k)
+                elif averages:
+                    yield "".join(json.dumps(row) + "\n" for row in averages)
+        except Exception as e:
+            # Os cabeçalhos já foram enviados: só resta registrar e encerrar a resposta
+            logger.error(f"Error streaming station averages: {e}")
+            raise
+        if best:
+            yield "".join(json.dumps(row) + "\n" for row in best)
+
+    return chunks()
+
+DOWNSAMPLING_METHODS = ("buckets", "lttb")
+
+def _parse_resolution(resolution: str) -> timedelta:
+    width = _parse_duration(resolution)
+    if width is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid resolution. Use a number followed by 's', 'min', 'h', 'd' or 'w' (e.g. '5min')."
+        )
+    return width
+
+async def _bucketed_values(equipmentId: str, start_time: datetime, width: timedelta):
+    width_ms = max(int(width.total_seconds() * 1000), 1)
+    buckets = await storage.buckets(equipmentId, start_time, width_ms)
+    total = sum(bucket["sum"] for bucket in buckets)
+    count = sum(bucket["count"] for bucket in buckets)
+    values = [
+        {
+            "timestamp": start_time + timedelta(milliseconds=bucket["index"] * width_ms),
+            "value": bucket["value"],
+            "min": bucket["min"],
+            "max": bucket["max"],
+            "count": bucket["count"],
         }
+        for bucket in buckets
+    ]
+    return values, (total / count if count else None)
+
+async def _lttb_values(equipmentId: str, start_time: datetime, max_points: int):
+    timestamps, values = await storage.arrays(equipmentId, start_time)
+    total, count = float(values.sum()), len(values)
+    rollups = await storage.rollups(equipmentId, start_time)
+    if rollups:
+        # Além do horizonte de retenção, cada hora vira um ponto com a sua média
+        total += sum(rollup["sum"] for rollup in rollups)
+        count += sum(rollup["count"] for rollup in rollups)
+        timestamps = np.concatenate([[to_millis(rollup["bucket"]) for rollup in rollups], timestamps]).astype(np.int64)
+        values = np.concatenate([[rollup["sum"] / rollup["count"] for rollup in rollups], values])
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+    if not len(values):
+        return [], None
+    kept = lttb(timestamps - timestamps[0], values, max_points)
+    points = [
+        {"timestamp": from_millis(timestamps[i]), "value": values[i].item()}
+        for i in kept.tolist()
+    ]
+    return points, total / count
+
+@response_cache.cached("station_data", station_arg="equipmentId")
+@metrics.track("get_station_data")
+async def get_station_data(equipmentId: str, period: str, resolution: Optional[str] = None,
+                           max_points: Optional[int] = None, method: str = "buckets"):
+    """
+    Fetches the values and the average for a specific station within a period.
+
+    Without `resolution` and `max_points` every raw value is returned. With
+    either of them the series is downsampled server-side:
+    - "buckets": fixed intervals computed in MongoDB, each with avg (`value`),
+      `min`, `max` and `count`. The interval is `resolution`, or the period
+      split into `max_points` intervals.
+    - "lttb": Largest-Triangle-Three-Buckets selection of at most `max_points`
+      raw points (or period / `resolution`), preserving peaks and dips.
+
+    Periods reaching past the retention horizon are always downsampled, with
+    intervals of at least one hour: the readings before the horizon only exist
+    as hourly rollups (one point per hour for "lttb").
 
-        if period not in period_mapping:
-            logger.warning(f"Invalid period: {period}")
+    Parameters:
+    - equipmentId (str): Station ID.
+    - period (str): Time interval (24h, 48h, 1w, 1m, 1y).
+    - resolution (str, optional): Bucket width, e.g. "30s", "5min", "1h", "1d".
+    - max_points (int, optional): Maximum number of points returned.
+    - method (str): "buckets" or "lttb".
+
+    Returns:
+    - dict: Individual (or downsampled) data and average for the station.
+
+    Raises:
+    - HTTPException: 400 for an invalid period, resolution or method.
+    - HTTPException (503): If the query exceeds its time budget (`QUERY_<TYPE>_MAX_TIME_MS`).
+    """
+    try:
+        start_time = _period_start(period)
+        if method not in DOWNSAMPLING_METHODS:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid period. Use '24h', '48h', '1w', or '1m'."
+                detail="Invalid method. Use 'buckets' or 'lttb'."
             )
-
-        start_time = period_mapping[period]
-
-        pipeline = [
-            {"$match": {"timestamp": {"$gte": start_time}}},
-            {"$group": {"_id": "$equipmentId", "average": {"$avg": "$value"}}},
-        ]
-        cursor = db["sensors"].aggregate(pipeline)
-        results = [{"equipmentId": doc["_id"], "average": doc["average"]} async for doc in cursor]
-        logger.info(f"Fetched average data for {len(results)} stations.")
-        return results
+        width = _parse_resolution(resolution) if resolution else None
+        rolled_up = start_time < retention.raw_horizon()
+
+        if width is None and max_points is None and not rolled_up:
+            # Busca todos os valores da estação
+            values = await storage.values(equipmentId, start_time)
+
+            # Calcula a média
+            average = sum([v["value"] for v in values]) / len(values) if values else None
+
+            return {"equipmentId": equipmentId, "average": average, "values": values}
+
+        span = _period_span(period)
+        limit = settings.DOWNSAMPLE_MAX_POINTS
+        if method == "lttb":
+            points = min(max_points or limit, math.ceil(span / width) if width else limit, limit)
+            values, average = await _lttb_values(equipmentId, start_time, max(points, 3))
+            return {"equipmentId": equipmentId, "average": average, "values": values, "method": method}
+
+        # O intervalo nunca fica menor que o pedido em `resolution` nem gera mais de `limit` buckets
+        width = max(width or timedelta(0), span / min(max_points or limit, limit))
+        if rolled_up:
+            width = max(width, retention.STEPS[retention.HOUR])
+        values, average = await _bucketed_values(equipmentId, start_time, width)
+        return {
+            "equipmentId": equipmentId,
+            "average": average,
+            "values": values,
+            "method": method,
+            "bucket_seconds": width.total_seconds(),
+        }
+    except HTTPException:
+        raise
+    except ExecutionTimeout as e:
+        raise _over_budget("station data", e)
     except Exception as e:
-        logger.error(f"Error fetching station averages: {e}")
+        logger.error(f"Error fetching station data: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error."
         )
 
-async def get_station_data(equipmentId: str, period: str):
+QUERY_STATISTICS = ("count", "mean", "min", "max", "stddev")
+DEFAULT_QUERY_STATS = "count,mean,min,max,stddev,p50,p95,p99"
+
+def _parse_stats(stats: str):
+    """Splits `stats` into names, mapping each `pNN` to its quantile (e.g. p99 -> 0.99)."""
+    names = [name.strip().lower() for name in stats.split(",") if name.strip()]
+    quantiles = {}
+    for name in names:
+        match = re.fullmatch(r"p(\d{1,2}(?:\.\d+)?|100)", name)
+        if match:
+            quantiles[name] = float(match.group(1)) / 100
+        elif name not in QUERY_STATISTICS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid statistic: {name}. Use {', '.join(QUERY_STATISTICS)} or a percentile such as p95."
+            )
+    if not names:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No statistics requested.")
+    return names, quantiles
+
+@response_cache.cached("query", station_arg="equipmentId")
+@metrics.track("query_statistics")
+async def query_statistics(equipmentId: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           duration: Optional[str] = None, group_by: Optional[str] = None,
+                           stats: str = DEFAULT_QUERY_STATS):
     """
-    Fetches all values and the average for a specific station within a period.
+    Computes statistics of a station over an arbitrary time range, optionally per interval.
+
+    The readings of `[start, end)` are read once and every statistic is computed
+    from the same arrays with NumPy (`utils.statistics`). Percentiles come from
+    a mergeable `QuantileSketch` (within 1% of the exact value); rolled-up hours
+    past the retention horizon contribute their stored sketches, so long
+    windows do not need the raw readings.
 
     Parameters:
     - equipmentId (str): Station ID.
-    - period (str): Time interval (24h, 48h, 1w, 1m).
+    - start (datetime, optional): Start of the range.
+    - end (datetime, optional): End of the range (default: now).
+    - duration (str, optional): Range ending at `end` when `start` is omitted
+      (a period such as "1w" or a duration such as "36h").
+    - group_by (str, optional): Interval width (e.g. "15min", "1d"). Without it
+      the whole range is one group.
+    - stats (str): Comma-separated list of count, mean, min, max, stddev and pNN.
 
     Returns:
-    - dict: Individual data and average for the station.
+    - dict: The range and one entry per non-empty group, with its `start` and
+      the requested statistics.
+
+    Raises:
+    - HTTPException: 400 for an invalid range, interval or statistic.
+    - HTTPException (500): If an error occurs during the query.
+    - HTTPException (503): If the query exceeds its time budget (`QUERY_<TYPE>_MAX_TIME_MS`).
     """
     try:
-        now = datetime.utcnow()
-        period_mapping = {
-            "24h": now - timedelta(hours=24),
-            "48h": now - timedelta(hours=48),
-            "1w": now - timedelta(weeks=1),
-            "1m": now - timedelta(days=30),
-        }
-
-        if period not in period_mapping:
-            logger.warning(f"Invalid period: {period}")
+        end_time = aggregates.to_utc_naive(end) if end else datetime.utcnow()
+        if start is not None:
+            start_time = aggregates.to_utc_naive(start)
+        elif duration:
+            start_time = end_time - _period_span(duration)
+        else:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provide start or duration.")
+        if start_time >= end_time:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end.")
+        names, quantiles = _parse_stats(stats)
+
+        width = _parse_resolution(group_by) if group_by else end_time - start_time
+        if (end_time - start_time) / width > settings.DOWNSAMPLE_MAX_POINTS:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid period. Use '24h', '48h', '1w', or '1m'."
+                detail=f"group_by is too small: at most {settings.DOWNSAMPLE_MAX_POINTS} groups per query."
             )
+        start_ms = to_millis(start_time)
+        width_ms = max(int(width.total_seconds() * 1000), 1)
+
+        times, values = await storage.arrays(equipmentId, start_time, end_time)
+        rollups = [
+            {**rollup, "timestamp": to_millis(rollup["bucket"])}
+            for rollup in await storage.rollups(equipmentId, start_time, end_time)
+        ]
+        groups = grouped_statistics(times, values, start_ms, width_ms, rollups)
+
+        results = []
+        for group in groups:
+            result = {"start": from_millis(start_ms + group["index"] * width_ms)}
+            for name in names:
+                result[name] = group["sketch"].quantile(quantiles[name]) if name in quantiles else group[name]
+            results.append(result)
+        logger.debug("Computed %d statistics over %d groups for equipmentId %s.", len(names), len(results), equipmentId)
+        return {
+            "equipmentId": equipmentId,
+            "start": start_time,
+            "end": end_time,
+            "group_by_seconds": width.total_seconds(),
+            "groups": results,
+        }
+    except HTTPException:
+        raise
+    except ExecutionTimeout as e:
+        raise _over_budget("statistics", e)
+    except Exception as e:
+        logger.error(f"Error querying statistics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error."
+        )
 
-        start_time = period_mapping[period]
+def _encode_cursor(doc: dict) -> str:
+    key = {"t": doc["timestamp"].isoformat(), "id": doc["id"]}
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
 
-        # Busca todos os valores da estação
-        cursor = db["sensors"].find(
-            {"equipmentId": equipmentId, "timestamp": {"$gte": start_time}},
-            {"_id": 0, "timestamp": 1, "value": 1}
+def _decode_cursor(cursor: str):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(key["t"]), key["id"]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
         )
-        values = [doc async for doc in cursor]
 
-        # Calcula a média
-        average = sum([v["value"] for v in values]) / len(values) if values else None
+def _serialize_value(doc: dict) -> str:
+    return json.dumps({"timestamp": doc["timestamp"].isoformat(), "value": doc["value"]})
+
+@metrics.track("get_station_page")
+async def get_station_page(equipmentId: str, period: str, limit: int = None, cursor: Optional[str] = None):
+    """
+    Fetches one page of raw values of a station, ordered by (timestamp, _id).
+
+    Pages are delimited by keyset on (timestamp, id) (with MongoDB, on the
+    (equipmentId, timestamp, _id) index), so fetching a deep page costs the same
+    as fetching the first one.
 
-        return {"equipmentId": equipmentId, "average": average, "values": values}
+    Parameters:
+    - equipmentId (str): Station ID.
+    - period (str): Time interval (24h, 48h, 1w, 1m, 1y).
+    - limit (int, optional): Page size (defaults to `PAGE_DEFAULT_LIMIT`).
+    - cursor (str, optional): `next_cursor` returned with the previous page.
+
+    Returns:
+    - dict: The values of the page and `next_cursor` (`None` on the last page).
+
+    Raises:
+    - HTTPException: 400 for an invalid period or cursor.
+    - HTTPException (503): If the query exceeds its time budget (`QUERY_<TYPE>_MAX_TIME_MS`).
+    """
+    try:
+        start_time = _period_start(period)
+        limit = min(limit or settings.PAGE_DEFAULT_LIMIT, settings.PAGE_MAX_LIMIT)
+        after = _decode_cursor(cursor) if cursor else None
+
+        # Um documento a mais indica se existe uma próxima página
+        try:
+            docs = await storage.page(equipmentId, start_time, limit + 1, after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor."
+            )
+        next_cursor = _encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        values = [{"timestamp": doc["timestamp"], "value": doc["value"]} for doc in docs[:limit]]
+        return {"equipmentId": equipmentId, "values": values, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except ExecutionTimeout as e:
+        raise _over_budget("page", e)
     except Exception as e:
-        logger.error(f"Error fetching station data: {e}")
+        logger.error(f"Error fetching station page: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error."
         )
 
+EXPORT_FORMATS = ("ndjson", "json")
+
+def export_station_data(equipmentId: str, period: str, fmt: str = "ndjson"):
+    """
+    Streams every raw value of a station in the period as NDJSON or a JSON array.
+
+    The period and format are validated before anything is sent; the returned
+    async generator then reads the storage `EXPORT_BATCH_SIZE` readings at a
+    time and yields one chunk per batch, so with MongoDB memory stays constant
+    whatever the size of the export.
+
+    Parameters:
+    - equipmentId (str): Station ID.
+    - period (str): Time interval (24h, 48h, 1w, 1m, 1y).
+    - fmt (str): "ndjson" (one object per line) or "json" (one array).
+
+    Returns:
+    - AsyncIterator[str]: Chunks of the response body.
 
+    Raises:
+    - HTTPException: 400 for an invalid period or format.
+    """
+    start_time = _period_start(period)
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid format. Use 'ndjson' or 'json'."
+        )
+    batch_size = settings.EXPORT_BATCH_SIZE
+
+    async def chunks():
+        separator = "\n" if fmt == "ndjson" else ","
+        if fmt == "json":
+            yield "["
+        first = True
+        try:
+            async for batch in storage.iter_batches(equipmentId, start_time, batch_size):
+                yield ("" if first else separator) + separator.join(_serialize_value(doc) for doc in batch)
+                first = False
+        except Exception as e:
+            # Os cabeçalhos já foram enviados: só resta registrar e encerrar a resposta
+            logger.error(f"Error exporting station data: {e}")
+            raise
+        if fmt == "json":
+            yield "]"
+        elif not first:
+            yield "\n"
+
+    return chunks()
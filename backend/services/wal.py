@@ -0,0 +1,521 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional
+import bson
+from pymongo.errors import BulkWriteError
+from utils import metrics
+
+logger = logging.getLogger("SensorDataAPI")
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_OFF = "off"
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_OFF)
+
+# Cabeçalho de cada registro: tamanho do documento BSON, CRC32 dele e instante do append (ms)
+RECORD_HEADER = struct.Struct("<IIq")
+# Limite de documento do MongoDB: um tamanho maior só pode ser lixo de um registro pela metade
+MAX_RECORD_BYTES = 16 * 1024 * 1024
+SEGMENT_SUFFIX = ".wal"
+LANE_PREFIX = "lane-"
+
+# Espera entre tentativas de replay enquanto o banco não responde (dobra até o máximo)
+RETRY_MIN_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+
+WAL_APPENDED = metrics.counter("wal_appended_total", "Readings appended to the write-ahead log.")
+WAL_REPLAYED = metrics.counter("wal_replayed_total", "Readings replayed from the write-ahead log into the storage.")
+WAL_REPLAY_REJECTED = metrics.counter(
+    "wal_replay_rejected_total", "Replayed readings the storage rejected for good (e.g. late readings)."
+)
+WAL_REPLAY_FAILURES = metrics.counter("wal_replay_failures_total", "Replay attempts that failed and will be retried.")
+WAL_COMMIT_RECORDS = metrics.histogram(
+    "wal_commit_records", "Readings per write-ahead log group commit.", buckets=metrics.SIZE_BUCKETS
+)
+
+class WALFull(Exception):
+    """Raised when the readings not yet replayed already take `max_bytes` of disk."""
+
+def encode_record(doc: dict, appended_ms: int) -> bytes:
+    payload = bson.encode(doc)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), appended_ms) + payload
+
+def read_records(path: str, offset: int, end: Optional[int], limit: int):
+    """
+    Reads up to `limit` records of a segment from byte `offset` (up to byte `end`
+    when given). A record left half-written by a crash ends the segment.
+
+    Returns:
+    - tuple: `(docs, offset, first_ms, last_ms)`, `offset` being where the next
+      record starts and `*_ms` the append times of the first and last records read.
+    """
+    docs, first_ms, last_ms = [], None, None
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while len(docs) < limit and (end is None or offset < end):
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, crc, appended_ms = RECORD_HEADER.unpack(header)
+            if length > MAX_RECORD_BYTES:
+                break
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            docs.append(bson.decode(payload))
+            first_ms = appended_ms if first_ms is None else first_ms
+            last_ms = appended_ms
+            offset += RECORD_HEADER.size + length
+    return docs, offset, first_ms, last_ms
+
+def _claim(path: str) -> Optional[int]:
+    """Takes the lane's lock file, or returns `None` if another process holds it."""
+    fd = os.open(os.path.join(path, "lock"), os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+class _Lane:
+    """A directory of segments written by one process, with its replay checkpoint."""
+
+    def __init__(self, path: str, lock: int):
+        self.path = path
+        self.lock = lock
+        self.checkpoint = self._load()
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, "checkpoint.json")) as f:
+                checkpoint = json.load(f)
+            return checkpoint["segment"], checkpoint["offset"]
+        except FileNotFoundError:
+            return 0, 0
+
+    def save(self):
+        # Sem fsync: um checkpoint perdido só faz reenviar leituras, que o storage ignora como duplicatas
+        path = os.path.join(self.path, "checkpoint.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"segment": self.checkpoint[0], "offset": self.checkpoint[1]}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def segments(self) -> list:
+        segments = []
+        for name in os.listdir(self.path):
+            seq, ext = os.path.splitext(name)
+            if ext == SEGMENT_SUFFIX and seq.isdigit():
+                segments.append(int(seq))
+        return sorted(segments)
+
+    def segment_path(self, seq: int) -> str:
+        return os.path.join(self.path, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def backlog(self) -> int:
+        """Bytes of the segments not yet replayed."""
+        segment, offset = self.checkpoint
+        total = 0
+        for seq in self.segments():
+            if seq >= segment:
+                total += os.path.getsize(self.segment_path(seq)) - (offset if seq == segment else 0)
+        return max(total, 0)
+
+    def release(self):
+        os.close(self.lock)
+
+class WriteAheadLog:
+    """
+    Durable local write-ahead log for sensor readings, replayed into the storage
+    in the background.
+
+    `append` returns once the reading is in the log, so ingest latency does not
+    depend on the database: while it is slow or restarting, readings pile up on
+    disk and the drainer replays them in bulk when it is back.
+
+    Each process writes its own lane, `<directory>/lane-<n>/`, claimed with a
+    lock file (released by the system if the process dies). A lane is a series
+    of append-only segment files of about `segment_bytes`, each record a BSON
+    reading with its size, CRC32 and append time. Appends are group-committed:
+    the readings that arrive while a write is in flight go in the next single
+    write (and fsync). `fsync` sets when a write is acknowledged:
+
+    - "always": after an fsync of the group (survives a power loss);
+    - "interval": after the write; the log is fsynced every `fsync_interval` seconds;
+    - "off": after the write, leaving fsyncs to the OS (both survive a process crash).
+
+    The drainer replays each lane in order with `flush`, `drain_batch_size`
+    readings at a time, and records how far it got in the lane's checkpoint;
+    segments fully replayed are deleted. A failed replay is retried with a
+    growing pause and the checkpoint stays put, so nothing is lost across a
+    restart; replaying a batch twice is harmless since ingest is idempotent.
+    Lanes left by processes that are gone (e.g. fewer workers after a restart)
+    are claimed and replayed by the drainer of any other process.
+
+    Parameters:
+    - directory (str): Directory holding the lanes.
+    - flush (callable): Coroutine that stores a list of readings.
+    - segment_bytes (int): Size after which a new segment is started.
+    - max_bytes (int): Readings not yet replayed that the lane may hold; `append`
+      raises `WALFull` beyond it.
+    - fsync (str): "always", "interval" or "off".
+    - fsync_interval (float): Seconds between fsyncs with "interval".
+    - group_commit_delay (float): Extra seconds to gather appends into a group.
+    - drain_batch_size (int): Readings per replay.
+    - drain_interval (float): Longest pause between replays when idle.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush: Callable[[List[dict]], Awaitable[object]],
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: str = FSYNC_ALWAYS,
+        fsync_interval: float = 0.1,
+        group_commit_delay: float = 0.0,
+        drain_batch_size: int = 5000,
+        drain_interval: float = 0.1,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown WAL fsync policy: {fsync}. Use one of {', '.join(FSYNC_POLICIES)}.")
+        self.directory = directory
+        self._flush = flush
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.group_commit_delay = group_commit_delay
+        self.drain_batch_size = drain_batch_size
+        self.drain_interval = drain_interval
+        self._lane: Optional[_Lane] = None
+        self._orphans = {}
+        # Segmento ativo (arquivo aberto para append) e seu tamanho
+        self._segment = 0
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._dirty = False
+        # Fim do que já foi gravado: o drainer não lê além dele
+        self._committed = (1, 0)
+        self._backlog = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self._oldest_ms = None
+        self._closing = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._written: Optional[asyncio.Event] = None
+        self._drain_lock: Optional[asyncio.Lock] = None
+        self._tasks = []
+        self._stats = {
+            "appended": 0,
+            "replayed": 0,
+            "rejected": 0,
+            "last_replay_records": 0,
+            "last_replay_seconds": None,
+            "last_error": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    @property
+    def lag_bytes(self) -> int:
+        """Bytes appended and not yet replayed (this process's lane)."""
+        return self._backlog
+
+    @property
+    def lag_seconds(self) -> float:
+        """Age of the oldest reading not yet replayed (approximately, at most)."""
+        if self._oldest_ms is None:
+            return 0.0
+        return max(time.time() - self._oldest_ms / 1000, 0.0)
+
+    def _open_lane(self):
+        os.makedirs(self.directory, exist_ok=True)
+        n = 0
+        while True:
+            path = os.path.join(self.directory, f"{LANE_PREFIX}{n}")
+            os.makedirs(path, exist_ok=True)
+            lock = _claim(path)
+            if lock is not None:
+                break
+            n += 1
+        lane = _Lane(path, lock)
+        segments = lane.segments()
+        # Os segmentos existentes ficam selados: os appends vão para um segmento novo
+        self._segment = max(segments + [lane.checkpoint[0]])
+        self._committed = (self._segment + 1, 0)
+        self._backlog = lane.backlog()
+        self._lane = lane
+        if self._backlog:
+            logger.info(f"WAL {lane.name}: {self._backlog} bytes to replay from a previous run.")
+
+    def start(self):
+        """Claims a lane (once) and starts the committer and the drainer on the running loop."""
+        if self.running and self._tasks[0].get_loop() is asyncio.get_running_loop():
+            return
+        if self._lane is None:
+            self._open_lane()
+        loop = asyncio.get_running_loop()
+        # Appends ainda não gravados de outro event loop não têm mais quem os espere
+        self._pending = [(record, waiter) for record, waiter in self._pending if waiter.get_loop() is loop]
+        self._pending_bytes = sum(len(record) for record, _ in self._pending)
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._written = asyncio.Event()
+        self._drain_lock = asyncio.Lock()
+        if self._pending:
+            self._wakeup.set()
+        self._tasks = [loop.create_task(self._commit_loop()), loop.create_task(self._drain_loop())]
+
+    async def append(self, doc: dict):
+        """
+        Appends a reading to the log, returning once it is committed (see `fsync`).
+
+        Raises:
+        - WALFull: If the readings not yet replayed take `max_bytes`.
+        """
+        self.start()
+        record = encode_record(doc, int(time.time() * 1000))
+        if self._backlog + self._pending_bytes + len(record) > self.max_bytes:
+            raise WALFull("Write-ahead log is full.")
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending.append((record, waiter))
+        self._pending_bytes += len(record)
+        self._wakeup.set()
+        await waiter
+
+    async def stop(self):
+        """
+        Commits the pending appends, stops and releases the lane; the readings
+        not replayed yet are replayed on the next start.
+        """
+        if not self._tasks:
+            return
+        committer, drainer = self._tasks
+        self._closing = True
+        self._wakeup.set()
+        # O flag encerra o drainer mesmo se o cancelamento coincidir com o fim de uma espera
+        self._written.set()
+        drainer.cancel()
+        await asyncio.gather(committer, drainer, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        if self._fd is not None:
+            if self.fsync != FSYNC_OFF:
+                os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        for lane in self._orphans.values():
+            lane.release()
+        self._orphans = {}
+        if self._lane is not None:
+            self._lane.release()
+            self._lane = None
+
+    def _roll(self):
+        if self._fd is not None:
+            if self.fsync != FSYNC_OFF:
+                os.fsync(self._fd)
+            os.close(self._fd)
+        self._segment += 1
+        self._fd = os.open(self._lane.segment_path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._size = 0
+        if self.fsync != FSYNC_OFF:
+            # O arquivo novo só é durável com a entrada do diretório
+            directory = os.open(self._lane.path, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def _write(self, data: bytes):
+        if self._fd is None or self._size >= self.segment_bytes:
+            self._roll()
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self._size += len(data)
+        if self.fsync == FSYNC_ALWAYS:
+            os.fsync(self._fd)
+        else:
+            self._dirty = self.fsync == FSYNC_INTERVAL
+        return self._segment, self._size
+
+    def _sync(self):
+        if self._dirty and self._fd is not None:
+            os.fsync(self._fd)
+        self._dirty = False
+
+    async def _commit_loop(self):
+        while not (self._closing and not self._pending):
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.fsync_interval if self._dirty else None)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._sync)
+                continue
+            if self.group_commit_delay and not self._closing:
+                await asyncio.sleep(self.group_commit_delay)
+            self._wakeup.clear()
+            batch, self._pending, self._pending_bytes = self._pending, [], 0
+            if not batch:
+                continue
+            data = b"".join(record for record, _ in batch)
+            try:
+                self._committed = await asyncio.to_thread(self._write, data)
+            except Exception as e:
+                logger.error(f"Error appending {len(batch)} readings to the WAL: {e}")
+                for _, waiter in batch:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            self._backlog += len(data)
+            if self._oldest_ms is None:
+                self._oldest_ms = RECORD_HEADER.unpack_from(data)[2]
+            self._stats["appended"] += len(batch)
+            WAL_APPENDED.labels().inc(len(batch))
+            WAL_COMMIT_RECORDS.labels().observe(len(batch))
+            for _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._written.set()
+
+    async def _drain_loop(self):
+        delay = RETRY_MIN_SECONDS
+        while not self._closing:
+            try:
+                replayed = await self.drain_once()
+            except Exception as e:
+                self._stats["last_error"] = str(e)
+                WAL_REPLAY_FAILURES.labels().inc()
+                logger.warning(f"WAL replay failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+                continue
+            delay = RETRY_MIN_SECONDS
+            if not replayed and not self._closing:
+                self._written.clear()
+                try:
+                    await asyncio.wait_for(self._written.wait(), self.drain_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_once(self) -> int:
+        """Replays one batch, of this process's lane or else of an abandoned one. Returns the readings replayed."""
+        if self._lane is None:
+            self._open_lane()
+        if self._drain_lock is None:
+            self._drain_lock = asyncio.Lock()
+        # Uma chamada direta não replaya o mesmo lote que o drainer
+        async with self._drain_lock:
+            replayed = await self._drain_lane(self._lane, self._committed)
+            if replayed or self._backlog:
+                return replayed
+            return await self._drain_orphans()
+
+    async def _drain_lane(self, lane: _Lane, committed) -> int:
+        """
+        Replays the next batch of `lane`. `committed` is the `(segment, offset)`
+        written so far when the lane is being appended to: later segments are
+        skipped and that one is read up to the offset. Otherwise every segment
+        is sealed.
+        """
+        own = lane is self._lane
+        for seq in await asyncio.to_thread(lane.segments):
+            segment, offset = lane.checkpoint
+            if seq < segment or (committed is not None and seq > committed[0]):
+                continue
+            if seq > segment:
+                offset = 0
+            active = committed is not None and seq == committed[0]
+            path = lane.segment_path(seq)
+            docs, end, first_ms, last_ms = await asyncio.to_thread(
+                read_records, path, offset, committed[1] if active else None, self.drain_batch_size
+            )
+            if docs:
+                if own:
+                    self._oldest_ms = first_ms
+                await self._replay(docs)
+                lane.checkpoint = (seq, end)
+                await asyncio.to_thread(lane.save)
+                if own:
+                    self._backlog -= end - offset
+                    self._oldest_ms = last_ms if self._backlog else None
+                return len(docs)
+            if active:
+                # Em dia com o que foi gravado
+                return 0
+            # Segmento selado lido até o fim (ou até um registro pela metade): sai do disco
+            size = os.path.getsize(path)
+            await asyncio.to_thread(os.remove, path)
+            lane.checkpoint = (seq + 1, 0)
+            await asyncio.to_thread(lane.save)
+            if own:
+                self._backlog = max(self._backlog - (size - offset), 0)
+        return 0
+
+    async def _replay(self, docs):
+        started = time.perf_counter()
+        try:
+            await self._flush(docs)
+        except BulkWriteError as e:
+            # Recusas definitivas (p.ex. leituras atrasadas): as demais foram gravadas, o replay segue
+            rejected = len(e.details.get("writeErrors", []))
+            self._stats["rejected"] += rejected
+            WAL_REPLAY_REJECTED.labels().inc(rejected)
+            logger.error(f"{rejected} of {len(docs)} replayed readings rejected: {e}")
+        seconds = time.perf_counter() - started
+        self._stats["replayed"] += len(docs)
+        self._stats["last_replay_records"] = len(docs)
+        self._stats["last_replay_seconds"] = seconds
+        self._stats["last_error"] = None
+        WAL_REPLAYED.labels().inc(len(docs))
+
+    async def _drain_orphans(self) -> int:
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.startswith(LANE_PREFIX) or path == self._lane.path:
+                continue
+            lane = self._orphans.get(name)
+            if lane is None:
+                lock = _claim(path)
+                if lock is None:
+                    continue
+                lane = self._orphans[name] = _Lane(path, lock)
+            replayed = await self._drain_lane(lane, None)
+            if replayed:
+                return replayed
+            # Lane vazia: libera o lock para um processo que venha a usá-la
+            del self._orphans[name]
+            lane.release()
+        return 0
+
+    def status(self) -> dict:
+        """Returns the configuration, this process's counters and the replay lag."""
+        replay_seconds = self._stats["last_replay_seconds"]
+        return {
+            "running": self.running,
+            "lane": self._lane.name if self._lane else None,
+            "fsync": self.fsync,
+            "segment": self._segment,
+            "lag_bytes": self.lag_bytes,
+            "lag_seconds": self.lag_seconds,
+            "pending_appends": len(self._pending),
+            "orphan_lanes": sorted(self._orphans),
+            **self._stats,
+            "last_replay_rate": self._stats["last_replay_records"] / replay_seconds if replay_seconds else None,
+        }
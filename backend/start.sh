@@ -0,0 +1,7 @@
+#!/bin/sh
+# SERVER_MODE=production: gunicorn com um worker uvicorn por núcleo (gunicorn.conf.py).
+# Qualquer outro valor: uvicorn com --reload, para desenvolvimento.
+if [ "$SERVER_MODE" = "production" ]; then
+    exec gunicorn -c gunicorn.conf.py main:app
+fi
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
@@ -0,0 +1,24 @@
+from storage.base import StorageBackend
+from storage.bucketed import BucketStorage
+from storage.columnar import ColumnarStorage
+from storage.mongo import MongoStorage
+
+BACKENDS = ("mongo", "buckets", "columnar")
+
+def create_storage(backend: str, get_database, columnar_dir: str) -> StorageBackend:
+    """
+    Builds the storage backend selected by `STORAGE_BACKEND`.
+
+    Parameters:
+    - backend (str): "mongo" (one document per reading), "buckets" (one document
+      per station and hour) or "columnar" (local segments).
+    - get_database (callable): Returns the Motor database, for the Mongo backends.
+    - columnar_dir (str): Directory of the columnar segments.
+    """
+    if backend == "mongo":
+        return MongoStorage(get_database)
+    if backend == "buckets":
+        return BucketStorage(get_database)
+    if backend == "columnar":
+        return ColumnarStorage(columnar_dir)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; use one of {', '.join(BACKENDS)}.")
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+import numpy as np
+from services.aggregates import to_utc_naive
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+def to_millis(ts: datetime) -> int:
+    """Milliseconds since the epoch (UTC), the resolution MongoDB keeps dates in."""
+    return (to_utc_naive(ts) - EPOCH) // MILLISECOND
+
+def from_millis(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=int(ms))
+
+def bucketize(times, values, start_ms: int, width_ms: int):
+    """
+    Groups readings into intervals of `width_ms` counted from `start_ms`, with NumPy.
+
+    Returns the list described in `StorageBackend.buckets`.
+    """
+    if not len(times):
+        return []
+    indexes, inverse = np.unique((times - start_ms) // width_ms, return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=values)
+    mins = np.full(len(indexes), np.inf)
+    maxs = np.full(len(indexes), -np.inf)
+    np.minimum.at(mins, inverse, values)
+    np.maximum.at(maxs, inverse, values)
+    return [
+        {"index": index, "value": total / count, "min": low, "max": high, "count": count, "sum": total}
+        for index, count, total, low, high in zip(
+            indexes.tolist(), counts.tolist(), sums.tolist(), mins.tolist(), maxs.tolist()
+        )
+    ]
+
+# Código do MongoDB para violação de índice único
+DUPLICATE_KEY = 11000
+
+def unique_readings(docs):
+    """
+    First reading of each (equipmentId, timestamp) of `docs`, to the millisecond
+    stored. Returns `(readings, positions)`, `positions` mapping each kept
+    reading back to its index in `docs`.
+    """
+    seen = set()
+    readings, positions = [], []
+    for position, doc in enumerate(docs):
+        key = (doc["equipmentId"], to_millis(doc["timestamp"]))
+        if key not in seen:
+            seen.add(key)
+            readings.append(doc)
+            positions.append(position)
+    return readings, positions
+
+# equipmentIds amostrados por faixa pedida em `station_ranges`
+RANGE_SAMPLES = 100
+
+def split_ranges(keys, count: int):
+    """
+    Cuts the sorted `keys` (e.g. a sample of equipmentIds) into up to `count`
+    contiguous `(low, high)` ranges, `low <= key < high`, with about the same
+    number of keys each. The first and last ranges are open (`None`), so the
+    ranges cover every key, sampled or not.
+    """
+    bounds = sorted({keys[len(keys) * i // count] for i in range(1, count)}) if keys else []
+    edges = [None, *bounds, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def station_match(low=None, high=None) -> dict:
+    """MongoDB filter of the equipmentIds in `[low, high)`; `None` leaves that end open."""
+    bounds = {}
+    if low is not None:
+        bounds["$gte"] = low
+    if high is not None:
+        bounds["$lt"] = high
+    return {"equipmentId": bounds} if bounds else {}
+
+class StorageBackend:
+    """
+    Where the readings are stored and how the service queries read them.
+
+    Every method works on readings of one station from `start` (naive UTC) on,
+    except `insert`, `summaries`, `averages` and `station_ranges`.
+    """
+
+    async def insert(self, docs):
+        """
+        Stores readings (`equipmentId`, `timestamp`, `value`, `_id`), idempotently.
+
+        A reading with the equipmentId and timestamp (to the millisecond) of one
+        already stored, or of an earlier one in `docs`, is a duplicate (e.g. a
+        device retrying after a timeout): it is left out of `stored` without
+        being an error.
+
+        Returns:
+        - tuple: `(stored, error)`: the readings actually stored and, on a partial
+          failure, the `BulkWriteError` to re-raise once they have been handled
+          (its `writeErrors` indexes refer to `docs`).
+        """
+        raise NotImplementedError
+
+    async def summarize(self, equipment_id, start):
+        """Returns the `count`/`sum`/`min`/`max` summary of the station."""
+        raise NotImplementedError
+
+    async def summaries(self, start, low=None, high=None):
+        """
+        Returns `{equipmentId: summary}` (`count`/`sum`/`min`/`max`) of every
+        station with readings whose id is in `[low, high)` (`None` = unbounded).
+        """
+        raise NotImplementedError
+
+    async def station_ranges(self, start, count):
+        """
+        Splits the stations into up to `count` equipmentId ranges `(low, high)` for
+        `summaries`, together covering every station and holding about the same
+        number of readings each. Backends that cannot split return one range.
+        """
+        return [(None, None)]
+
+    async def values(self, equipment_id, start):
+        """Returns every `{"timestamp", "value"}` of the station."""
+        raise NotImplementedError
+
+    async def buckets(self, equipment_id, start, width_ms):
+        """
+        Groups the readings into intervals of `width_ms` counted from `start`.
+
+        Returns:
+        - list[dict]: Non-empty intervals in order, with `index` (interval number),
+          `value` (average), `min`, `max`, `count` and `sum`.
+        """
+        raise NotImplementedError
+
+    async def arrays(self, equipment_id, start, end=None):
+        """
+        Returns `(timestamps, values)` NumPy arrays ordered by time (timestamps in
+        epoch ms) of the readings stored individually, before `end` if given.
+        """
+        raise NotImplementedError
+
+    async def rollups(self, equipment_id, start, end=None):
+        """
+        Hourly summaries of the readings no longer stored individually (see
+        `services.retention`): `bucket`, `count`, `sum`, `sumsq`, `min`, `max`
+        and `sketch`, oldest first. Backends without retention have none.
+        """
+        return []
+
+    async def page(self, equipment_id, start, limit, after=None):
+        """
+        Returns up to `limit` readings ordered by (timestamp, id), after the
+        `(timestamp, id)` key `after`, as `{"timestamp", "value", "id"}` where `id`
+        is a string.
+
+        Raises:
+        - ValueError: If the id in `after` is not one this backend produced.
+        """
+        raise NotImplementedError
+
+    async def iter_batches(self, equipment_id, start, batch_size):
+        """Async generator of lists of up to `batch_size` `{"timestamp", "value"}`, ordered by time."""
+        raise NotImplementedError
+        yield
@@ -0,0 +1,348 @@
+import logging
+import numpy as np
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import settings
+from services.aggregates import GRANULARITIES, HOUR, ceil_time, empty_summary, floor_time, merge_summary, to_utc_naive
+from storage import routing
+from storage.base import (
+    DUPLICATE_KEY, MILLISECOND, RANGE_SAMPLES, StorageBackend, bucketize, split_ranges, station_match, to_millis,
+    unique_readings
+)
+
+logger = logging.getLogger("SensorDataAPI")
+
+COLLECTION = "sensor_buckets"
+
+class BucketStorage(StorageBackend):
+    """
+    Readings grouped into one document per equipmentId and UTC hour (bucket pattern).
+
+    A bucket looks like::
+
+        {"equipmentId": "STATION_1", "start": <hour>, "count": 1800, "sum": ..., "min": ..., "max": ...,
+         "readings": [{"t": <timestamp>, "v": <value>, "i": <ObjectId>}, ...]}
+
+    A batch costs one upsert per touched bucket (`$push` of its readings, with
+    `$inc`/`$min`/`$max` keeping the summary), so the collection and its index
+    grow by one entry per station-hour instead of one per reading. Averages
+    read the summaries of the whole hours and only unwind the readings of the
+    first, partial hour of the window; so do intervals (`buckets`), for the
+    hours that fall inside a single interval.
+
+    Readings are kept in arrival order inside a bucket; reads sort them.
+
+    Parameters:
+    - get_database (callable): Returns the Motor database to use, on every operation.
+    - collection (str): Bucket collection (`migrate` writes to a temporary one).
+    """
+
+    def __init__(self, get_database, collection: str = COLLECTION):
+        self._get_database = get_database
+        self._collection = collection
+        self._read_preference = routing.read_preference(
+            settings.ANALYTICS_READ_PREFERENCE, settings.ANALYTICS_MAX_STALENESS_SECONDS
+        )
+
+    @property
+    def collection(self):
+        return self._get_database()[self._collection]
+
+    def _reads(self, query: str):
+        """The bucket collection as read by `query` (see `MongoStorage`)."""
+        reads = routing.route(self._get_database(), self._read_preference, settings.QUERY_BUDGETS.get(query))
+        return reads[self._collection]
+
+    def _push(self, equipment_id, start, readings):
+        """Upsert adding `readings` to their bucket, unless the bucket already holds one of their timestamps."""
+        times = [to_utc_naive(reading["timestamp"]) for reading in readings]
+        values = [reading["value"] for reading in readings]
+        return UpdateOne(
+            # Sem correspondência (timestamp repetido) o upsert bate no índice único de (equipmentId, start)
+            {"equipmentId": equipment_id, "start": start, "readings.t": {"$nin": times}},
+            {
+                "$push": {"readings": {"$each": [
+                    {"t": t, "v": reading["value"], "i": reading["_id"]} for t, reading in zip(times, readings)
+                ]}},
+                "$inc": {"count": len(values), "sum": sum(values)},
+                "$min": {"min": min(values)},
+                "$max": {"max": max(values)},
+            },
+            upsert=True,
+        )
+
+    async def _write(self, operations):
+        """Runs the upserts; returns `{operation index: write error}` of the failed ones."""
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+            return {}, None
+        except BulkWriteError as e:
+            return {error["index"]: error for error in e.details.get("writeErrors", [])}, e
+
+    async def insert(self, docs):
+        readings, positions = unique_readings(docs)
+        for reading in readings:
+            reading.setdefault("_id", ObjectId())
+        grouped = {}
+        for index, reading in enumerate(readings):
+            key = (reading["equipmentId"], floor_time(reading["timestamp"], HOUR))
+            grouped.setdefault(key, []).append(index)
+
+        # Uma operação por bucket; um bucket que já tem algum dos timestamps falha
+        # com chave duplicada e é refeito leitura a leitura, separando as repetidas
+        keys = list(grouped)
+        errors, error = await self._write([
+            self._push(equipment_id, start, [readings[index] for index in grouped[(equipment_id, start)]])
+            for equipment_id, start in keys
+        ])
+        failed = {}
+        retry = []
+        for operation, write_error in errors.items():
+            indexes = grouped[keys[operation]]
+            if write_error.get("code") == DUPLICATE_KEY:
+                retry.extend(indexes)
+            else:
+                # Um bucket que falhou rejeita todas as suas leituras
+                failed.update(dict.fromkeys(indexes, write_error))
+        duplicates = set()
+        if retry:
+            errors, retry_error = await self._write([
+                self._push(readings[index]["equipmentId"], floor_time(readings[index]["timestamp"], HOUR),
+                           [readings[index]])
+                for index in retry
+            ])
+            error = error or retry_error
+            for operation, write_error in errors.items():
+                if write_error.get("code") == DUPLICATE_KEY:
+                    duplicates.add(retry[operation])
+                else:
+                    failed[retry[operation]] = write_error
+
+        stored = [reading for index, reading in enumerate(readings) if index not in failed and index not in duplicates]
+        if not failed and not (error and error.details.get("writeConcernErrors")):
+            return stored, None
+        # Índices das operações traduzidos para os índices das leituras, como num insert_many
+        write_errors = [{**write_error, "index": positions[index]} for index, write_error in sorted(failed.items())]
+        return stored, BulkWriteError({**error.details, "writeErrors": write_errors})
+
+    async def _partial(self, collection, match, start):
+        """Summaries of the readings from `start` on in the bucket holding `start`, by station."""
+        pipeline = [
+            {"$match": {**match, "start": floor_time(start, HOUR)}},
+            {"$unwind": "$readings"},
+            {"$match": {"readings.t": {"$gte": start}}},
+            {"$group": {
+                "_id": "$equipmentId",
+                "count": {"$sum": 1},
+                "sum": {"$sum": "$readings.v"},
+                "min": {"$min": "$readings.v"},
+                "max": {"$max": "$readings.v"},
+            }},
+        ]
+        return [doc async for doc in collection.aggregate(pipeline)]
+
+    async def _whole(self, collection, match, start):
+        """Summaries of the buckets entirely inside the window, by station."""
+        pipeline = [
+            {"$match": {**match, "start": {"$gte": ceil_time(start, HOUR)}}},
+            {"$group": {
+                "_id": "$equipmentId",
+                "count": {"$sum": "$count"},
+                "sum": {"$sum": "$sum"},
+                "min": {"$min": "$min"},
+                "max": {"$max": "$max"},
+            }},
+        ]
+        return [doc async for doc in collection.aggregate(pipeline)]
+
+    async def _summaries(self, match, start, query):
+        collection = self._reads(query)
+        start = to_utc_naive(start)
+        summaries = {}
+        for doc in await self._whole(collection, match, start):
+            merge_summary(summaries.setdefault(doc["_id"], empty_summary()), doc)
+        if floor_time(start, HOUR) != start:
+            for doc in await self._partial(collection, match, start):
+                merge_summary(summaries.setdefault(doc["_id"], empty_summary()), doc)
+        return summaries
+
+    async def summarize(self, equipment_id, start):
+        summaries = await self._summaries({"equipmentId": equipment_id}, start, "average")
+        return summaries.get(equipment_id, empty_summary())
+
+    async def summaries(self, start, low=None, high=None):
+        return await self._summaries(station_match(low, high), start, "averages")
+
+    async def station_ranges(self, start, count):
+        if count <= 1:
+            return [(None, None)]
+        # Cada bucket é uma hora de uma estação: faixas com o mesmo número de horas de dados
+        pipeline = [{"$sample": {"size": count * RANGE_SAMPLES}}, {"$project": {"_id": 0, "equipmentId": 1}}]
+        sample = [doc["equipmentId"] async for doc in self._reads("averages").aggregate(pipeline)]
+        return split_ranges(sorted(sample), count)
+
+    async def _iter_readings(self, equipment_id, start, query, batch_size=64, end=None):
+        """Readings of the station in `[start, end)`, sorted by (timestamp, id), bucket by bucket."""
+        start = to_utc_naive(start)
+        window = {"$gte": floor_time(start, HOUR)}
+        if end is not None:
+            end = to_utc_naive(end)
+            window["$lt"] = end
+        cursor = self._reads(query).find(
+            {"equipmentId": equipment_id, "start": window},
+            {"_id": 0, "readings": 1},
+            sort=[("start", 1)],
+            batch_size=batch_size,
+        )
+        try:
+            async for bucket in cursor:
+                readings = [
+                    reading for reading in bucket["readings"]
+                    if reading["t"] >= start and (end is None or reading["t"] < end)
+                ]
+                readings.sort(key=lambda reading: (reading["t"], reading["i"]))
+                yield readings
+        finally:
+            await cursor.close()
+
+    async def values(self, equipment_id, start):
+        return [
+            {"timestamp": reading["t"], "value": reading["v"]}
+            async for readings in self._iter_readings(equipment_id, start, "station_data")
+            for reading in readings
+        ]
+
+    async def arrays(self, equipment_id, start, end=None):
+        times = []
+        values = []
+        async for readings in self._iter_readings(equipment_id, start, "station_data", end=end):
+            times.extend(to_millis(reading["t"]) for reading in readings)
+            values.extend(reading["v"] for reading in readings)
+        return np.asarray(times, dtype=np.int64), np.asarray(values, dtype=np.float64)
+
+    async def buckets(self, equipment_id, start, width_ms):
+        start = to_utc_naive(start)
+        start_ms = to_millis(start)
+        hour_ms = GRANULARITIES[HOUR] // MILLISECOND
+        reads = self._reads("station_data")
+        # Horas inteiras dentro de um só intervalo entram pelo resumo do bucket, sem ler as leituras
+        merged = {}
+        partial = []
+        cursor = reads.find(
+            {"equipmentId": equipment_id, "start": {"$gte": floor_time(start, HOUR)}},
+            {"_id": 0, "start": 1, "count": 1, "sum": 1, "min": 1, "max": 1},
+            sort=[("start", 1)],
+        )
+        async for bucket in cursor:
+            first = to_millis(bucket["start"])
+            index = (first - start_ms) // width_ms
+            if first < start_ms or (first + hour_ms - 1 - start_ms) // width_ms != index:
+                partial.append(bucket["start"])
+            else:
+                merge_summary(merged.setdefault(index, empty_summary()), bucket)
+
+        # As horas nas bordas (início da janela, limites de intervalo) são expandidas
+        if partial:
+            times, values = [], []
+            cursor = reads.find({"equipmentId": equipment_id, "start": {"$in": partial}}, {"_id": 0, "readings": 1})
+            async for bucket in cursor:
+                for reading in bucket["readings"]:
+                    if reading["t"] >= start:
+                        times.append(to_millis(reading["t"]))
+                        values.append(reading["v"])
+            times = np.asarray(times, dtype=np.int64)
+            for interval in bucketize(times, np.asarray(values, dtype=np.float64), start_ms, width_ms):
+                merge_summary(merged.setdefault(interval.pop("index"), empty_summary()), interval)
+
+        return [
+            {"index": index, "value": summary["sum"] / summary["count"], "min": summary["min"],
+             "max": summary["max"], "count": summary["count"], "sum": summary["sum"]}
+            for index, summary in sorted(merged.items())
+        ]
+
+    async def page(self, equipment_id, start, limit, after=None):
+        if after is not None:
+            timestamp, last_id = after
+            try:
+                after = (to_utc_naive(timestamp), ObjectId(last_id))
+            except (InvalidId, TypeError):
+                raise ValueError(f"Invalid id in cursor: {last_id}")
+            # Os buckets anteriores ao do cursor já foram lidos
+            start = max(to_utc_naive(start), floor_time(after[0], HOUR))
+        page = []
+        async for readings in self._iter_readings(equipment_id, start, "page"):
+            for reading in readings:
+                if after is not None and (reading["t"], reading["i"]) <= after:
+                    continue
+                page.append({"timestamp": reading["t"], "value": reading["v"], "id": str(reading["i"])})
+                if len(page) >= limit:
+                    return page
+        return page
+
+    async def iter_batches(self, equipment_id, start, batch_size):
+        batch = []
+        async for readings in self._iter_readings(equipment_id, start, "export"):
+            for reading in readings:
+                batch.append({"timestamp": reading["t"], "value": reading["v"]})
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+async def migrate(database, batch_size: int = 10000):
+    """
+    Builds the bucket collection from the flat `sensors` collection.
+
+    Run it once, with ingest stopped, before switching `STORAGE_BACKEND` to
+    "buckets". The buckets are written to a temporary collection that replaces
+    `sensor_buckets` at the end, so an interrupted migration can simply be run
+    again. The `sensors` collection is left untouched; drop it once the new
+    layout has been checked.
+
+    Returns:
+    - int: Number of readings migrated.
+    """
+    from config.database import INDEXES
+
+    target = database[f"{COLLECTION}_migration"]
+    await target.drop()
+    # O rename substitui a coleção inteira, inclusive os índices
+    for collection, keys, options in INDEXES:
+        if collection == COLLECTION:
+            await target.create_index(keys, **options)
+    storage = BucketStorage(lambda: database, collection=target.name)
+
+    total = 0
+    batch = []
+    cursor = database["sensors"].find({}, batch_size=batch_size)
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await _migrate_batch(storage, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        await _migrate_batch(storage, batch)
+        total += len(batch)
+
+    if total:
+        await target.rename(COLLECTION, dropTarget=True)
+    logger.info(f"Migrated {total} readings into {COLLECTION}.")
+    return total
+
+async def _migrate_batch(storage, batch):
+    _, error = await storage.insert(batch)
+    if error is not None:
+        raise error
+
+async def _main():
+    from config.database import db
+    await migrate(db)
+
+if __name__ == "__main__":
+    # Uso (com a ingestão parada): python -m storage.bucketed
+    import asyncio
+    asyncio.run(_main())
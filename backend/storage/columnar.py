@@ -0,0 +1,229 @@
+import asyncio
+import os
+import threading
+import numpy as np
+from storage.base import StorageBackend, bucketize, from_millis, split_ranges, to_millis, unique_readings
+
+# Registro de um segmento: timestamp (ms desde a época UTC) e valor, 16 bytes
+RECORD_DTYPE = np.dtype([("t", "<i8"), ("v", "<f8")])
+DAY_MS = 24 * 60 * 60 * 1000
+
+class ColumnarStorage(StorageBackend):
+    """
+    Local append-only columnar store, one directory per equipmentId.
+
+    Readings are packed as 16-byte (timestamp, value) records into one segment
+    file per station and UTC day (`<root>/<hex equipmentId>/<day>.seg`, day
+    counted from the epoch). Reads memory-map only the segments that overlap
+    the requested window, and averages, buckets and ranges are NumPy reductions
+    over those arrays.
+
+    Appends go through a lock and a single `write` per segment, so one process
+    may write while others read; run a single writer process per directory. A
+    record left half-written by a crash is ignored on read, and trimmed before
+    the writer first appends to its segment.
+
+    The `_id` of the documents is not stored: within a segment, readings are
+    identified by their position (used to break ties in `page`). A reading
+    whose timestamp its segment already holds is a duplicate and is not
+    appended; the newest timestamp of each segment is kept in memory, so
+    in-order appends skip that check.
+
+    Parameters:
+    - root (str): Directory holding the segments.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._newest = {}
+        # Segmentos já aparados pelo escritor: só o primeiro append a cada um confere
+        self._trimmed = set()
+
+    def _station_dir(self, equipment_id: str) -> str:
+        return os.path.join(self.root, equipment_id.encode("utf-8").hex())
+
+    def _stations(self):
+        if not os.path.isdir(self.root):
+            return []
+        stations = []
+        for name in os.listdir(self.root):
+            try:
+                stations.append(bytes.fromhex(name).decode("utf-8"))
+            except ValueError:
+                continue
+        return stations
+
+    def _segments(self, equipment_id: str, start_ms: int):
+        directory = self._station_dir(equipment_id)
+        if not os.path.isdir(directory):
+            return []
+        first_day = start_ms // DAY_MS
+        days = []
+        for name in os.listdir(directory):
+            day, ext = os.path.splitext(name)
+            if ext == ".seg" and day.isdigit() and int(day) >= first_day:
+                days.append(int(day))
+        return sorted(days)
+
+    def _map(self, equipment_id: str, day: int):
+        path = os.path.join(self._station_dir(equipment_id), f"{day}.seg")
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def _load(self, equipment_id: str, start_ms: int, with_rows: bool = False, end_ms: int = None):
+        """Timestamps, values (and segment row numbers) in `[start_ms, end_ms)`, unsorted."""
+        times, values, rows = [], [], []
+        for day in self._segments(equipment_id, start_ms):
+            if end_ms is not None and day * DAY_MS >= end_ms:
+                break
+            records = self._map(equipment_id, day)
+            mask = records["t"] >= start_ms
+            if end_ms is not None:
+                mask &= records["t"] < end_ms
+            times.append(np.asarray(records["t"][mask]))
+            values.append(np.asarray(records["v"][mask]))
+            if with_rows:
+                rows.append(np.flatnonzero(mask))
+        if not times:
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, np.empty(0), empty) if with_rows else (empty, np.empty(0))
+        if with_rows:
+            return np.concatenate(times), np.concatenate(values), np.concatenate(rows)
+        return np.concatenate(times), np.concatenate(values)
+
+    def _sorted(self, equipment_id: str, start_ms: int, end_ms: int = None):
+        times, values = self._load(equipment_id, start_ms, end_ms=end_ms)
+        order = np.argsort(times, kind="stable")
+        return times[order], values[order]
+
+    def _fresh(self, equipment_id: str, day: int, path: str, times):
+        """Mask of `times` not yet in the segment; called under the lock."""
+        newest = self._newest.get((equipment_id, day))
+        if newest is None:
+            newest = -1
+            if os.path.exists(path):
+                stored = self._map(equipment_id, day)["t"]
+                newest = int(stored.max()) if len(stored) else -1
+        # Caminho comum (leituras em ordem): tudo mais novo que o segmento, sem lê-lo
+        if times.min() > newest:
+            fresh = np.ones(len(times), dtype=bool)
+        else:
+            fresh = ~np.isin(times, self._map(equipment_id, day)["t"])
+        if fresh.any():
+            newest = max(newest, int(times[fresh].max()))
+        self._newest[(equipment_id, day)] = newest
+        return fresh
+
+    def _trim(self, path: str):
+        """Cuts a torn tail record off the segment; called under the lock, once per segment."""
+        if path in self._trimmed:
+            return
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD_DTYPE.itemsize:
+                os.truncate(path, size - size % RECORD_DTYPE.itemsize)
+        self._trimmed.add(path)
+
+    def _append(self, docs):
+        readings, _ = unique_readings(docs)
+        grouped = {}
+        for index, doc in enumerate(readings):
+            ms = to_millis(doc["timestamp"])
+            grouped.setdefault((doc["equipmentId"], ms // DAY_MS), []).append((ms, doc["value"], index))
+        stored = []
+        with self._lock:
+            for (equipment_id, day), records in grouped.items():
+                directory = self._station_dir(equipment_id)
+                path = os.path.join(directory, f"{day}.seg")
+                times = np.fromiter((record[0] for record in records), dtype=np.int64, count=len(records))
+                fresh = self._fresh(equipment_id, day, path, times)
+                if not fresh.any():
+                    continue
+                os.makedirs(directory, exist_ok=True)
+                records = [record for record, keep in zip(records, fresh.tolist()) if keep]
+                data = np.array([record[:2] for record in records], dtype=RECORD_DTYPE).tobytes()
+                self._trim(path)
+                with open(path, "ab") as f:
+                    f.write(data)
+                stored.extend(record[2] for record in records)
+        return [readings[index] for index in sorted(stored)]
+
+    async def insert(self, docs):
+        return await asyncio.to_thread(self._append, docs), None
+
+    def _summary(self, equipment_id, start_ms):
+        _, values = self._load(equipment_id, start_ms)
+        if not len(values):
+            return {"count": 0, "sum": 0.0, "min": None, "max": None}
+        return {"count": int(len(values)), "sum": float(values.sum()),
+                "min": float(values.min()), "max": float(values.max())}
+
+    async def summarize(self, equipment_id, start):
+        return await asyncio.to_thread(self._summary, equipment_id, to_millis(start))
+
+    def _summaries(self, start_ms, low, high):
+        summaries = {}
+        for equipment_id in self._stations():
+            if (low is not None and equipment_id < low) or (high is not None and equipment_id >= high):
+                continue
+            summary = self._summary(equipment_id, start_ms)
+            if summary["count"]:
+                summaries[equipment_id] = summary
+        return summaries
+
+    async def summaries(self, start, low=None, high=None):
+        return await asyncio.to_thread(self._summaries, to_millis(start), low, high)
+
+    async def station_ranges(self, start, count):
+        if count <= 1:
+            return [(None, None)]
+        return split_ranges(sorted(await asyncio.to_thread(self._stations)), count)
+
+    async def values(self, equipment_id, start):
+        times, values = await self.arrays(equipment_id, start)
+        return [{"timestamp": from_millis(t), "value": v} for t, v in zip(times.tolist(), values.tolist())]
+
+    def _buckets(self, equipment_id, start_ms, width_ms):
+        times, values = self._load(equipment_id, start_ms)
+        return bucketize(times, values, start_ms, width_ms)
+
+    async def buckets(self, equipment_id, start, width_ms):
+        return await asyncio.to_thread(self._buckets, equipment_id, to_millis(start), width_ms)
+
+    async def arrays(self, equipment_id, start, end=None):
+        end_ms = None if end is None else to_millis(end)
+        return await asyncio.to_thread(self._sorted, equipment_id, to_millis(start), end_ms)
+
+    def _page(self, equipment_id, start_ms, limit, after):
+        times, values, rows = self._load(equipment_id, start_ms, with_rows=True)
+        if after is not None:
+            after_ms, after_row = after
+            keep = (times > after_ms) | ((times == after_ms) & (rows > after_row))
+            times, values, rows = times[keep], values[keep], rows[keep]
+        # Leituras com o mesmo timestamp ficam no mesmo segmento: a linha desempata
+        order = np.lexsort((rows, times))[:limit]
+        return [
+            {"timestamp": from_millis(t), "value": v, "id": str(row)}
+            for t, v, row in zip(times[order].tolist(), values[order].tolist(), rows[order].tolist())
+        ]
+
+    async def page(self, equipment_id, start, limit, after=None):
+        if after is not None:
+            timestamp, row = after
+            try:
+                row = int(row)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid id in cursor: {row}")
+            after = (to_millis(timestamp), row)
+        return await asyncio.to_thread(self._page, equipment_id, to_millis(start), limit, after)
+
+    async def iter_batches(self, equipment_id, start, batch_size):
+        times, values = await self.arrays(equipment_id, start)
+        for i in range(0, len(times), batch_size):
+            yield [
+                {"timestamp": from_millis(t), "value": v}
+                for t, v in zip(times[i:i + batch_size].tolist(), values[i:i + batch_size].tolist())
+            ]
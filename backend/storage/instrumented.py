@@ -0,0 +1,108 @@
+import time
+from storage.base import StorageBackend
+from utils import metrics
+
+STORAGE_SECONDS = metrics.histogram(
+    "storage_operation_duration_seconds",
+    "Latency of storage (MongoDB or columnar) operations by calling service function.",
+    ("backend", "function", "operation"),
+)
+
+class InstrumentedStorage(StorageBackend):
+    """
+    Wraps a backend and records the latency of each of its operations.
+
+    Observations are labeled with the backend, the operation and the service
+    function running it (`metrics.track`), so a slow query points at the
+    endpoint that issued it.
+
+    Parameters:
+    - backend (StorageBackend): The wrapped backend.
+    - name (str): Backend label (the `STORAGE_BACKEND` value).
+    """
+
+    def __init__(self, backend: StorageBackend, name: str):
+        self.backend = backend
+        self.name = name
+
+    def _observe(self, operation: str, started: float):
+        STORAGE_SECONDS.labels(self.name, metrics.current_function(), operation).observe(time.perf_counter() - started)
+
+    async def insert(self, docs):
+        started = time.perf_counter()
+        try:
+            return await self.backend.insert(docs)
+        finally:
+            self._observe("insert", started)
+
+    async def summarize(self, equipment_id, start):
+        started = time.perf_counter()
+        try:
+            return await self.backend.summarize(equipment_id, start)
+        finally:
+            self._observe("summarize", started)
+
+    async def summaries(self, start, low=None, high=None):
+        started = time.perf_counter()
+        try:
+            return await self.backend.summaries(start, low, high)
+        finally:
+            self._observe("summaries", started)
+
+    async def station_ranges(self, start, count):
+        started = time.perf_counter()
+        try:
+            return await self.backend.station_ranges(start, count)
+        finally:
+            self._observe("station_ranges", started)
+
+    async def values(self, equipment_id, start):
+        started = time.perf_counter()
+        try:
+            return await self.backend.values(equipment_id, start)
+        finally:
+            self._observe("values", started)
+
+    async def buckets(self, equipment_id, start, width_ms):
+        started = time.perf_counter()
+        try:
+            return await self.backend.buckets(equipment_id, start, width_ms)
+        finally:
+            self._observe("buckets", started)
+
+    async def arrays(self, equipment_id, start, end=None):
+        started = time.perf_counter()
+        try:
+            return await self.backend.arrays(equipment_id, start, end)
+        finally:
+            self._observe("arrays", started)
+
+    async def rollups(self, equipment_id, start, end=None):
+        started = time.perf_counter()
+        try:
+            return await self.backend.rollups(equipment_id, start, end)
+        finally:
+            self._observe("rollups", started)
+
+    async def page(self, equipment_id, start, limit, after=None):
+        started = time.perf_counter()
+        try:
+            return await self.backend.page(equipment_id, start, limit, after)
+        finally:
+            self._observe("page", started)
+
+    async def iter_batches(self, equipment_id, start, batch_size):
+        # Conta só o tempo esperando cada lote, não o tempo do consumidor entre lotes
+        batches = self.backend.iter_batches(equipment_id, start, batch_size)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    batch = await batches.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    self._observe("iter_batches", started)
+                yield batch
+        finally:
+            await batches.aclose()
@@ -0,0 +1,264 @@
+import logging
+import numpy as np
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+from config import settings
+from services import aggregates, retention
+from storage import routing
+from storage.base import (
+    DUPLICATE_KEY, RANGE_SAMPLES, StorageBackend, split_ranges, station_match, to_millis, unique_readings
+)
+
+logger = logging.getLogger("SensorDataAPI")
+
+def _before_horizon(start) -> bool:
+    # Leituras anteriores ao horizonte de retenção só existem nos rollups
+    return aggregates.to_utc_naive(start) < retention.raw_horizon()
+
+class MongoStorage(StorageBackend):
+    """
+    Readings stored one document per point in the `sensors` collection.
+
+    Windows reaching past the retention horizon add the hourly/daily rollups of
+    the readings already removed (see `services.retention`) to summaries and
+    buckets, and return them from `rollups`; arrays, raw values, pages and
+    exports only cover `sensors`.
+
+    Parameters:
+    - get_database (callable): Returns the Motor database to use. It is called on
+      every operation, so replacing the database (as the tests do) takes effect
+      immediately.
+
+    Reads go through `_reads`, with the analytics read preference
+    (`ANALYTICS_READ_PREFERENCE`) and the `QUERY_BUDGETS` entry of their query
+    type; inserts always go to the primary.
+    """
+
+    def __init__(self, get_database):
+        self._get_database = get_database
+        # Validada já na criação: uma read preference inválida impede a subida do app
+        self._read_preference = routing.read_preference(
+            settings.ANALYTICS_READ_PREFERENCE, settings.ANALYTICS_MAX_STALENESS_SECONDS
+        )
+
+    @property
+    def db(self):
+        return self._get_database()
+
+    def _reads(self, query: str) -> routing.ReadRoute:
+        return routing.route(self.db, self._read_preference, settings.QUERY_BUDGETS.get(query))
+
+    async def insert(self, docs):
+        db = self.db
+        readings, positions = unique_readings(docs)
+        try:
+            await db["sensors"].insert_many(readings, ordered=False)
+            stored, error = readings, None
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            rejected = {write_error["index"] for write_error in write_errors}
+            stored = [doc for index, doc in enumerate(readings) if index not in rejected]
+            # Chave duplicada no índice único (equipmentId, timestamp): a leitura já estava gravada
+            failures = [{**write_error, "index": positions[write_error["index"]]}
+                        for write_error in write_errors if write_error.get("code") != DUPLICATE_KEY]
+            error = None
+            if failures or e.details.get("writeConcernErrors"):
+                error = BulkWriteError({**e.details, "writeErrors": failures})
+
+        # Só as leituras gravadas entram nos buckets; uma falha aqui não desfaz a gravação
+        if settings.AGGREGATES_ENABLED and stored:
+            try:
+                await aggregates.record_readings(db, stored)
+            except Exception as e:
+                logger.error(f"Error updating aggregates for {len(stored)} readings: {e}")
+                await aggregates.mark_stale(db, str(e))
+        return stored, error
+
+    async def summarize(self, equipment_id, start):
+        reads = self._reads("average")
+        # Os buckets de agregados nunca são apagados pela retenção: já cobrem tudo
+        if settings.AGGREGATES_ENABLED:
+            return await aggregates.summarize(reads, equipment_id, start)
+        pipeline = [
+            {"$match": {"equipmentId": equipment_id, "timestamp": {"$gte": start}}},
+            aggregates.summary_group(None),
+        ]
+        summary = aggregates.empty_summary()
+        async for doc in reads["sensors"].aggregate(pipeline):
+            aggregates.merge_summary(summary, aggregates.to_summary(doc))
+        if _before_horizon(start):
+            rolled_up = await retention.summarize_rollups(reads, start, equipment_id)
+            aggregates.merge_summary(summary, rolled_up.get(equipment_id))
+        return summary
+
+    async def summaries(self, start, low=None, high=None):
+        reads = self._reads("averages")
+        stations = station_match(low, high)
+        if settings.AGGREGATES_ENABLED:
+            return await aggregates.summarize_all(reads, start, stations)
+        summaries = await retention.summarize_rollups(reads, start, stations=stations) if _before_horizon(start) else {}
+        pipeline = [
+            {"$match": {**stations, "timestamp": {"$gte": start}}},
+            aggregates.summary_group("$equipmentId"),
+        ]
+        async for doc in reads["sensors"].aggregate(pipeline):
+            aggregates.merge_summary(summaries.setdefault(doc["_id"], aggregates.empty_summary()),
+                                     aggregates.to_summary(doc))
+        return summaries
+
+    async def station_ranges(self, start, count):
+        if count <= 1:
+            return [(None, None)]
+        # Amostra aleatória das leituras: faixas com o mesmo volume, não o mesmo número de estações
+        pipeline = [{"$sample": {"size": count * RANGE_SAMPLES}}, {"$project": {"_id": 0, "equipmentId": 1}}]
+        sample = [doc["equipmentId"] async for doc in self._reads("averages")["sensors"].aggregate(pipeline)]
+        return split_ranges(sorted(sample), count)
+
+    async def values(self, equipment_id, start):
+        reads = self._reads("station_data")
+        cursor = reads["sensors"].find(
+            {"equipmentId": equipment_id, "timestamp": {"$gte": start}},
+            {"_id": 0, "timestamp": 1, "value": 1}
+        )
+        return [doc async for doc in cursor]
+
+    async def buckets(self, equipment_id, start, width_ms):
+        reads = self._reads("station_data")
+        # Agrupa no próprio MongoDB em intervalos fixos contados a partir de `start`
+        pipeline = [
+            {"$match": {"equipmentId": equipment_id, "timestamp": {"$gte": start}}},
+            {"$group": {
+                "_id": {"$floor": {"$divide": [{"$subtract": ["$timestamp", start]}, width_ms]}},
+                "value": {"$avg": "$value"},
+                "min": {"$min": "$value"},
+                "max": {"$max": "$value"},
+                "count": {"$sum": 1},
+                "sum": {"$sum": "$value"},
+            }},
+            {"$sort": {"_id": 1}},
+        ]
+        buckets = await reads["sensors"].aggregate(pipeline).to_list(length=None)
+        for bucket in buckets:
+            bucket["index"] = int(bucket.pop("_id"))
+        if not _before_horizon(start):
+            return buckets
+
+        # Cada rollup horário entra no intervalo em que a sua hora começa
+        merged = {bucket["index"]: bucket for bucket in buckets}
+        start_ms = to_millis(start)
+        for rollup in await retention.hourly_rollups(reads, equipment_id, start):
+            index = (to_millis(rollup["bucket"]) - start_ms) // width_ms
+            bucket = merged.setdefault(index, {"index": index, **aggregates.empty_summary()})
+            aggregates.merge_summary(bucket, aggregates.to_summary(rollup))
+        for bucket in merged.values():
+            bucket["value"] = aggregates.average(bucket)
+        return [merged[index] for index in sorted(merged)]
+
+    async def arrays(self, equipment_id, start, end=None):
+        reads = self._reads("station_data")
+        timestamp = {"$gte": start} if end is None else {"$gte": start, "$lt": end}
+        cursor = reads["sensors"].find(
+            {"equipmentId": equipment_id, "timestamp": timestamp},
+            {"_id": 0, "timestamp": 1, "value": 1},
+            sort=[("timestamp", 1)],
+            batch_size=settings.DOWNSAMPLE_FETCH_BATCH_SIZE,
+        )
+        timestamps = []
+        values = []
+        async for doc in cursor:
+            timestamps.append(to_millis(doc["timestamp"]))
+            values.append(doc["value"])
+        return np.asarray(timestamps, dtype=np.int64), np.asarray(values, dtype=np.float64)
+
+    async def rollups(self, equipment_id, start, end=None):
+        if not _before_horizon(start):
+            return []
+        return await retention.hourly_rollups(self._reads("station_data"), equipment_id, start, end)
+
+    async def page(self, equipment_id, start, limit, after=None):
+        reads = self._reads("page")
+        query = {"equipmentId": equipment_id, "timestamp": {"$gte": start}}
+        if after is not None:
+            timestamp, last_id = after
+            try:
+                last_id = ObjectId(last_id)
+            except (InvalidId, TypeError):
+                raise ValueError(f"Invalid id in cursor: {last_id}")
+            query["$or"] = [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": last_id}},
+            ]
+        docs = await reads["sensors"].find(
+            query,
+            {"timestamp": 1, "value": 1},
+            sort=[("timestamp", 1), ("_id", 1)],
+            limit=limit,
+        ).to_list(length=limit)
+        return [{"timestamp": doc["timestamp"], "value": doc["value"], "id": str(doc["_id"])} for doc in docs]
+
+    async def iter_batches(self, equipment_id, start, batch_size):
+        reads = self._reads("export")
+        cursor = reads["sensors"].find(
+            {"equipmentId": equipment_id, "timestamp": {"$gte": start}},
+            {"_id": 0, "timestamp": 1, "value": 1},
+            sort=[("timestamp", 1)],
+            batch_size=batch_size,
+        )
+        batch = []
+        try:
+            async for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            await cursor.close()
+
+async def remove_duplicates(database, batch_size: int = 1000) -> int:
+    """
+    Deletes the repeated readings of `sensors`, keeping the first stored of each
+    (equipmentId, timestamp).
+
+    Readings stored before ingest was idempotent may repeat (device retries), and
+    then the unique index on (equipmentId, timestamp) cannot be created. Run it
+    once, with ingest stopped, before starting the app on such a database.
+
+    Returns:
+    - int: Number of readings deleted.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {"equipmentId": "$equipmentId", "timestamp": "$timestamp"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    repeated = []
+    async for group in database["sensors"].aggregate(pipeline, allowDiskUse=True):
+        repeated.extend(sorted(group["ids"])[1:])
+        if len(repeated) >= batch_size:
+            removed += (await database["sensors"].delete_many({"_id": {"$in": repeated}})).deleted_count
+            repeated = []
+    if repeated:
+        removed += (await database["sensors"].delete_many({"_id": {"$in": repeated}})).deleted_count
+    logger.info(f"Removed {removed} duplicated readings from sensors.")
+    return removed
+
+async def _main():
+    from config.database import db, ensure_indexes
+    await remove_duplicates(db)
+    # Também troca o índice não único antigo de (equipmentId, timestamp) pelo único
+    await ensure_indexes(db)
+    # Os buckets de agregados contaram as duplicatas
+    if settings.AGGREGATES_ENABLED:
+        await aggregates.rebuild(db)
+
+if __name__ == "__main__":
+    # Uso (com a ingestão parada): python -m storage.mongo
+    import asyncio
+    asyncio.run(_main())
@@ -0,0 +1,86 @@
+from typing import Optional
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def read_preference(mode: str, max_staleness_seconds: int = -1):
+    """
+    Builds the PyMongo read preference of `ANALYTICS_READ_PREFERENCE`.
+
+    Returns `None` for "primary", the client default, so those reads use the
+    database as it is.
+
+    Raises:
+    - ValueError: For an unknown mode.
+    """
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}; use one of {', '.join(READ_PREFERENCES)}.")
+    if mode == "primary":
+        return None
+    return READ_PREFERENCES[mode](max_staleness=max_staleness_seconds)
+
+class _RoutedCollection:
+    """Collection whose find/aggregate calls carry the time and disk budget of a query type."""
+
+    def __init__(self, collection, max_time_ms: int, allow_disk_use: bool):
+        self._collection = collection
+        self._max_time_ms = max_time_ms
+        self._allow_disk_use = allow_disk_use
+
+    def aggregate(self, pipeline, **kwargs):
+        if self._max_time_ms:
+            kwargs.setdefault("maxTimeMS", self._max_time_ms)
+        if self._allow_disk_use:
+            kwargs.setdefault("allowDiskUse", True)
+        return self._collection.aggregate(pipeline, **kwargs)
+
+    def find(self, *args, **kwargs):
+        if self._max_time_ms:
+            kwargs.setdefault("max_time_ms", self._max_time_ms)
+        if self._allow_disk_use:
+            kwargs.setdefault("allow_disk_use", True)
+        return self._collection.find(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+class ReadRoute:
+    """
+    Read-only view of a database for one type of analytical query.
+
+    Collections taken from it read with `preference` (e.g. from a secondary,
+    keeping dashboard aggregations off the primary absorbing the ingest) and
+    pass `maxTimeMS`/`allowDiskUse` to every find and aggregate. It only
+    replaces the database in read paths: writes keep using the database itself.
+
+    Parameters:
+    - database: Motor database.
+    - preference: PyMongo read preference, or `None` for the database's own.
+    - max_time_ms (int): Server-side time limit of each command (0 = none);
+      exceeding it raises `pymongo.errors.ExecutionTimeout`.
+    - allow_disk_use (bool): Lets sorts and groups spill to disk past 100 MB.
+    """
+
+    def __init__(self, database, preference=None, max_time_ms: int = 0, allow_disk_use: bool = False):
+        self.database = database
+        self.preference = preference
+        self.max_time_ms = max_time_ms
+        self.allow_disk_use = allow_disk_use
+
+    def __getitem__(self, name: str):
+        if self.preference is None:
+            collection = self.database[name]
+        else:
+            collection = self.database.get_collection(name, read_preference=self.preference)
+        return _RoutedCollection(collection, self.max_time_ms, self.allow_disk_use)
+
+def route(database, preference, budget: Optional[dict]) -> ReadRoute:
+    """Read view of `database` with `preference` and a `QUERY_BUDGETS` entry."""
+    budget = budget or {}
+    return ReadRoute(database, preference, budget.get("max_time_ms", 0), budget.get("allow_disk_use", False))
@@ -5,6 +5,13 @@ from httpx import AsyncClient
 from main import app
 import services.sensors_service
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # Cada teste usa um banco novo: respostas de outro teste não podem ser servidas
+    services.sensors_service.response_cache.clear()
+    yield
+    services.sensors_service.response_cache.clear()
+
 @pytest_asyncio.fixture
 async def mock_db():
     client = AsyncMongoMockClient()
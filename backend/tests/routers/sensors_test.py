@@ -1,4 +1,12 @@
+import asyncio
+import json
+import msgpack
 from datetime import datetime
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from main import app
+from services.import_jobs import import_jobs
+import services.sensors_service
 from utils.auth import create_access_token
 import pytest
 
@@ -18,14 +26,38 @@ async def test_create_sensor_data(client, valid_token):
     assert response.status_code == 201
     assert response.json()["message"] == "Data inserted"
 
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_jobs, "spool_dir", str(tmp_path))
+    return tmp_path
+
+async def wait_for_job(client, job_id, headers):
+    for _ in range(100):
+        response = await client.get(f"/sensors/upload/{job_id}", headers=headers)
+        if response.json()["status"] not in ("queued", "running"):
+            return response
+        await asyncio.sleep(0.02)
+    raise AssertionError("Import job did not finish.")
+
 @pytest.mark.asyncio
-async def test_upload_csv(client, valid_token):
+async def test_upload_csv(client, valid_token, spool_dir):
     headers = {"Authorization": f"Bearer {valid_token}"}
     csv_content = "equipmentId,timestamp,value\nSTATION_1,2024-12-06T12:00:00+00:00,25.0\nSTATION_2,2024-12-06T12:00:00+00:00,30.0"
     files = {"file": ("data.csv", csv_content)}
     response = await client.post("/sensors/upload", files=files, headers=headers)
     assert response.status_code == 202
-    assert "inserted_count" in response.json()
+    assert "job_id" in response.json()
+
+    status_response = await wait_for_job(client, response.json()["job_id"], headers)
+    assert status_response.status_code == 200
+    assert status_response.json()["status"] == "completed"
+    assert status_response.json()["inserted_count"] == 2
+
+@pytest.mark.asyncio
+async def test_upload_status_unknown_job(client, valid_token, spool_dir):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    response = await client.get("/sensors/upload/0123456789abcdef0123456789abcdef", headers=headers)
+    assert response.status_code == 404
 
 @pytest.mark.asyncio
 async def test_get_average(client, valid_token):
@@ -44,6 +76,25 @@ async def test_fetch_average_all_stations(client, valid_token):
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+@pytest.mark.asyncio
+async def test_fetch_average_all_stations_streams_top_k(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    readings = [[f"STATION_TOP_{i}", datetime.utcnow().isoformat(), float(1000 + i)] for i in range(5)]
+    await client.post("/sensors/batch", json=readings, headers=headers)
+
+    response = await client.get("/sensors/averages?period=24h&top_k=2&min_average=1000&format=ndjson", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["equipmentId"] for line in response.text.splitlines()] == ["STATION_TOP_4", "STATION_TOP_3"]
+
+@pytest.mark.asyncio
+async def test_get_alerts(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    response = await client.get("/sensors/alerts?equipmentId=STATION_1&limit=10", headers=headers)
+    assert response.status_code == 200
+    assert set(response.json()) == {"rules", "active", "events"}
+
 @pytest.mark.asyncio
 async def test_fetch_station_data(client, valid_token):
     headers = {"Authorization": f"Bearer {valid_token}"}
@@ -53,3 +104,106 @@ async def test_fetch_station_data(client, valid_token):
     assert response.status_code == 200
     assert "values" in response.json()
     assert "average" in response.json()
+
+@pytest.fixture
+def ws_client(monkeypatch):
+    # Sem os eventos de startup/shutdown (índices e jobs precisam de um MongoDB real)
+    monkeypatch.setattr(app.router, "on_startup", [])
+    monkeypatch.setattr(app.router, "on_shutdown", [])
+    with TestClient(app) as test_client:
+        yield test_client
+
+def test_websocket_receives_new_readings(mock_db, valid_token, ws_client):
+    services.sensors_service.db = mock_db
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    with ws_client.websocket_connect(f"/sensors/ws?token={valid_token}&equipmentId=STATION_WS") as websocket:
+        payload = {"equipmentId": "STATION_WS", "timestamp": datetime.utcnow().isoformat(), "value": 12.5}
+        assert ws_client.post("/sensors/data", json=payload, headers=headers).status_code == 201
+        event = websocket.receive_json()
+    assert event["equipmentId"] == "STATION_WS"
+    assert event["value"] == 12.5
+
+def test_websocket_rejects_invalid_token(ws_client):
+    with pytest.raises(WebSocketDisconnect):
+        with ws_client.websocket_connect("/sensors/ws?token=invalid") as websocket:
+            websocket.receive_json()
+
+@pytest.mark.asyncio
+async def test_export_station_streams_ndjson(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    for value in (1.0, 2.0):
+        payload = {"equipmentId": "STATION_EXPORT", "timestamp": datetime.utcnow().isoformat(), "value": value}
+        await client.post("/sensors/data", json=payload, headers=headers)
+
+    response = await client.get("/sensors/STATION_EXPORT/export?period=24h&format=ndjson", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.splitlines()) == 2
+
+@pytest.mark.asyncio
+async def test_export_station_rejects_invalid_format(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    response = await client.get("/sensors/STATION_EXPORT/export?format=xml", headers=headers)
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_create_sensor_batch_msgpack(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}", "Content-Type": "application/msgpack"}
+    body = msgpack.packb([["STATION_1", datetime.utcnow().isoformat(), 25.0], ["STATION_2", 1733479200000, 30.0]])
+
+    response = await client.post("/sensors/batch", content=body, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["inserted_count"] == 2
+
+@pytest.mark.asyncio
+async def test_create_sensor_batch_rejects_unknown_content_type(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}", "Content-Type": "text/csv"}
+    response = await client.post("/sensors/batch", content=b"a,b,c", headers=headers)
+    assert response.status_code == 415
+
+@pytest.mark.asyncio
+async def test_retention_status(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    response = await client.get("/sensors/retention/status", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["mode"] == "delete"
+    assert body["lag_seconds"] == 0.0 and body["oldest_raw"] is None
+
+@pytest.mark.asyncio
+async def test_wal_status(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    response = await client.get("/sensors/wal/status", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["fsync"] == "always"
+    assert body["lag_bytes"] == 0 and body["replayed"] == 0
+
+@pytest.mark.asyncio
+async def test_query_statistics_endpoint(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    payload = {"equipmentId": "STATION_Q", "timestamp": datetime.utcnow().isoformat(), "value": 4.0}
+    await client.post("/sensors/data", json=payload, headers=headers)
+
+    response = await client.get("/sensors/query?equipmentId=STATION_Q&duration=36h&stats=count,mean,p50", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["groups"][0]["count"] == 1
+
+    response = await client.get("/sensors/query?equipmentId=STATION_Q&duration=36h&stats=mode", headers=headers)
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client, valid_token):
+    headers = {"Authorization": f"Bearer {valid_token}"}
+    await client.get("/sensors/average?equipmentId=STATION_M&period=24h", headers=headers)
+
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/sensors/average"}' in text
+    assert 'function="calculate_average",operation="summarize"' in text
+    assert "ingest_buffer_depth 0" in text
@@ -0,0 +1,149 @@
+import pytest
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from config.database import ensure_indexes
+from models.sensor_data import SensorData
+from services import aggregates
+from services.sensors_service import (
+    insert_sensor_data,
+    calculate_average,
+    get_average_all_stations,
+    get_station_data
+)
+import services.sensors_service
+
+@pytest.fixture
+def readings():
+    start = datetime(2024, 12, 6, 10, 58, 30)
+    return [
+        {"equipmentId": "STATION_1" if i % 3 else "STATION_2",
+         "timestamp": start + timedelta(seconds=7 * i),
+         "value": float(i % 17)}
+        for i in range(1200)
+    ]
+
+@pytest.fixture
+def aggregates_enabled(mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(services.sensors_service.settings, "AGGREGATES_ENABLED", True)
+    return mock_db
+
+def raw_summary(readings, equipment_id, start):
+    values = [r["value"] for r in readings if r["equipmentId"] == equipment_id and r["timestamp"] >= start]
+    return {"count": len(values), "sum": sum(values), "min": min(values), "max": max(values)}
+
+def test_floor_and_ceil_time():
+    ts = datetime(2024, 12, 6, 10, 58, 30, tzinfo=timezone.utc)
+    assert aggregates.floor_time(ts, aggregates.MINUTE) == datetime(2024, 12, 6, 10, 58)
+    assert aggregates.ceil_time(ts, aggregates.HOUR) == datetime(2024, 12, 6, 11, 0)
+    assert aggregates.ceil_time(datetime(2024, 12, 6, 11, 0), aggregates.HOUR) == datetime(2024, 12, 6, 11, 0)
+
+@pytest.mark.asyncio
+async def test_record_readings_builds_minute_and_hour_buckets(mock_db, readings):
+    await aggregates.record_readings(mock_db, readings)
+
+    hours = [doc async for doc in mock_db[aggregates.COLLECTION].find({"granularity": aggregates.HOUR})]
+    assert sum(doc["count"] for doc in hours) == len(readings)
+    minutes = [doc async for doc in mock_db[aggregates.COLLECTION].find({"granularity": aggregates.MINUTE})]
+    assert sum(doc["sum"] for doc in minutes) == pytest.approx(sum(r["value"] for r in readings))
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offset", [timedelta(0), timedelta(seconds=45), timedelta(minutes=17, seconds=3)])
+async def test_summarize_is_exact_for_unaligned_windows(mock_db, readings, offset):
+    await mock_db["sensors"].insert_many([dict(r) for r in readings])
+    await aggregates.record_readings(mock_db, readings)
+
+    start = readings[0]["timestamp"] + offset
+    summary = await aggregates.summarize(mock_db, "STATION_1", start)
+    expected = raw_summary(readings, "STATION_1", start)
+
+    assert summary["count"] == expected["count"]
+    assert summary["sum"] == pytest.approx(expected["sum"])
+    assert summary["min"] == expected["min"]
+    assert summary["max"] == expected["max"]
+
+@pytest.mark.asyncio
+async def test_summarize_all_matches_raw(mock_db, readings):
+    await mock_db["sensors"].insert_many([dict(r) for r in readings])
+    await aggregates.record_readings(mock_db, readings)
+
+    start = readings[100]["timestamp"] + timedelta(seconds=3)
+    summaries = await aggregates.summarize_all(mock_db, start)
+
+    assert set(summaries) == {"STATION_1", "STATION_2"}
+    for equipment_id, summary in summaries.items():
+        assert summary["count"] == raw_summary(readings, equipment_id, start)["count"]
+
+@pytest.mark.asyncio
+async def test_rebuild_from_raw(mock_db, readings):
+    await mock_db["sensors"].insert_many([dict(r) for r in readings])
+    assert await aggregates.rebuild(mock_db, batch_size=250) == len(readings)
+
+    summary = await aggregates.summarize(mock_db, "STATION_2", readings[0]["timestamp"])
+    assert summary["count"] == raw_summary(readings, "STATION_2", readings[0]["timestamp"])["count"]
+
+@pytest.mark.asyncio
+async def test_service_reads_use_aggregates(aggregates_enabled):
+    now = datetime.utcnow()
+    for equipment_id, minutes_ago, value in [("STATION_1", 1, 20.0), ("STATION_1", 90, 30.0), ("STATION_2", 5, 10.0)]:
+        await insert_sensor_data(SensorData(equipmentId=equipment_id, timestamp=now - timedelta(minutes=minutes_ago), value=value))
+
+    assert await aggregates_enabled[aggregates.COLLECTION].count_documents({}) > 0
+    assert (await calculate_average("STATION_1", "24h"))["average"] == pytest.approx(25.0)
+
+    averages = {row["equipmentId"]: row["average"] for row in await get_average_all_stations("24h")}
+    assert averages == {"STATION_1": pytest.approx(25.0), "STATION_2": pytest.approx(10.0)}
+
+    station = await get_station_data("STATION_1", "24h")
+    assert station["average"] == pytest.approx(25.0)
+    assert len(station["values"]) == 2
+
+@pytest.mark.asyncio
+async def test_write_readings_skips_duplicate_documents(aggregates_enabled):
+    await ensure_indexes(aggregates_enabled)
+    now = datetime.utcnow()
+    existing = {"_id": ObjectId(), "equipmentId": "STATION_1", "timestamp": now, "value": 1.0}
+    await aggregates_enabled["sensors"].insert_one(dict(existing))
+
+    batch = [
+        {"equipmentId": "STATION_1", "timestamp": now + timedelta(seconds=1), "value": 5.0},
+        {**existing, "_id": ObjectId()},
+        {"equipmentId": "STATION_1", "timestamp": now + timedelta(seconds=2), "value": 7.0},
+    ]
+    assert await services.sensors_service._write_readings(batch) == {1: "duplicate"}
+
+    hours = [doc async for doc in aggregates_enabled[aggregates.COLLECTION].find({"granularity": aggregates.HOUR})]
+    assert sum(doc["count"] for doc in hours) == 2
+    assert sum(doc["sum"] for doc in hours) == pytest.approx(12.0)
+
+@pytest.mark.asyncio
+async def test_aggregate_failure_does_not_fail_insert(aggregates_enabled, monkeypatch):
+    async def failing(*args, **kwargs):
+        raise RuntimeError("bucket update failed")
+    monkeypatch.setattr(aggregates, "record_readings", failing)
+
+    result = await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=datetime.utcnow(), value=1.0))
+
+    assert result["message"] == "Data inserted"
+    assert await aggregates_enabled["sensors"].count_documents({}) == 1
+    assert await aggregates.is_stale(aggregates_enabled)
+
+@pytest.mark.asyncio
+async def test_rebuild_replaces_buckets_and_clears_stale_flag(mock_db, readings):
+    await mock_db["sensors"].insert_many([dict(r) for r in readings])
+    await aggregates.record_readings(mock_db, readings)
+    await aggregates.mark_stale(mock_db, "test")
+
+    await aggregates.rebuild(mock_db)
+
+    hours = [doc async for doc in mock_db[aggregates.COLLECTION].find({"granularity": aggregates.HOUR})]
+    assert sum(doc["count"] for doc in hours) == len(readings)
+    assert not await aggregates.is_stale(mock_db)
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_bucket_indexes(mock_db, readings):
+    await mock_db["sensors"].insert_many([dict(r) for r in readings])
+    await aggregates.rebuild(mock_db)
+
+    indexes = await mock_db[aggregates.COLLECTION].index_information()
+    assert any(info.get("unique") for info in indexes.values())
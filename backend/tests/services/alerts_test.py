@@ -0,0 +1,101 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from models.sensor_data import SensorData
+from services.alerts import AlertEngine, build_rules
+from services.realtime_hub import RealtimeHub
+from services.sensors_service import insert_sensor_data
+import services.sensors_service
+
+START = datetime(2024, 12, 6, 12)
+
+def reading(equipment_id, value, seconds=0):
+    return {"equipmentId": equipment_id, "timestamp": START + timedelta(seconds=seconds), "value": value}
+
+def statuses(engine):
+    return [(event["rule"], event["equipmentId"], event["status"]) for event in reversed(engine.events())]
+
+def test_threshold_fires_after_sustain_and_resolves():
+    engine = AlertEngine(build_rules([{"name": "hot", "type": "threshold", "above": 50, "sustain": 2}]))
+
+    engine.evaluate([reading("STATION_1", v, i) for i, v in enumerate([10, 60, 20, 60, 70, 80, 30])])
+
+    assert statuses(engine) == [("hot", "STATION_1", "firing"), ("hot", "STATION_1", "resolved")]
+    firing, resolved = reversed(engine.events())
+    assert firing["value"] == 70 and resolved["since"] == firing["timestamp"]
+    assert engine.active() == []
+
+def test_rules_only_apply_to_their_stations():
+    engine = AlertEngine(build_rules([{"name": "cold", "type": "threshold", "below": 0, "stations": ["STATION_2"]}]))
+
+    engine.evaluate([reading("STATION_1", -5), reading("STATION_2", -5)])
+
+    assert [event["equipmentId"] for event in engine.active()] == ["STATION_2"]
+
+def test_rate_of_change_skips_late_readings():
+    engine = AlertEngine(build_rules([{"name": "spike", "type": "rate_of_change", "max_rate": 1.0}]))
+
+    # 10 -> 15 em 10 s (0.5/s); a leitura atrasada não é julgada; 15 -> 45 em 10 s (3/s)
+    engine.evaluate([reading("STATION_1", 10, 0), reading("STATION_1", 15, 10), reading("STATION_1", 99, 5),
+                     reading("STATION_1", 45, 20)])
+
+    [event] = engine.active()
+    assert event["rate"] == pytest.approx(3.0)
+
+def test_zscore_waits_for_warmup_then_flags_deviations():
+    engine = AlertEngine(build_rules([{"name": "drift", "type": "zscore", "z": 4, "alpha": 0.1, "warmup": 20}]))
+    baseline = [reading("STATION_1", 20 + (i % 3) * 0.5, i) for i in range(40)]
+
+    engine.evaluate(baseline[:5] + [reading("STATION_1", 90, 5)])
+    assert engine.active() == []
+
+    engine.evaluate(baseline[6:] + [reading("STATION_1", 90, 40)])
+    [event] = engine.active()
+    assert event["zscore"] > 4 and event["mean"] == pytest.approx(20.5, abs=0.5)
+
+    engine.evaluate([reading("STATION_1", 21, 41)])
+    assert statuses(engine)[-1] == ("drift", "STATION_1", "resolved")
+
+def test_state_grows_with_new_stations():
+    engine = AlertEngine(build_rules([{"name": "hot", "type": "threshold", "above": 50}]))
+
+    engine.evaluate([reading(f"STATION_{i}", 60) for i in range(200)])
+
+    assert len(engine.active()) == 200
+    assert len(engine.rules[0].firing) >= 200
+
+@pytest.mark.parametrize("definitions", [
+    [{"name": "a", "type": "unknown"}],
+    [{"name": "a", "type": "threshold"}],
+    [{"name": "a", "type": "threshold", "above": 1}, {"name": "a", "type": "threshold", "above": 2}],
+    [{"name": "a", "type": "zscore", "alpha": 2}],
+    [{"name": "a", "type": "rate_of_change", "max_rate": 1, "window": 5}],
+])
+def test_invalid_rules_are_rejected(definitions):
+    with pytest.raises(ValueError):
+        build_rules(definitions)
+
+@pytest.mark.asyncio
+async def test_subscribers_receive_alert_events():
+    engine = AlertEngine(build_rules([{"name": "hot", "type": "threshold", "above": 50}]))
+    station = engine.subscribe("STATION_1")
+    everything = engine.subscribe()
+
+    engine.evaluate([reading("STATION_2", 60), reading("STATION_1", 60)])
+
+    assert json.loads(await station.next_message())["equipmentId"] == "STATION_1"
+    assert station.queue.empty()
+    assert everything.queue.qsize() == 2
+
+@pytest.mark.asyncio
+async def test_inserted_readings_are_evaluated(mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+    engine = AlertEngine(build_rules([{"name": "hot", "type": "threshold", "above": 50}]))
+    hub = RealtimeHub()
+    hub.add_listener(engine.evaluate)
+    monkeypatch.setattr(services.sensors_service, "realtime_hub", hub)
+
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=datetime.utcnow(), value=75.0))
+
+    [event] = engine.active("STATION_1")
+    assert event["status"] == "firing" and event["value"] == 75.0
@@ -0,0 +1,144 @@
+import asyncio
+import io
+import os
+import pytest
+from fastapi import UploadFile
+from services.import_jobs import ImportJobManager
+import services.sensors_service
+
+def csv_upload(rows, invalid_line=None):
+    lines = ["equipmentId,timestamp,value"]
+    lines += [f"STATION_{i % 3},2024-12-06T12:{i // 60:02d}:{i % 60:02d}Z,{i}" for i in range(rows)]
+    if invalid_line is not None:
+        lines.insert(invalid_line - 1, "STATION_1,not-a-date,1")
+    return UploadFile(filename="data.csv", file=io.BytesIO(("\n".join(lines) + "\n").encode()))
+
+async def wait_for(manager, job_id):
+    for _ in range(200):
+        job = manager.get(job_id)
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("Import job did not finish.")
+
+@pytest.fixture
+def manager(tmp_path, mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(services.sensors_service.settings, "CSV_READ_CHUNK_SIZE", 256)
+    monkeypatch.setattr(services.sensors_service.settings, "CSV_BATCH_SIZE", 4)
+    return ImportJobManager(str(tmp_path), workers=2)
+
+@pytest.mark.asyncio
+async def test_submit_returns_immediately_and_completes(manager, mock_db):
+    job = await manager.submit(csv_upload(50, invalid_line=10))
+    assert job["status"] == "queued"
+    assert job["total_bytes"] > 0
+
+    job = await wait_for(manager, job["job_id"])
+    assert job["status"] == "completed"
+    assert job["inserted_count"] == 50
+    assert job["rejected_count"] == 1
+    assert job["errors"][0]["line"] == 10
+    assert job["bytes_processed"] == job["total_bytes"]
+    assert job["rows_per_second"] > 0
+    assert await mock_db["sensors"].count_documents({}) == 50
+    await manager.stop()
+
+@pytest.mark.asyncio
+async def test_invalid_header_fails_job(manager):
+    upload = UploadFile(filename="data.csv", file=io.BytesIO(b"a,b,c\n1,2,3\n"))
+    job = await wait_for(manager, (await manager.submit(upload))["job_id"])
+    assert job["status"] == "failed"
+    assert "Invalid CSV format" in job["error"]
+    await manager.stop()
+
+@pytest.mark.asyncio
+async def test_failed_write_reports_rows_stored_before_it(manager, mock_db, monkeypatch):
+    original = services.sensors_service._write_readings
+    calls = []
+
+    async def failing_second_batch(docs):
+        calls.append(len(docs))
+        if len(calls) == 2:
+            raise RuntimeError("mongo down")
+        return await original(docs)
+    monkeypatch.setattr(services.sensors_service, "_write_readings", failing_second_batch)
+
+    job = await wait_for(manager, (await manager.submit(csv_upload(10)))["job_id"])
+
+    assert job["status"] == "failed"
+    assert job["inserted_count"] == 4
+    assert await mock_db["sensors"].count_documents({}) == 4
+    await manager.stop()
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_purged_after_retention(manager, tmp_path):
+    job = await wait_for(manager, (await manager.submit(csv_upload(5)))["job_id"])
+    await manager.stop()
+
+    # O status continua consultável; o upload e o lock já não são necessários
+    assert job["status"] == "completed"
+    assert os.listdir(tmp_path) == [f"{job['job_id']}.json"]
+    assert manager.purge_finished() == 0
+
+    manager.retention_seconds = 0
+    assert manager.purge_finished() == 1
+    assert os.listdir(tmp_path) == []
+    assert manager.get(job["job_id"]) is None
+
+def save_interrupted_job(manager, tmp_path):
+    # Simula um processo interrompido: o manifesto ficou "running" após o primeiro bloco
+    job_id = "0123456789abcdef0123456789abcdef"
+    data = csv_upload(30).file.getvalue()
+    (tmp_path / f"{job_id}.csv").write_bytes(data)
+    offset = sum(len(line) + 1 for line in data.split(b"\n")[:11])
+    manager._save({
+        "job_id": job_id,
+        "status": "running",
+        "filename": "data.csv",
+        "total_bytes": len(data),
+        "committed_offset": offset,
+        "committed_line": 11,
+        "header": ["equipmentId", "timestamp", "value"],
+        "inserted_count": 10,
+        "rejected_count": 0,
+        "errors": [],
+        "error": None,
+        "created_at": "2024-12-06T12:00:00",
+        "started_at": "2024-12-06T12:00:00",
+        "finished_at": None,
+        "elapsed_seconds": 1.0,
+    })
+    return job_id
+
+@pytest.mark.asyncio
+async def test_resume_continues_from_committed_offset(manager, mock_db, tmp_path):
+    job_id = save_interrupted_job(manager, tmp_path)
+    assert manager.get(job_id)["eta_seconds"] is not None
+
+    assert await manager.resume_pending() == 1
+    job = await wait_for(manager, job_id)
+
+    assert job["status"] == "completed"
+    assert job["inserted_count"] == 30
+    assert await mock_db["sensors"].count_documents({}) == 20
+    await manager.stop()
+
+@pytest.mark.asyncio
+async def test_job_resumed_by_two_workers_runs_once(manager, mock_db, tmp_path):
+    # Dois processos de worker sobre o mesmo spool retomam o mesmo job
+    other = ImportJobManager(str(tmp_path), workers=2)
+    job_id = save_interrupted_job(manager, tmp_path)
+
+    assert await manager.resume_pending() == 1
+    assert await other.resume_pending() == 1
+    job = await wait_for(manager, job_id)
+    await asyncio.sleep(0.05)
+
+    assert job["inserted_count"] == 30
+    assert await mock_db["sensors"].count_documents({}) == 20
+    await manager.stop()
+    await other.stop()
+
+def test_get_rejects_malformed_job_ids(manager):
+    assert manager.get("../../etc/passwd") is None
@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta
+from models.sensor_data import SensorData
+from services.ingest_buffer import IngestBuffer, IngestBufferFull
+from services.sensors_service import insert_sensor_data
+import services.sensors_service
+
+class RecordingSink:
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, docs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.batches.append(list(docs))
+
+@pytest.mark.asyncio
+async def test_flushes_when_batch_size_reached():
+    sink = RecordingSink()
+    buffer = IngestBuffer(flush=sink, max_batch_size=3, flush_interval=10, ack_mode="enqueue")
+    for i in range(3):
+        await buffer.submit({"value": i})
+    await asyncio.sleep(0.01)
+    assert sink.batches == [[{"value": 0}, {"value": 1}, {"value": 2}]]
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_flushes_after_interval():
+    sink = RecordingSink()
+    buffer = IngestBuffer(flush=sink, max_batch_size=100, flush_interval=0.02, ack_mode="enqueue")
+    await buffer.submit({"value": 1})
+    assert sink.batches == []
+    await asyncio.sleep(0.05)
+    assert sink.batches == [[{"value": 1}]]
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_ack_on_flush_waits_for_write():
+    sink = RecordingSink()
+    buffer = IngestBuffer(flush=sink, max_batch_size=100, flush_interval=0.01, ack_mode="flush")
+    await asyncio.gather(*(buffer.submit({"value": i}) for i in range(5)))
+    assert sum(len(batch) for batch in sink.batches) == 5
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_ack_on_flush_propagates_errors():
+    async def failing(docs):
+        raise RuntimeError("mongo down")
+
+    buffer = IngestBuffer(flush=failing, flush_interval=0.01, ack_mode="flush")
+    with pytest.raises(RuntimeError):
+        await buffer.submit({"value": 1})
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_backpressure_when_queue_full():
+    sink = RecordingSink(delay=0.2)
+    buffer = IngestBuffer(
+        flush=sink, max_batch_size=1, flush_interval=0.01,
+        max_queue_size=1, ack_mode="enqueue", enqueue_timeout=0.01
+    )
+    await buffer.submit({"value": 1})
+    await asyncio.sleep(0.01)
+    await buffer.submit({"value": 2})
+    with pytest.raises(IngestBufferFull):
+        await buffer.submit({"value": 3})
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_readings():
+    sink = RecordingSink()
+    buffer = IngestBuffer(flush=sink, max_batch_size=100, flush_interval=10, ack_mode="enqueue")
+    for i in range(4):
+        await buffer.submit({"value": i})
+    await buffer.stop()
+    assert [doc["value"] for batch in sink.batches for doc in batch] == [0, 1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_insert_sensor_data_through_buffer(mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(services.sensors_service.settings, "INGEST_BUFFER_ENABLED", True)
+    now = datetime.utcnow()
+    readings = [
+        SensorData(equipmentId="STATION_1", timestamp=now + timedelta(seconds=i), value=25.0) for i in range(10)
+    ]
+
+    # A última é um retry da primeira: o buffer devolve o resultado de cada leitura
+    results = await asyncio.gather(*(insert_sensor_data(sensor_data) for sensor_data in readings + readings[:1]))
+    await services.sensors_service.ingest_buffer.stop()
+
+    assert all(result["message"] == "Data inserted" for result in results[:10])
+    assert results[10] == {"message": "Data already stored", "id": None}
+    assert await mock_db["sensors"].count_documents({"equipmentId": "STATION_1"}) == 10
+    stored = await mock_db["sensors"].find_one({"_id": ObjectId(results[0]["id"])})
+    assert stored is not None
+
+@pytest.mark.asyncio
+async def test_bulk_write_error_fails_only_rejected_readings():
+    async def partially_failing(docs):
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]})
+
+    buffer = IngestBuffer(flush=partially_failing, max_batch_size=3, flush_interval=10, ack_mode="flush")
+    results = await asyncio.gather(*(buffer.submit({"value": i}) for i in range(3)), return_exceptions=True)
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], BulkWriteError)
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_restart_carries_over_pending_readings():
+    sink = RecordingSink()
+    buffer = IngestBuffer(flush=sink, max_batch_size=100, flush_interval=10, ack_mode="enqueue")
+    await buffer.submit({"value": 1})
+    buffer._task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await buffer._task
+
+    await buffer.submit({"value": 2})
+    await buffer.stop()
+    assert [doc["value"] for batch in sink.batches for doc in batch] == [1, 2]
@@ -0,0 +1,207 @@
+import os
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from pymongo import monitoring
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from config.database import INDEXES, ensure_indexes
+from storage import MongoStorage
+from services.sensors_service import (
+    calculate_average,
+    get_average_all_stations,
+    get_station_data,
+    get_station_page,
+    export_station_data
+)
+import services.sensors_service
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_creates_expected_indexes(mock_db):
+    await ensure_indexes(mock_db)
+
+    sensors = await mock_db["sensors"].index_information()
+    assert any(info["key"] == [("equipmentId", 1), ("timestamp", 1), ("_id", 1)] for info in sensors.values())
+    assert any(info["key"] == [("timestamp", 1)] for info in sensors.values())
+
+    users = await mock_db["users"].index_information()
+    assert any(info["key"] == [("username", 1)] and info.get("unique") for info in users.values())
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_is_idempotent(mock_db):
+    await ensure_indexes(mock_db)
+    await ensure_indexes(mock_db)
+    total = 0
+    for collection in {collection for collection, _, _ in INDEXES}:
+        total += len(await mock_db[collection].index_information()) - 1
+    assert total == len(INDEXES)
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_replaces_the_legacy_non_unique_index(mock_db):
+    key = [("equipmentId", 1), ("timestamp", 1)]
+    await mock_db["sensors"].create_index(key)
+
+    await ensure_indexes(mock_db)
+
+    sensors = await mock_db["sensors"].index_information()
+    [info] = [info for info in sensors.values() if info["key"] == key]
+    assert info.get("unique")
+    await mock_db["sensors"].insert_one({"equipmentId": "STATION_1", "timestamp": datetime(2024, 12, 6)})
+    with pytest.raises(DuplicateKeyError):
+        await mock_db["sensors"].insert_one({"equipmentId": "STATION_1", "timestamp": datetime(2024, 12, 6)})
+
+class RecordingCollection:
+    def __init__(self, collection, calls):
+        self._collection = collection
+        self._calls = calls
+
+    def find(self, filter=None, projection=None, **kwargs):
+        self._calls.append((self._collection.name, "find", {"filter": filter, "projection": projection, **kwargs}))
+        return self._collection.find(filter, projection, **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._calls.append((self._collection.name, "aggregate", {"pipeline": pipeline, **kwargs}))
+        return self._collection.aggregate(pipeline, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+class RecordingDatabase:
+    """Delegates to a real database and records every find/aggregate issued."""
+
+    def __init__(self, database):
+        self._database = database
+        self.calls = []
+
+    def __getitem__(self, name):
+        return RecordingCollection(self._database[name], self.calls)
+
+    def get_collection(self, name, **kwargs):
+        return RecordingCollection(self._database.get_collection(name, **kwargs), self.calls)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+# Argumentos de find/aggregate (pymongo) -> campos do comando correspondente
+COMMAND_FIELDS = {
+    "filter": "filter",
+    "projection": "projection",
+    "sort": "sort",
+    "hint": "hint",
+    "limit": "limit",
+    "skip": "skip",
+    "batch_size": "batchSize",
+    "max_time_ms": "maxTimeMS",
+    "maxTimeMS": "maxTimeMS",
+    "allowDiskUse": "allowDiskUse",
+    "allow_disk_use": "allowDiskUse",
+    "pipeline": "pipeline",
+}
+
+def to_command(collection, kind, call):
+    """Builds the find/aggregate command issued for a recorded call, for explain."""
+    command = {kind: collection}
+    for argument, value in call.items():
+        if value is None:
+            continue
+        if argument not in COMMAND_FIELDS:
+            raise AssertionError(f"Unsupported {kind} argument in query plan check: {argument}")
+        if argument == "sort" and isinstance(value, list):
+            value = dict(value)
+        if argument == "hint" and isinstance(value, list):
+            value = dict(value)
+        command[COMMAND_FIELDS[argument]] = value
+    if kind == "aggregate":
+        command["cursor"] = {}
+    return command
+
+def find_stages(plan, stage):
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            return [plan]
+        return [found for value in plan.values() for found in find_stages(value, stage)]
+    if isinstance(plan, list):
+        return [found for value in plan for found in find_stages(value, stage)]
+    return []
+
+@pytest_asyncio.fixture
+async def real_db():
+    if not MONGO_TEST_URI:
+        pytest.skip("MONGO_TEST_URI not set; query plan checks need a real mongod (set by tests.sh and CI).")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(MONGO_TEST_URI, serverSelectionTimeoutMS=2000)
+    database = client["sensor_data_query_plan_test"]
+    await client.drop_database(database.name)
+    await ensure_indexes(database)
+    now = datetime.utcnow()
+    await database["sensors"].insert_many([
+        {"equipmentId": f"STATION_{i % 20}", "timestamp": now - timedelta(minutes=i), "value": float(i % 13)}
+        for i in range(2000)
+    ])
+    yield database
+    await client.drop_database(database.name)
+    client.close()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("aggregates_enabled", [False, True])
+async def test_sensor_queries_do_not_collscan(real_db, monkeypatch, aggregates_enabled):
+    recorder = RecordingDatabase(real_db)
+    monkeypatch.setattr(services.sensors_service, "db", recorder)
+    monkeypatch.setattr(services.sensors_service.settings, "AGGREGATES_ENABLED", aggregates_enabled)
+    if aggregates_enabled:
+        from services import aggregates
+        await aggregates.rebuild(real_db)
+
+    await calculate_average("STATION_1", "24h")
+    await get_average_all_stations("24h")
+    await get_station_data("STATION_1", "1w")
+    await get_station_data("STATION_1", "1w", resolution="1h")
+    await get_station_data("STATION_1", "1w", max_points=100, method="lttb")
+    page = await get_station_page("STATION_1", "1w", limit=10)
+    await get_station_page("STATION_1", "1w", limit=10, cursor=page["next_cursor"])
+    async for _ in export_station_data("STATION_1", "1w", "ndjson"):
+        pass
+    assert recorder.calls
+
+    for collection, kind, query in recorder.calls:
+        command = to_command(collection, kind, query)
+        plan = await real_db.command("explain", command, verbosity="queryPlanner")
+        assert not find_stages(plan, "COLLSCAN"), f"{kind} on {collection} falls back to a collection scan: {query}"
+
+class CommandRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append(event.command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+@pytest.mark.asyncio
+async def test_analytical_reads_reach_the_replica_set_with_their_budget(real_db, monkeypatch):
+    if "setName" not in await real_db.client.admin.command("hello"):
+        pytest.skip("MONGO_TEST_URI is not a replica set; see docker-compose.replica.yml.")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    recorder = CommandRecorder()
+    client = AsyncIOMotorClient(MONGO_TEST_URI, serverSelectionTimeoutMS=2000, event_listeners=[recorder])
+    monkeypatch.setattr(settings, "ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setattr(settings, "ANALYTICS_MAX_STALENESS_SECONDS", 90)
+    storage = MongoStorage(lambda: client[real_db.name])
+    try:
+        summaries = await storage.summaries(datetime.utcnow() - timedelta(hours=48))
+        await storage.insert([{"equipmentId": "STATION_1", "timestamp": datetime.utcnow(), "value": 1.0}])
+    finally:
+        client.close()
+
+    assert len(summaries) == 20
+    [aggregate] = [command for command in recorder.commands if "aggregate" in command]
+    assert aggregate["$readPreference"] == {"mode": "secondaryPreferred", "maxStalenessSeconds": 90}
+    assert aggregate["maxTimeMS"] == settings.QUERY_BUDGETS["averages"]["max_time_ms"]
+    [insert] = [command for command in recorder.commands if "insert" in command]
+    assert "$readPreference" not in insert
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import pytest
+from datetime import datetime, timedelta
+from models.sensor_data import SensorData
+from services.realtime_hub import ChangeStreamFeed, RealtimeHub, RollingAverage
+from services.sensors_service import insert_sensor_data
+import services.sensors_service
+
+def reading(equipment_id, value, timestamp=None):
+    return {"equipmentId": equipment_id, "timestamp": timestamp or datetime(2024, 12, 6, 12), "value": value}
+
+@pytest.mark.asyncio
+async def test_publish_routes_by_station():
+    hub = RealtimeHub()
+    station = hub.subscribe("STATION_1")
+    everything = hub.subscribe()
+
+    hub.publish([reading("STATION_1", 1.0), reading("STATION_2", 2.0)])
+
+    assert json.loads(await station.next_message())["value"] == 1.0
+    assert station.queue.empty()
+    assert [json.loads(await everything.next_message())["equipmentId"] for _ in range(2)] == ["STATION_1", "STATION_2"]
+
+@pytest.mark.asyncio
+async def test_slow_consumer_drops_oldest_events():
+    hub = RealtimeHub(max_queue=2)
+    subscription = hub.subscribe("STATION_1")
+
+    hub.publish([reading("STATION_1", float(i)) for i in range(5)])
+
+    dropped, message = (await subscription.next_message()).split("\n")
+    assert json.loads(dropped) == {"type": "dropped", "count": 3}
+    assert json.loads(message)["value"] == 3.0
+
+@pytest.mark.asyncio
+async def test_unsubscribe_stops_delivery():
+    hub = RealtimeHub()
+    subscription = hub.subscribe("STATION_1")
+    hub.unsubscribe(subscription)
+    hub.publish([reading("STATION_1", 1.0)])
+    assert subscription.queue.empty()
+    assert hub.subscriber_count == 0
+
+def test_rolling_average_expires_old_slots():
+    rolling = RollingAverage()
+    now = datetime.utcnow()
+    rolling.add(now - timedelta(hours=23, minutes=30), 10.0)
+    rolling.add(now - timedelta(hours=22, minutes=30), 20.0)
+    assert rolling.average == pytest.approx(15.0)
+
+    rolling.add(now, 30.0, now=now + timedelta(hours=1))
+    assert rolling.count == 2 and rolling.total == pytest.approx(50.0)
+
+def test_rolling_average_of_a_quiet_station_expires():
+    rolling = RollingAverage()
+    rolling.add(datetime.utcnow() - timedelta(hours=23, minutes=50), 10.0)
+    assert rolling.average == pytest.approx(10.0)
+
+    # Sem leituras novas, a janela avança com o relógio
+    rolling.prune(datetime.utcnow() + timedelta(hours=1))
+    assert rolling.count == 0
+
+def test_late_reading_inside_the_window_is_counted_in_order():
+    rolling = RollingAverage()
+    now = datetime.utcnow()
+    rolling.add(now - timedelta(hours=2), 10.0)
+    rolling.add(now, 20.0)
+
+    # Mais antiga que o slot mais antigo guardado, mas ainda dentro das 24h
+    rolling.add(now - timedelta(hours=20), 30.0)
+    rolling.add(now - timedelta(hours=25), 99.0)
+    rolling.add(now - timedelta(hours=1), 40.0)
+
+    assert rolling.average == pytest.approx(25.0)
+    assert [slot[0] for slot in rolling.slots] == sorted(slot[0] for slot in rolling.slots)
+    assert len(rolling.slots) == 4
+
+@pytest.mark.asyncio
+async def test_insert_sensor_data_publishes_reading(mock_db):
+    services.sensors_service.db = mock_db
+    subscription = services.sensors_service.realtime_hub.subscribe("STATION_9")
+    try:
+        await insert_sensor_data(SensorData(equipmentId="STATION_9", timestamp=datetime.utcnow(), value=42.0))
+        event = json.loads(await subscription.next_message())
+    finally:
+        services.sensors_service.realtime_hub.unsubscribe(subscription)
+
+    assert event["type"] == "reading"
+    assert event["value"] == 42.0
+    assert event["average_24h"] == pytest.approx(42.0)
+
+class FakeChangeStream:
+    # Change stream mínimo: o mongomock não implementa watch()
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.changes:
+            await asyncio.Event().wait()
+        change = self.changes.pop(0)
+        self.resume_token = change["_id"]
+        return change
+
+class FakeCollection:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def watch(self, pipeline, resume_after=None):
+        return FakeChangeStream(self.changes)
+
+@pytest.mark.asyncio
+async def test_change_stream_feed_publishes_inserts():
+    hub = RealtimeHub()
+    subscription = hub.subscribe("STATION_1")
+    collection = FakeCollection([
+        {"_id": {"_data": "1"}, "operationType": "insert", "fullDocument": reading("STATION_1", 5.0)},
+    ])
+    feed = ChangeStreamFeed(hub, lambda: {"sensors": collection})
+
+    feed.start()
+    try:
+        assert feed.enabled
+        event = json.loads(await asyncio.wait_for(subscription.next_message(), 1))
+    finally:
+        await feed.stop()
+
+    assert event["value"] == 5.0
+    assert feed._resume_token == {"_data": "1"}
+    assert not feed.enabled
+
+@pytest.mark.asyncio
+async def test_local_writes_are_not_published_while_the_feed_runs(mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(ChangeStreamFeed, "enabled", property(lambda self: True))
+    subscription = services.sensors_service.realtime_hub.subscribe("STATION_9")
+    try:
+        await insert_sensor_data(SensorData(equipmentId="STATION_9", timestamp=datetime.utcnow(), value=42.0))
+        assert subscription.queue.empty()
+    finally:
+        services.sensors_service.realtime_hub.unsubscribe(subscription)
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+from services.reorder_window import ReorderWindow
+from storage.base import to_millis
+
+def reading(equipment_id, timestamp):
+    return {"equipmentId": equipment_id, "timestamp": timestamp, "value": 1.0}
+
+def test_readings_behind_the_window_are_late():
+    window = ReorderWindow(seconds=60)
+    now = datetime.utcnow().replace(microsecond=0)
+    window.advance([reading("STATION_1", now)])
+
+    docs = [reading("STATION_1", now - timedelta(seconds=30)), reading("STATION_1", now - timedelta(seconds=90)),
+            reading("STATION_2", now - timedelta(days=1))]
+    assert window.late(docs) == [1]
+
+def test_future_readings_do_not_move_the_watermark_past_now():
+    window = ReorderWindow(seconds=60)
+    now = datetime.utcnow().replace(microsecond=0)
+    window.advance([reading("STATION_1", datetime(2099, 1, 1))])
+
+    assert window.watermark("STATION_1") <= to_millis(datetime.utcnow())
+    assert window.late([reading("STATION_1", now), reading("STATION_1", now - timedelta(seconds=30))]) == []
+
+def test_quietest_stations_are_forgotten_beyond_max_stations():
+    window = ReorderWindow(seconds=60, max_stations=10)
+    start = datetime.utcnow() - timedelta(hours=1)
+
+    window.advance([reading(f"STATION_{i}", start + timedelta(seconds=i)) for i in range(11)])
+
+    assert len(window._watermarks) == 9
+    assert window.watermark("STATION_0") is None and window.watermark("STATION_10") is not None
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from bson import ObjectId
+from datetime import datetime, timedelta
+from services import retention
+from services.retention import RetentionScheduler
+from services.sensors_service import calculate_average, get_average_all_stations, get_station_data, query_statistics
+import services.sensors_service
+
+@pytest.fixture
+def readings():
+    # Leituras de 300 dias, a cada 18 horas, alinhadas à hora
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    return [
+        {"_id": ObjectId(), "equipmentId": "STATION_1" if i % 4 else "STATION_2",
+         "timestamp": now - timedelta(days=300) + timedelta(hours=18 * i), "value": float(i % 23)}
+        for i in range(400)
+    ]
+
+@pytest.fixture
+def scheduler(mock_db):
+    services.sensors_service.db = mock_db
+    return RetentionScheduler(lambda: mock_db, raw_days=90, batch_size=50, batch_pause=0)
+
+def mean(readings, equipment_id):
+    values = [r["value"] for r in readings if r["equipmentId"] == equipment_id]
+    return sum(values) / len(values)
+
+@pytest.mark.asyncio
+async def test_run_once_rolls_up_and_deletes_old_readings(mock_db, scheduler, readings):
+    await mock_db["sensors"].insert_many(readings)
+    horizon = retention.raw_horizon(90)
+    old = [r for r in readings if r["timestamp"] < horizon]
+
+    assert await scheduler.run_once() == len(old)
+
+    assert await mock_db["sensors"].count_documents({"timestamp": {"$lt": horizon}}) == 0
+    assert await mock_db["sensors"].count_documents({}) == len(readings) - len(old)
+    hours = await mock_db[retention.ROLLUP_COLLECTION].count_documents({"granularity": retention.HOUR})
+    assert hours == len(old)
+    days = [doc async for doc in mock_db[retention.ROLLUP_COLLECTION].find({"granularity": retention.DAY})]
+    assert sum(doc["count"] for doc in days) == len(old)
+
+    # Nada mais para fazer na próxima execução
+    assert await scheduler.run_once() == 0
+    status = await scheduler.status()
+    assert status["lag_seconds"] == 0.0
+    assert status["rolled_up"] == len(old) and status["pending_batch"] is None
+
+@pytest.mark.asyncio
+async def test_one_year_averages_combine_rollups_and_raw(mock_db, scheduler, readings):
+    await mock_db["sensors"].insert_many(readings)
+    await scheduler.run_once()
+
+    result = await calculate_average("STATION_1", "1y")
+    assert result["average"] == pytest.approx(mean(readings, "STATION_1"))
+    averages = {row["equipmentId"]: row["average"] for row in await get_average_all_stations("1y")}
+    assert averages["STATION_2"] == pytest.approx(mean(readings, "STATION_2"))
+
+    data = await get_station_data("STATION_1", "1y", max_points=100)
+    assert data["bucket_seconds"] >= 3600
+    assert sum(point["count"] for point in data["values"]) == len([r for r in readings if r["equipmentId"] == "STATION_1"])
+    assert data["average"] == pytest.approx(mean(readings, "STATION_1"))
+
+    lttb = await get_station_data("STATION_1", "1y", max_points=50, method="lttb")
+    assert len(lttb["values"]) == 50
+    assert lttb["values"][0]["timestamp"] < retention.raw_horizon(90)
+
+@pytest.mark.asyncio
+async def test_archive_mode_moves_readings(mock_db, readings):
+    scheduler = RetentionScheduler(lambda: mock_db, raw_days=90, mode="archive", batch_size=50, batch_pause=0)
+    await mock_db["sensors"].insert_many(readings)
+
+    moved = await scheduler.run_once()
+
+    assert await mock_db[retention.ARCHIVE_COLLECTION].count_documents({}) == moved
+    assert await mock_db["sensors"].count_documents({}) == len(readings) - moved
+
+@pytest.mark.asyncio
+async def test_interrupted_batch_is_replayed_once(mock_db, scheduler, readings):
+    await mock_db["sensors"].insert_many(readings)
+    await mock_db[retention.ROLLUP_COLLECTION].create_index(
+        [("equipmentId", 1), ("granularity", 1), ("bucket", 1)], unique=True
+    )
+    # Processo parou depois de aplicar os rollups do lote e antes de apagar as leituras
+    batch = sorted(readings, key=lambda r: r["timestamp"])[:10]
+    batch_id = ObjectId()
+    await mock_db[retention.STATE_COLLECTION].insert_one(
+        {"_id": "pending", "batch": batch_id, "ids": [r["_id"] for r in batch]}
+    )
+    await retention.apply_rollups(mock_db, batch, batch_id)
+
+    await scheduler.run_once()
+
+    days = [doc async for doc in mock_db[retention.ROLLUP_COLLECTION].find({"granularity": retention.DAY})]
+    old = [r for r in readings if r["timestamp"] < retention.raw_horizon(90)]
+    assert sum(doc["count"] for doc in days) == len(old)
+
+@pytest.mark.asyncio
+async def test_run_once_skips_when_another_process_holds_the_lease(mock_db, scheduler, readings):
+    await mock_db["sensors"].insert_many(readings)
+    await mock_db[retention.STATE_COLLECTION].insert_one(
+        {"_id": "lease", "owner": "other", "until": datetime.utcnow() + timedelta(minutes=5)}
+    )
+
+    assert await scheduler.run_once() == 0
+    assert await mock_db["sensors"].count_documents({}) == len(readings)
+    assert (await scheduler.status())["lag_seconds"] > 0
+
+def test_unknown_mode_is_rejected(mock_db):
+    with pytest.raises(ValueError):
+        RetentionScheduler(lambda: mock_db, mode="truncate")
+
+@pytest.mark.asyncio
+async def test_query_statistics_use_rollup_sketches(mock_db, scheduler, readings):
+    await mock_db["sensors"].insert_many(readings)
+    await scheduler.run_once()
+
+    result = await query_statistics("STATION_1", duration="1y", stats="count,mean,stddev,p90")
+
+    [group] = result["groups"]
+    values = np.array([r["value"] for r in readings if r["equipmentId"] == "STATION_1"])
+    assert group["count"] == len(values)
+    assert group["mean"] == pytest.approx(values.mean())
+    assert group["stddev"] == pytest.approx(values.std())
+    assert group["p90"] == pytest.approx(np.sort(values)[int(0.9 * (len(values) - 1))], rel=0.01)
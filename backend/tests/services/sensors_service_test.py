@@ -1,11 +1,16 @@
+import json
 import pytest
 from datetime import datetime, timedelta
+from fastapi import HTTPException
 from models.sensor_data import SensorData
 from services.sensors_service import (
     insert_sensor_data,
+    insert_sensor_batch,
     calculate_average,
     get_average_all_stations,
-    get_station_data
+    get_station_data,
+    get_station_page,
+    export_station_data
 )
 import services.sensors_service
 
@@ -49,3 +54,144 @@ async def test_get_average_all_stations(mock_db, sample_data):
     assert len(result) == 2
     assert any(station["equipmentId"] == "STATION_1" for station in result)
     assert any(station["equipmentId"] == "STATION_2" for station in result)
+
+@pytest.fixture
+def dense_series():
+    start = datetime.utcnow() - timedelta(hours=23)
+    return [
+        {"equipmentId": "STATION_1", "timestamp": start + timedelta(seconds=30 * i), "value": float(i % 10)}
+        for i in range(2000)
+    ]
+
+@pytest.mark.asyncio
+async def test_get_station_data_buckets(mock_db, dense_series):
+    services.sensors_service.db = mock_db
+    await mock_db["sensors"].insert_many(dense_series)
+
+    result = await get_station_data("STATION_1", "24h", resolution="1h")
+
+    assert result["bucket_seconds"] == 3600
+    assert len(result["values"]) <= 25
+    assert sum(bucket["count"] for bucket in result["values"]) == len(dense_series)
+    assert all(bucket["min"] <= bucket["value"] <= bucket["max"] for bucket in result["values"])
+    assert result["average"] == pytest.approx(sum(d["value"] for d in dense_series) / len(dense_series))
+
+@pytest.mark.asyncio
+async def test_get_station_data_max_points_bounds_buckets(mock_db, dense_series):
+    services.sensors_service.db = mock_db
+    await mock_db["sensors"].insert_many(dense_series)
+
+    result = await get_station_data("STATION_1", "24h", resolution="1s", max_points=100)
+
+    assert len(result["values"]) <= 100
+
+@pytest.mark.asyncio
+async def test_get_station_data_lttb(mock_db, dense_series):
+    services.sensors_service.db = mock_db
+    dense_series[777]["value"] = 1000.0
+    await mock_db["sensors"].insert_many(dense_series)
+
+    result = await get_station_data("STATION_1", "24h", max_points=200, method="lttb")
+
+    assert len(result["values"]) == 200
+    assert max(point["value"] for point in result["values"]) == 1000.0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("arguments", [{"resolution": "5 parsecs"}, {"resolution": "0h"}, {"max_points": 10, "method": "median"}])
+async def test_get_station_data_rejects_invalid_downsampling(mock_db, arguments):
+    services.sensors_service.db = mock_db
+    with pytest.raises(HTTPException) as exc_info:
+        await get_station_data("STATION_1", "24h", **arguments)
+    assert exc_info.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_get_station_page_walks_every_value_once(mock_db):
+    services.sensors_service.db = mock_db
+    now = datetime.utcnow().replace(microsecond=0)
+    # Timestamps repetidos exercitam o desempate por _id
+    await mock_db["sensors"].insert_many([
+        {"equipmentId": "STATION_1", "timestamp": now - timedelta(minutes=i // 3), "value": float(i)}
+        for i in range(25)
+    ])
+
+    seen = []
+    cursor = None
+    while True:
+        page = await get_station_page("STATION_1", "24h", limit=4, cursor=cursor)
+        seen.extend(v["value"] for v in page["values"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert sorted(seen) == [float(i) for i in range(25)]
+    assert len(seen) == 25
+
+@pytest.mark.asyncio
+async def test_get_station_page_rejects_invalid_cursor(mock_db):
+    services.sensors_service.db = mock_db
+    with pytest.raises(HTTPException) as exc_info:
+        await get_station_page("STATION_1", "24h", cursor="not-a-cursor")
+    assert exc_info.value.status_code == 400
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["ndjson", "json"])
+async def test_export_station_data(mock_db, monkeypatch, fmt):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(services.sensors_service.settings, "EXPORT_BATCH_SIZE", 7)
+    now = datetime.utcnow()
+    await mock_db["sensors"].insert_many([
+        {"equipmentId": "STATION_1", "timestamp": now - timedelta(minutes=i), "value": float(i)}
+        for i in range(30)
+    ])
+
+    body = "".join([chunk async for chunk in export_station_data("STATION_1", "24h", fmt)])
+
+    if fmt == "ndjson":
+        rows = [json.loads(line) for line in body.splitlines()]
+    else:
+        rows = json.loads(body)
+    assert [row["value"] for row in rows] == [float(i) for i in reversed(range(30))]
+
+@pytest.mark.asyncio
+async def test_insert_invalidates_cached_average(mock_db):
+    services.sensors_service.db = mock_db
+    now = datetime.utcnow()
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now, value=10.0))
+    assert (await calculate_average("STATION_1", "24h"))["average"] == 10.0
+    assert (await calculate_average("STATION_1", "24h"))["average"] == 10.0
+    assert services.sensors_service.response_cache.stats()["hits"] == 1
+
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now, value=20.0))
+
+    assert (await calculate_average("STATION_1", "24h"))["average"] == 15.0
+
+@pytest.mark.asyncio
+async def test_insert_sensor_batch_reports_each_item(mock_db):
+    services.sensors_service.db = mock_db
+    now = datetime.utcnow().isoformat()
+    body = json.dumps([
+        {"equipmentId": "STATION_1", "timestamp": now, "value": 1.0},
+        {"equipmentId": "STATION_1", "timestamp": now, "value": "NaN"},
+        {"equipmentId": "STATION_2", "timestamp": now, "value": 2.0},
+    ]).encode()
+
+    result = await insert_sensor_batch(body, "application/json")
+
+    assert result["inserted_count"] == 2
+    assert result["rejected_count"] == 1
+    assert [item["status"] for item in result["results"]] == ["inserted", "rejected", "inserted"]
+    assert await mock_db["sensors"].count_documents({}) == 2
+
+@pytest.mark.asyncio
+async def test_insert_sensor_batch_limits(mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(services.sensors_service.settings, "BATCH_MAX_ITEMS", 1)
+    body = json.dumps([["STATION_1", 0, 1.0], ["STATION_1", 0, 2.0]]).encode()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await insert_sensor_batch(body, "application/json")
+    assert exc_info.value.status_code == 413
+
+    with pytest.raises(HTTPException) as exc_info:
+        await insert_sensor_batch(body, "text/plain")
+    assert exc_info.value.status_code == 415
@@ -0,0 +1,437 @@
+import json
+import os
+import numpy as np
+import pytest
+import pytest_asyncio
+from bson import ObjectId
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo.errors import ExecutionTimeout
+from pymongo.read_preferences import SecondaryPreferred
+from config import settings
+from config.database import ensure_indexes
+from models.sensor_data import SensorData
+from storage import BucketStorage, ColumnarStorage, MongoStorage, create_storage
+from storage import bucketed
+from storage.base import bucketize, to_millis
+from storage.columnar import RECORD_DTYPE
+from storage.mongo import remove_duplicates
+from storage.routing import read_preference
+from services.reorder_window import ReorderWindow
+from services.sensors_service import (
+    insert_sensor_data,
+    insert_sensor_batch,
+    calculate_average,
+    get_average_all_stations,
+    get_station_data,
+    get_station_page,
+    export_station_data,
+    query_statistics
+)
+import services.sensors_service
+
+# Os testes de serviço abaixo rodam contra todos os backends de armazenamento
+@pytest_asyncio.fixture(params=["mongo", "buckets", "columnar"])
+async def backend(request, mock_db, tmp_path, monkeypatch):
+    services.sensors_service.db = mock_db
+    # Os índices únicos tornam a ingestão idempotente, como na subida do app
+    await ensure_indexes(mock_db)
+    storage = {
+        "mongo": lambda: MongoStorage(lambda: mock_db),
+        "buckets": lambda: BucketStorage(lambda: mock_db),
+        "columnar": lambda: ColumnarStorage(str(tmp_path)),
+    }[request.param]()
+    monkeypatch.setattr(services.sensors_service, "storage", storage)
+    return storage
+
+@pytest.fixture
+def now():
+    # Milissegundos inteiros: é a resolução dos dois backends
+    return datetime.utcnow().replace(microsecond=0)
+
+async def seed(now, count=60, equipment_id="STATION_1", inserted=None):
+    body = json.dumps([
+        [equipment_id, (now - timedelta(minutes=10 * i)).isoformat(), float(i % 7)]
+        for i in range(count)
+    ]).encode()
+    result = await insert_sensor_batch(body, "application/json")
+    assert result["inserted_count"] == (count if inserted is None else inserted)
+    return result
+
+@pytest.mark.asyncio
+async def test_average_after_insert(backend, now):
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now, value=10.0))
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now - timedelta(hours=2), value=20.0))
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now - timedelta(days=3), value=90.0))
+
+    assert (await calculate_average("STATION_1", "24h"))["average"] == pytest.approx(15.0)
+    assert (await calculate_average("STATION_1", "1w"))["average"] == pytest.approx(40.0)
+    assert (await calculate_average("STATION_9", "24h"))["average"] is None
+
+@pytest.mark.asyncio
+async def test_average_all_stations(backend, now):
+    await seed(now, 10, "STATION_1")
+    await seed(now, 5, "STATION_2")
+
+    averages = {row["equipmentId"]: row["average"] for row in await get_average_all_stations("24h")}
+
+    assert averages == {"STATION_1": pytest.approx(sum(i % 7 for i in range(10)) / 10),
+                        "STATION_2": pytest.approx(sum(i % 7 for i in range(5)) / 5)}
+
+@pytest.mark.asyncio
+async def test_average_all_stations_in_concurrent_ranges(backend, now, monkeypatch):
+    for station in range(12):
+        await seed(now, 3 + station, f"STATION_{station:02d}")
+    start = now - timedelta(hours=24)
+    expected = {station: summary["sum"] / summary["count"]
+                for station, summary in (await backend.summaries(start)).items()}
+
+    # As faixas cobrem todas as estações, cada uma numa só faixa
+    ranges = await backend.station_ranges(start, 4)
+    assert 1 <= len(ranges) <= 4 and ranges[0][0] is None and ranges[-1][1] is None
+    covered = [station for low, high in ranges for station in await backend.summaries(start, low, high)]
+    assert sorted(covered) == sorted(expected)
+
+    monkeypatch.setattr(settings, "AVERAGES_PARTITIONS", 4)
+    monkeypatch.setattr(settings, "AVERAGES_CONCURRENCY", 2)
+    averages = {row["equipmentId"]: row["average"] for row in await get_average_all_stations("24h")}
+    assert averages == pytest.approx(expected)
+
+    top = await get_average_all_stations("24h", top_k=3, max_average=3.0)
+    best = sorted((average for average in expected.values() if average <= 3.0), reverse=True)[:3]
+    assert [row["average"] for row in top] == pytest.approx(best)
+
+@pytest.mark.asyncio
+async def test_station_data_raw_buckets_and_lttb(backend, now):
+    await seed(now)
+
+    raw = await get_station_data("STATION_1", "24h")
+    assert len(raw["values"]) == 60
+
+    buckets = await get_station_data("STATION_1", "24h", resolution="1h")
+    assert sum(bucket["count"] for bucket in buckets["values"]) == 60
+    assert buckets["average"] == pytest.approx(raw["average"])
+
+    sampled = await get_station_data("STATION_1", "24h", max_points=10, method="lttb")
+    assert len(sampled["values"]) == 10
+    assert sampled["average"] == pytest.approx(raw["average"])
+
+@pytest.mark.asyncio
+async def test_pagination_and_export(backend, now):
+    await seed(now)
+
+    seen = []
+    cursor = None
+    while True:
+        page = await get_station_page("STATION_1", "24h", limit=7, cursor=cursor)
+        seen.extend((v["timestamp"], v["value"]) for v in page["values"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 60
+    assert seen == sorted(seen, key=lambda item: item[0])
+
+    body = "".join([chunk async for chunk in export_station_data("STATION_1", "24h", "ndjson")])
+    assert len(body.splitlines()) == 60
+
+@pytest.mark.asyncio
+async def test_ingest_is_idempotent(backend, now):
+    await seed(now, 10)
+
+    # Reenvio (retry do dispositivo) com leituras novas e repetidas, inclusive no próprio lote
+    body = json.dumps([
+        ["STATION_1", now.isoformat(), 99.0],
+        ["STATION_1", (now + timedelta(minutes=1)).isoformat(), 6.0],
+        ["STATION_1", (now + timedelta(minutes=1)).isoformat(), 6.0],
+    ]).encode()
+    result = await insert_sensor_batch(body, "application/json")
+    assert (result["inserted_count"], result["duplicate_count"], result["rejected_count"]) == (1, 2, 0)
+    assert [item["status"] for item in result["results"]] == ["duplicate", "inserted", "duplicate"]
+
+    retry = await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now, value=99.0))
+    assert retry == {"message": "Data already stored", "id": None}
+
+    summary = await calculate_average("STATION_1", "24h")
+    assert summary["average"] == pytest.approx((sum(i % 7 for i in range(10)) + 6.0) / 11)
+    assert len((await get_station_data("STATION_1", "24h"))["values"]) == 11
+
+@pytest.mark.asyncio
+async def test_late_readings_fall_outside_the_reorder_window(backend, now, monkeypatch):
+    monkeypatch.setattr(services.sensors_service, "reorder_window", ReorderWindow(seconds=600))
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now, value=1.0))
+
+    # Dentro da janela a leitura fora de ordem entra; fora dela é recusada
+    await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now - timedelta(minutes=5), value=2.0))
+    with pytest.raises(HTTPException) as excinfo:
+        await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=now - timedelta(hours=1), value=3.0))
+    assert excinfo.value.status_code == 422
+
+    body = json.dumps([["STATION_1", (now - timedelta(hours=2)).isoformat(), 4.0],
+                       ["STATION_2", (now - timedelta(hours=2)).isoformat(), 5.0]]).encode()
+    result = await insert_sensor_batch(body, "application/json")
+    assert [item["status"] for item in result["results"]] == ["rejected", "inserted"]
+    assert (await calculate_average("STATION_1", "24h"))["average"] == pytest.approx(1.5)
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_id(backend, now):
+    await seed(now, 3)
+    page = await get_station_page("STATION_1", "24h", limit=1)
+    token = json.loads(services.sensors_service.base64.urlsafe_b64decode(page["next_cursor"] + "=="))
+    token["id"] = "not-an-id"
+    forged = services.sensors_service.base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_station_page("STATION_1", "24h", cursor=forged)
+    assert exc_info.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_columnar_segments_are_partitioned_by_day(tmp_path):
+    storage = ColumnarStorage(str(tmp_path))
+    day = datetime(2024, 12, 6, 23, 59)
+    await storage.insert([
+        {"equipmentId": "STATION_1", "timestamp": day, "value": 1.0},
+        {"equipmentId": "STATION_1", "timestamp": day + timedelta(minutes=2), "value": 3.0},
+    ])
+
+    directory = storage._station_dir("STATION_1")
+    assert len(os.listdir(directory)) == 2
+
+    # Um registro pela metade (queda durante a escrita) é ignorado
+    with open(os.path.join(directory, sorted(os.listdir(directory))[0]), "ab") as f:
+        f.write(b"\x00" * (RECORD_DTYPE.itemsize // 2))
+    summary = await storage.summarize("STATION_1", day - timedelta(hours=1))
+    assert summary == {"count": 2, "sum": 4.0, "min": 1.0, "max": 3.0}
+
+@pytest.mark.asyncio
+async def test_columnar_trims_a_torn_record_before_appending(tmp_path):
+    day = datetime(2024, 12, 6, 12)
+    readings = [
+        {"equipmentId": "STATION_1", "timestamp": day + timedelta(minutes=i), "value": float(i)} for i in range(3)
+    ]
+    storage = ColumnarStorage(str(tmp_path))
+    await storage.insert(readings[:1])
+    [segment] = os.listdir(storage._station_dir("STATION_1"))
+    with open(os.path.join(storage._station_dir("STATION_1"), segment), "ab") as f:
+        f.write(b"\x00" * 3)
+
+    # Processo reiniciado: os registros seguintes não ficam desalinhados pelos bytes soltos
+    stored, error = await ColumnarStorage(str(tmp_path)).insert(readings[1:])
+    assert error is None and stored == readings[1:]
+    docs = await ColumnarStorage(str(tmp_path)).values("STATION_1", day)
+    assert [doc["value"] for doc in docs] == [0.0, 1.0, 2.0]
+
+@pytest.mark.asyncio
+async def test_columnar_skips_readings_already_in_the_segment(tmp_path):
+    day = datetime(2024, 12, 6, 12)
+    readings = [
+        {"equipmentId": "STATION_1", "timestamp": day + timedelta(minutes=i), "value": float(i)} for i in range(5)
+    ]
+    stored, _ = await ColumnarStorage(str(tmp_path)).insert(readings[1:])
+    assert len(stored) == 4
+
+    # Outra instância (processo reiniciado) lê os timestamps do segmento; a mais antiga é nova
+    stored, error = await ColumnarStorage(str(tmp_path)).insert(readings + readings[:1])
+    assert error is None
+    assert stored == readings[:1]
+    assert (await ColumnarStorage(str(tmp_path)).summarize("STATION_1", day))["count"] == 5
+
+@pytest.mark.asyncio
+async def test_remove_duplicates_before_the_unique_index(mock_db):
+    now = datetime.utcnow().replace(microsecond=0)
+    key = [("equipmentId", 1), ("timestamp", 1)]
+    # Banco de antes da ingestão idempotente: índice não único com o mesmo nome e leituras repetidas
+    await mock_db["sensors"].create_index(key)
+    await mock_db["sensors"].insert_many([
+        {"equipmentId": "STATION_1", "timestamp": now - timedelta(minutes=i % 4), "value": float(i)} for i in range(10)
+    ])
+    with pytest.raises(RuntimeError):
+        await ensure_indexes(mock_db)
+
+    assert await remove_duplicates(mock_db, batch_size=2) == 6
+    await ensure_indexes(mock_db)
+    indexes = await mock_db["sensors"].index_information()
+    assert any(info.get("unique") and info["key"] == key for info in indexes.values())
+    # Fica a primeira gravada de cada instante
+    assert sorted([doc["value"] async for doc in mock_db["sensors"].find()]) == [0.0, 1.0, 2.0, 3.0]
+
+def test_create_storage_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        create_storage("sqlite", lambda: None, "data")
+
+def test_unknown_read_preference_is_rejected():
+    with pytest.raises(ValueError):
+        read_preference("fastest")
+    assert read_preference("primary") is None
+
+class RecordingCollection:
+    def __init__(self, collection, preference, calls):
+        self._collection = collection
+        self._preference = preference
+        self._calls = calls
+
+    def _record(self, operation, kwargs):
+        self._calls.append((self._collection.name, self._preference, operation, kwargs))
+
+    def find(self, *args, **kwargs):
+        self._record("find", kwargs)
+        return self._collection.find(*args, **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._record("aggregate", kwargs)
+        return self._collection.aggregate(pipeline, **kwargs)
+
+    def insert_many(self, docs, **kwargs):
+        self._record("insert_many", kwargs)
+        return self._collection.insert_many(docs, **kwargs)
+
+    def bulk_write(self, operations, **kwargs):
+        self._record("bulk_write", kwargs)
+        return self._collection.bulk_write(operations, **kwargs)
+
+class RecordingDatabase:
+    """Records the read preference each collection was taken with and the options of each call."""
+
+    def __init__(self, database):
+        self._database = database
+        self.calls = []
+
+    def __getitem__(self, name):
+        return RecordingCollection(self._database[name], None, self.calls)
+
+    def get_collection(self, name, read_preference=None):
+        return RecordingCollection(self._database.get_collection(name, read_preference=read_preference),
+                                   read_preference, self.calls)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_class", [MongoStorage, BucketStorage])
+async def test_analytical_reads_are_routed_with_their_budget(mock_db, monkeypatch, now, storage_class):
+    monkeypatch.setattr(settings, "ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setattr(settings, "ANALYTICS_MAX_STALENESS_SECONDS", 120)
+    monkeypatch.setattr(settings, "QUERY_BUDGETS", {
+        "average": {"max_time_ms": 1000, "allow_disk_use": False},
+        "averages": {"max_time_ms": 2000, "allow_disk_use": True},
+        "page": {"max_time_ms": 3000, "allow_disk_use": False},
+    })
+    recorder = RecordingDatabase(mock_db)
+    storage = storage_class(lambda: recorder)
+
+    await storage.insert([
+        {"_id": ObjectId(), "equipmentId": "STATION_1", "timestamp": now - timedelta(minutes=m), "value": float(m)}
+        for m in range(10)
+    ])
+    # Gravações sempre no primário, sem orçamento
+    assert recorder.calls and all(preference is None and "maxTimeMS" not in kwargs
+                                  for _, preference, _, kwargs in recorder.calls)
+
+    expected = {
+        "average": {"maxTimeMS": 1000},
+        "averages": {"maxTimeMS": 2000, "allowDiskUse": True},
+        "page": {"max_time_ms": 3000},
+    }
+    queries = {
+        "average": lambda: storage.summarize("STATION_1", now - timedelta(hours=1)),
+        "averages": lambda: storage.summaries(now - timedelta(hours=1)),
+        "page": lambda: storage.page("STATION_1", now - timedelta(hours=1), 5),
+    }
+    for query, run in queries.items():
+        recorder.calls.clear()
+        await run()
+        assert recorder.calls
+        for _, preference, _, kwargs in recorder.calls:
+            assert preference == SecondaryPreferred(max_staleness=120)
+            assert {key: kwargs[key] for key in ("maxTimeMS", "max_time_ms", "allowDiskUse") if key in kwargs} \
+                == expected[query]
+
+@pytest.mark.asyncio
+async def test_query_over_its_time_budget_is_unavailable(mock_db, monkeypatch):
+    services.sensors_service.db = mock_db
+
+    async def timed_out(*args):
+        raise ExecutionTimeout("operation exceeded time limit", 50)
+
+    monkeypatch.setattr(services.sensors_service.storage, "summaries", timed_out)
+    with pytest.raises(HTTPException) as exc_info:
+        await get_average_all_stations("24h")
+    assert exc_info.value.status_code == 503
+
+@pytest.mark.asyncio
+async def test_buckets_hold_one_document_per_station_hour(mock_db):
+    storage = BucketStorage(lambda: mock_db)
+    start = datetime(2024, 12, 6, 10, 0)
+    await storage.insert([
+        {"_id": ObjectId(), "equipmentId": "STATION_1", "timestamp": start + timedelta(minutes=m), "value": float(m)}
+        for m in range(0, 120, 2)
+    ])
+
+    buckets = [doc async for doc in mock_db[bucketed.COLLECTION].find({})]
+    assert [(doc["start"], doc["count"]) for doc in buckets] == [(start, 30), (start + timedelta(hours=1), 30)]
+    assert buckets[0]["min"] == 0.0 and buckets[1]["max"] == 118.0
+
+    # Janela começando no meio de uma hora: só os readings dessa hora são desagregados
+    summary = await storage.summarize("STATION_1", start + timedelta(minutes=31))
+    assert summary["count"] == 44
+    assert summary["sum"] == sum(float(m) for m in range(32, 120, 2))
+
+@pytest.mark.asyncio
+async def test_migrate_flat_readings_to_buckets(mock_db):
+    start = datetime(2024, 12, 6, 10, 0)
+    await mock_db["sensors"].insert_many([
+        {"equipmentId": f"STATION_{i % 3}", "timestamp": start + timedelta(minutes=7 * i), "value": float(i)}
+        for i in range(100)
+    ])
+
+    assert await bucketed.migrate(mock_db, batch_size=17) == 100
+    # Pode ser executada de novo sem duplicar leituras
+    assert await bucketed.migrate(mock_db, batch_size=17) == 100
+
+    storage = BucketStorage(lambda: mock_db)
+    summary = (await storage.summaries(start))["STATION_0"]
+    assert summary["sum"] / summary["count"] == pytest.approx(sum(range(0, 100, 3)) / len(range(0, 100, 3)))
+    indexes = await mock_db[bucketed.COLLECTION].index_information()
+    assert any(info.get("unique") for info in indexes.values())
+
+@pytest.mark.asyncio
+async def test_bucket_intervals_use_the_hourly_summaries(mock_db):
+    storage = BucketStorage(lambda: mock_db)
+    start = datetime(2024, 12, 6, 10, 17)
+    await storage.insert([
+        {"equipmentId": "STATION_1", "timestamp": start + timedelta(minutes=7 * i), "value": float(i % 11)}
+        for i in range(100)
+    ])
+    times, values = await storage.arrays("STATION_1", start)
+    for minutes in (10, 60, 90, 360, 1440):
+        expected = bucketize(times, values, to_millis(start), minutes * 60000)
+        assert await storage.buckets("STATION_1", start, minutes * 60000) == expected
+
+    # Só a hora na borda da janela é lida leitura a leitura: as demais valem pelo resumo do bucket
+    expected = bucketize(times, values, to_millis(start), 1440 * 60000)
+    await mock_db[bucketed.COLLECTION].update_many({"start": {"$gt": datetime(2024, 12, 6, 10)}},
+                                                  {"$set": {"readings": []}})
+    assert await storage.buckets("STATION_1", start, 1440 * 60000) == expected
+
+@pytest.mark.asyncio
+async def test_query_statistics_over_a_range(backend, now):
+    await seed(now, 60)
+    values = np.array([float(i % 7) for i in range(60)])
+
+    result = await query_statistics("STATION_1", duration="24h", end=now + timedelta(seconds=1))
+    [group] = result["groups"]
+    assert group["count"] == 60
+    assert group["mean"] == pytest.approx(values.mean())
+    assert group["stddev"] == pytest.approx(values.std())
+    assert group["max"] == 6.0 and group["p50"] == pytest.approx(np.median(values), rel=0.01)
+
+    # Intervalo explícito: só as leituras de [start, end), agrupadas por hora
+    start = now - timedelta(minutes=295)
+    hourly = await query_statistics("STATION_1", start=start, end=now - timedelta(minutes=55),
+                                    group_by="1h", stats="count,p99")
+    assert sum(group["count"] for group in hourly["groups"]) == 24
+    assert set(hourly["groups"][0]) == {"start", "count", "p99"}
+
+@pytest.mark.asyncio
+async def test_query_statistics_rejects_invalid_input(backend, now):
+    for kwargs in ({"duration": "1x"}, {"duration": "24h", "stats": "median"}, {},
+                   {"start": now, "end": now - timedelta(hours=1)}, {"duration": "1y", "group_by": "1min"}):
+        with pytest.raises(HTTPException) as exc_info:
+            await query_statistics("STATION_1", **kwargs)
+        assert exc_info.value.status_code == 400
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import pytest
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo.errors import ServerSelectionTimeoutError
+from models.sensor_data import SensorData
+from services import wal as wal_module
+from services.sensors_service import _write_readings, insert_sensor_data
+from services.wal import WALFull, WriteAheadLog
+import services.sensors_service
+
+START = datetime(2024, 12, 6, 12)
+
+def reading(i, equipment_id="STATION_1"):
+    return {"_id": ObjectId(), "equipmentId": equipment_id, "timestamp": START + timedelta(seconds=i),
+            "value": float(i)}
+
+class RecordingSink:
+    def __init__(self, failures=0):
+        self.docs = []
+        self.failures = failures
+
+    async def __call__(self, docs):
+        if self.failures:
+            self.failures -= 1
+            raise ServerSelectionTimeoutError("mongo is restarting")
+        self.docs.extend(docs)
+
+async def drained(sink, count):
+    for _ in range(200):
+        if len(sink.docs) >= count:
+            return sink.docs
+        await asyncio.sleep(0.01)
+    raise AssertionError("WAL was not replayed.")
+
+def segments(directory, lane="lane-0"):
+    return sorted(name for name in os.listdir(os.path.join(directory, lane)) if name.endswith(".wal"))
+
+@pytest.mark.asyncio
+async def test_appends_are_replayed_in_order(tmp_path):
+    sink = RecordingSink()
+    wal = WriteAheadLog(str(tmp_path), flush=sink, drain_interval=0.01)
+    docs = [reading(i) for i in range(20)]
+
+    await asyncio.gather(*(wal.append(doc) for doc in docs))
+
+    assert await drained(sink, 20) == docs
+    status = wal.status()
+    assert status["appended"] == 20 and status["replayed"] == 20
+    assert status["lag_bytes"] == 0 and status["lag_seconds"] == 0.0
+    await wal.stop()
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_share_a_group_commit(tmp_path, monkeypatch):
+    fsyncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(wal_module.os, "fsync", lambda fd: fsyncs.append(fd) or fsync(fd))
+    wal = WriteAheadLog(str(tmp_path), flush=RecordingSink(), fsync="always")
+
+    await asyncio.gather(*(wal.append(reading(i)) for i in range(100)))
+
+    # Cada append esperou um fsync, mas os que chegaram juntos dividiram o mesmo
+    assert 1 <= len(fsyncs) < 10
+    await wal.stop()
+
+@pytest.mark.asyncio
+async def test_readings_survive_an_outage_and_a_restart(tmp_path):
+    down = RecordingSink(failures=1000)
+    wal = WriteAheadLog(str(tmp_path), flush=down)
+    docs = [reading(i) for i in range(10)]
+    for doc in docs:
+        await wal.append(doc)
+    with pytest.raises(ServerSelectionTimeoutError):
+        await wal.drain_once()
+    assert wal.lag_bytes > 0
+    await wal.stop()
+
+    # Queda no meio de um append: o registro pela metade é ignorado
+    with open(os.path.join(tmp_path, "lane-0", segments(tmp_path)[-1]), "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+
+    sink = RecordingSink()
+    restarted = WriteAheadLog(str(tmp_path), flush=sink)
+    while await restarted.drain_once():
+        pass
+    assert sink.docs == docs
+    assert restarted.lag_bytes == 0 and segments(tmp_path) == []
+
+@pytest.mark.asyncio
+async def test_failed_replays_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(wal_module, "RETRY_MIN_SECONDS", 0.01)
+    sink = RecordingSink(failures=2)
+    wal = WriteAheadLog(str(tmp_path), flush=sink, drain_interval=0.01)
+
+    await wal.append(reading(0))
+
+    assert len(await drained(sink, 1)) == 1
+    assert wal.status()["replayed"] == 1 and wal.status()["last_error"] is None
+    await wal.stop()
+
+@pytest.mark.asyncio
+async def test_segments_roll_and_are_deleted_once_replayed(tmp_path):
+    sink = RecordingSink()
+    wal = WriteAheadLog(str(tmp_path), flush=sink, segment_bytes=300, drain_batch_size=3, drain_interval=10)
+    for i in range(12):
+        await wal.append(reading(i))
+    assert wal.status()["segment"] > 2
+
+    while await wal.drain_once():
+        pass
+    assert len(sink.docs) == 12
+    # Só o segmento ativo continua no disco
+    assert len(segments(tmp_path)) == 1
+    await wal.stop()
+
+@pytest.mark.asyncio
+async def test_full_log_rejects_appends(tmp_path):
+    wal = WriteAheadLog(str(tmp_path), flush=RecordingSink(failures=1000), max_bytes=1000, drain_interval=10)
+    with pytest.raises(WALFull):
+        for i in range(100):
+            await wal.append(reading(i))
+    assert 0 < wal.lag_bytes <= 1000
+    await wal.stop()
+
+@pytest.mark.asyncio
+async def test_abandoned_lanes_are_replayed_by_another_process(tmp_path):
+    gone = WriteAheadLog(str(tmp_path), flush=RecordingSink(failures=1000), drain_interval=10)
+    docs = [reading(i, "STATION_2") for i in range(5)]
+    for doc in docs:
+        await gone.append(doc)
+
+    sink = RecordingSink()
+    other = WriteAheadLog(str(tmp_path), flush=sink, drain_interval=10)
+    assert await other.drain_once() == 0
+    assert other.status()["lane"] == "lane-1"
+
+    # O processo da lane-0 parou: a lane fica livre para o drainer dos outros
+    await gone.stop()
+    while await other.drain_once():
+        pass
+    assert sink.docs == docs
+    assert segments(tmp_path) == []
+
+def test_unknown_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        WriteAheadLog(str(tmp_path), flush=RecordingSink(), fsync="sometimes")
+
+@pytest.mark.asyncio
+async def test_insert_sensor_data_through_wal(mock_db, tmp_path, monkeypatch):
+    services.sensors_service.db = mock_db
+    monkeypatch.setattr(services.sensors_service.settings, "WAL_ENABLED", True)
+    wal = WriteAheadLog(str(tmp_path), flush=_write_readings, drain_interval=0.01)
+    monkeypatch.setattr(services.sensors_service, "wal", wal)
+
+    result = await insert_sensor_data(SensorData(equipmentId="STATION_1", timestamp=datetime.utcnow(), value=25.0))
+    assert result["message"] == "Data accepted"
+
+    for _ in range(200):
+        if await mock_db["sensors"].count_documents({}):
+            break
+        await asyncio.sleep(0.01)
+    stored = await mock_db["sensors"].find_one({"_id": ObjectId(result["id"])})
+    assert stored["value"] == 25.0
+    await wal.stop()
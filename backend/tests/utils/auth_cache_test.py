@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from datetime import timedelta
+from jwt.exceptions import ExpiredSignatureError
+import utils.auth
+from utils.auth import create_access_token, decode_access_token
+from utils.hash import hash_password_async, verify_password_async
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    utils.auth._token_cache.clear()
+    yield
+    utils.auth._token_cache.clear()
+
+def test_decoded_payload_is_cached(monkeypatch):
+    token = create_access_token(data={"username": "test_user"})
+    assert decode_access_token(token)["sub"] == "test_user"
+
+    def fail(*args, **kwargs):
+        raise AssertionError("token verified twice")
+    monkeypatch.setattr(utils.auth.jwt, "decode", fail)
+
+    assert decode_access_token(token)["sub"] == "test_user"
+
+def test_cached_payload_expires(monkeypatch):
+    token = create_access_token(data={"username": "test_user"}, expires_delta=timedelta(seconds=30))
+    payload = decode_access_token(token)
+
+    def expired(*args, **kwargs):
+        raise ExpiredSignatureError("Signature has expired")
+    monkeypatch.setattr(utils.auth.time, "time", lambda: payload["exp"] + 1)
+    monkeypatch.setattr(utils.auth.jwt, "decode", expired)
+
+    assert decode_access_token(token) is None
+    assert token not in utils.auth._token_cache
+
+def test_invalid_tokens_are_not_cached():
+    assert decode_access_token("invalid.token.string") is None
+    assert not utils.auth._token_cache
+
+def test_token_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(utils.auth.settings, "AUTH_TOKEN_CACHE_SIZE", 3)
+    tokens = [create_access_token(data={"username": f"user_{i}"}) for i in range(5)]
+    for token in tokens:
+        decode_access_token(token)
+    assert list(utils.auth._token_cache) == tokens[2:]
+
+@pytest.mark.asyncio
+async def test_password_hashing_does_not_block_the_loop():
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    task = asyncio.create_task(ticker())
+    hashed = await hash_password_async("secret")
+    assert await verify_password_async("secret", hashed)
+    assert not await verify_password_async("wrong", hashed)
+    task.cancel()
+
+    assert ticks > 3
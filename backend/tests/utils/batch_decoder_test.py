@@ -0,0 +1,64 @@
+import json
+import msgpack
+import numpy as np
+import pytest
+from datetime import datetime
+from utils.batch_decoder import (
+    BINARY, JSON, MSGPACK, NDJSON, READING_DTYPE, BatchFormatError, decode_batch, media_type
+)
+
+ITEMS = [
+    {"equipmentId": "STATION_1", "timestamp": "2024-12-06T10:00:00Z", "value": 25.5},
+    ["STATION_2", 1733479200000, 30],
+]
+
+def test_media_type_ignores_parameters():
+    assert media_type("application/json; charset=utf-8") == JSON
+    assert media_type("application/x-msgpack") == MSGPACK
+    assert media_type("text/csv") is None
+
+@pytest.mark.parametrize("kind, body", [
+    (JSON, json.dumps(ITEMS).encode()),
+    (NDJSON, "\n".join(json.dumps(item) for item in ITEMS).encode()),
+    (MSGPACK, msgpack.packb(ITEMS)),
+])
+def test_decode_text_formats(kind, body):
+    docs, errors = decode_batch(body, kind)
+    assert errors == []
+    assert [doc["equipmentId"] for doc in docs] == ["STATION_1", "STATION_2"]
+    assert docs[1]["timestamp"] == datetime(2024, 12, 6, 10, 0)
+    assert docs[1]["value"] == 30.0
+
+def test_decode_binary_records():
+    records = np.zeros(3, dtype=READING_DTYPE)
+    records["equipmentId"] = [b"STATION_1", b"STATION_2", b""]
+    records["timestamp"] = 1733479200000
+    records["value"] = [1.5, float("nan"), 3.0]
+
+    docs, errors = decode_batch(records.tobytes(), BINARY)
+
+    assert docs[0] == {"equipmentId": "STATION_1", "timestamp": datetime(2024, 12, 6, 10, 0), "value": 1.5}
+    assert docs[1] is None and docs[2] is None
+    assert [error["index"] for error in errors] == [1, 2]
+
+def test_invalid_items_are_reported_by_index():
+    items = [
+        {"equipmentId": "STATION_1", "timestamp": "2024-12-06T10:00:00", "value": 1.0},
+        {"equipmentId": "STATION_1", "value": 1.0},
+        {"equipmentId": "", "timestamp": "2024-12-06T10:00:00", "value": 1.0},
+        {"equipmentId": "STATION_1", "timestamp": "yesterday", "value": 1.0},
+        {"equipmentId": "STATION_1", "timestamp": "2024-12-06T10:00:00", "value": True},
+        "not a reading",
+    ]
+    docs, errors = decode_batch(json.dumps(items).encode(), JSON)
+    assert docs[0] is not None
+    assert [error["index"] for error in errors] == [1, 2, 3, 4, 5]
+
+@pytest.mark.parametrize("kind, body", [
+    (JSON, b"{not json"),
+    (JSON, b'{"equipmentId": "STATION_1"}'),
+    (BINARY, b"\x00" * 31),
+])
+def test_malformed_bodies(kind, body):
+    with pytest.raises(BatchFormatError):
+        decode_batch(body, kind)
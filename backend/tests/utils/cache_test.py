@@ -0,0 +1,134 @@
+import asyncio
+import uuid
+import pytest
+from utils.cache import ALL_STATIONS, ResponseCache, SharedGenerations
+
+def counting_loader(result="value", delay=0.0):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+
+    return load, calls
+
+@pytest.mark.asyncio
+async def test_hit_after_miss():
+    cache = ResponseCache()
+    load, calls = counting_loader()
+
+    assert await cache.get_or_load("key", "STATION_1", load) == "value"
+    assert await cache.get_or_load("key", "STATION_1", load) == "value"
+
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    cache = ResponseCache()
+    load, calls = counting_loader(delay=0.01)
+
+    results = await asyncio.gather(*[cache.get_or_load("key", "STATION_1", load) for _ in range(50)])
+
+    assert results == ["value"] * 50
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 49
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0.01)
+    load, calls = counting_loader()
+
+    await cache.get_or_load("key", "STATION_1", load)
+    await asyncio.sleep(0.02)
+    await cache.get_or_load("key", "STATION_1", load)
+
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2)
+    for key in ("a", "b"):
+        await cache.get_or_load(key, "STATION_1", counting_loader(key)[0])
+    await cache.get_or_load("a", "STATION_1", counting_loader()[0])  # "a" passa a ser o mais recente
+    await cache.get_or_load("c", "STATION_1", counting_loader("c")[0])
+    assert set(key for key in cache._entries) == {"a", "c"}
+
+    small = ResponseCache(max_bytes=8 * 1024)
+    await small.get_or_load("big", "STATION_1", counting_loader("x" * 4096)[0])
+    assert small.stats()["entries"] == 0
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_station_entries_when_read():
+    cache = ResponseCache()
+    loads = {key: counting_loader() for key in ("s1", "s2", "all")}
+    tags = {"s1": "STATION_1", "s2": "STATION_2", "all": ALL_STATIONS}
+    for key, (load, _) in loads.items():
+        await cache.get_or_load(key, tags[key], load)
+
+    cache.invalidate({"STATION_1"})
+    for key, (load, _) in loads.items():
+        await cache.get_or_load(key, tags[key], load)
+
+    # As médias de todas as estações não são invalidadas pela ingestão, só expiram
+    assert {key: len(calls) for key, (_, calls) in loads.items()} == {"s1": 2, "s2": 1, "all": 1}
+    assert cache.stats()["invalidations"] == 1
+
+@pytest.mark.asyncio
+async def test_all_station_entries_expire_after_their_own_ttl():
+    cache = ResponseCache(ttl=60, all_stations_ttl=0.01)
+    load, calls = counting_loader()
+    await cache.get_or_load("all", ALL_STATIONS, load)
+    await asyncio.sleep(0.02)
+    await cache.get_or_load("all", ALL_STATIONS, load)
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_load_invalidated_while_running_is_not_stored():
+    cache = ResponseCache()
+    load, calls = counting_loader(delay=0.01)
+
+    pending = asyncio.ensure_future(cache.get_or_load("key", "STATION_1", load))
+    await asyncio.sleep(0)
+    cache.invalidate({"STATION_1"})
+    assert await pending == "value"
+
+    await cache.get_or_load("key", "STATION_1", load)
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_errors_are_not_cached():
+    cache = ResponseCache()
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise RuntimeError("boom")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("key", "STATION_1", failing)
+    assert len(attempts) == 2
+
+@pytest.mark.asyncio
+async def test_shared_generations_invalidate_other_workers():
+    name = f"cache_test_{uuid.uuid4().hex[:8]}"
+    owner = SharedGenerations(name)
+    try:
+        # Dois "workers" com caches próprios sobre o mesmo segmento
+        worker_a = ResponseCache(generations=owner)
+        worker_b = ResponseCache(generations=SharedGenerations(name))
+        load, calls = counting_loader()
+        await worker_a.get_or_load("s1", "STATION_1", load)
+        await worker_a.get_or_load("s2", "STATION_2", load)
+
+        worker_b.invalidate({"STATION_1"})
+
+        await worker_a.get_or_load("s1", "STATION_1", load)
+        await worker_a.get_or_load("s2", "STATION_2", load)
+        assert len(calls) == 3
+        assert worker_a.stats()["invalidations"] == 1
+    finally:
+        owner.unlink()
@@ -0,0 +1,157 @@
+import pytest
+import random
+from datetime import datetime, timedelta, timezone
+from utils.csv_parser import (
+    PARSERS, ColumnarCSVParser, CSVFormatError, CSVStreamParser, ReadingColumns, create_parser, parse_block,
+    parse_timestamp, parse_timestamps
+)
+
+def instant(timestamp: datetime) -> datetime:
+    # Sem offset é UTC: é assim que o Mongo guarda os dois parsers
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def documents(rows):
+    # O parser colunar devolve ReadingColumns (instantes em UTC); os testes comparam documentos
+    if isinstance(rows, ReadingColumns):
+        rows = rows.to_documents()
+    return [{**row, "timestamp": instant(row["timestamp"])} for row in rows]
+
+def feed_in_chunks(parser, data: bytes, size: int):
+    rows, errors = [], []
+    for i in range(0, len(data), size):
+        chunk_rows, chunk_errors = parser.feed(data[i:i + size])
+        rows.extend(documents(chunk_rows))
+        errors.extend(chunk_errors)
+    chunk_rows, chunk_errors = parser.close()
+    return rows + documents(chunk_rows), errors + chunk_errors
+
+def test_parse_timestamp_accepts_z_suffix():
+    assert parse_timestamp("2024-12-05T15:00:00Z") == datetime(2024, 12, 5, 15, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("kind", PARSERS)
+@pytest.mark.parametrize("size", [1, 7, 64, 4096])
+def test_stream_parser_is_independent_of_chunk_size(kind, size):
+    data = (
+        "equipmentId,timestamp,value\n"
+        "EQ-1,2024-12-05T15:00:00.000Z,42.75\r\n"
+        "EQ-2,2024-12-05T15:00:01+00:00,1.5\n"
+        "EQ-3,2024-12-05T15:00:02+00:00,2"
+    ).encode()
+    parser = create_parser(kind)
+    rows, errors = feed_in_chunks(parser, data, size)
+
+    assert errors == []
+    assert [row["equipmentId"] for row in rows] == ["EQ-1", "EQ-2", "EQ-3"]
+    assert rows[0]["value"] == 42.75
+
+@pytest.mark.parametrize("kind", PARSERS)
+def test_stream_parser_reports_row_errors_with_line_numbers(kind):
+    data = (
+        "value,equipmentId,timestamp\n"
+        "1.0,EQ-1,2024-12-05T15:00:00Z\n"
+        "abc,EQ-1,2024-12-05T15:00:00Z\n"
+        "2.0,EQ-1,not-a-date\n"
+        "3.0,EQ-1\n"
+        "4.0,EQ-2,2024-12-05T15:00:00Z\n"
+    ).encode()
+    rows, errors = feed_in_chunks(create_parser(kind), data, 16)
+
+    assert [row["value"] for row in rows] == [1.0, 4.0]
+    assert [error["line"] for error in errors] == [3, 4, 5]
+
+@pytest.mark.parametrize("kind", PARSERS)
+def test_stream_parser_rejects_invalid_header(kind):
+    parser = create_parser(kind)
+    with pytest.raises(CSVFormatError):
+        parser.feed(b"id,time,value\nEQ-1,2024-12-05T15:00:00Z,1\n")
+
+@pytest.mark.parametrize("kind", PARSERS)
+def test_stream_parser_rejects_empty_file(kind):
+    with pytest.raises(CSVFormatError):
+        create_parser(kind).close()
+
+@pytest.mark.parametrize("kind", PARSERS)
+def test_stream_parser_resumes_from_offset(kind):
+    data = b"equipmentId,timestamp,value\nEQ-1,2024-12-05T15:00:00Z,1\nEQ-2,2024-12-05T15:00:00Z,2\n"
+    first = create_parser(kind)
+    first.feed(data[:60])
+
+    resumed = create_parser(kind, offset=first.offset, line_number=first.line_number, header=first.header)
+    rows, errors = feed_in_chunks(resumed, data[first.offset:], 10)
+    assert [row["equipmentId"] for row in rows] == ["EQ-2"]
+    assert resumed.offset == len(data)
+
+def test_unknown_parser_is_rejected():
+    with pytest.raises(ValueError):
+        create_parser("pandas")
+
+def test_parse_timestamps_matches_parse_timestamp():
+    rng = random.Random(7)
+    start = datetime(1999, 12, 31, 23, 59, 59)
+    values = []
+    for _ in range(2000):
+        moment = start + timedelta(seconds=rng.randrange(40 * 365 * 86400), microseconds=rng.randrange(10 ** 6))
+        text = moment.isoformat(sep=rng.choice("T "), timespec=rng.choice(["seconds", "milliseconds", "microseconds"]))
+        values.append(text + rng.choice(["", "Z", "+00:00", "-03:00", "+05:30"]))
+    # Formatos fora do caminho rápido: caem no fromisoformat, com o mesmo resultado
+    values += ["2024-02-29", "2024-12-05T15:00", "2024-12-05T15:00:00.1234567Z", "2023-02-29T00:00:00",
+               "2024-13-01T00:00:00", "2024-12-05T24:00:00", "not-a-date", ""]
+
+    millis, parsed = parse_timestamps([value.encode() for value in values])
+    assert parsed[:2000].all()
+    for value, ms, ok in zip(values, millis.tolist(), parsed.tolist()):
+        if ok:
+            expected = instant(parse_timestamp(value)).replace(microsecond=0)
+            assert ms // 1000 == expected.timestamp(), value
+
+MESSY_CSV = (
+    "equipmentId,timestamp,value\n"
+    "EQ-1,2024-12-05T15:00:00.000Z,42.75\r\n"
+    "  EQ-2 , 2024-12-05 15:00:01+00:00 , 1.5e3 \n"
+    "\n"
+    "   \n"
+    "EQ-3,2024-12-05T15:00:02-03:00,nan\n"
+    ",2024-12-05T15:00:03Z,1\n"
+    "EQ-4,2024-02-30T00:00:00Z,1\n"
+    "EQ-5,2024-12-05T15:00:04Z,abc\n"
+    "EQ-6,2024-12-05T15:00:05Z\n"
+    "EQ-7,2024-12-05T15:00:06Z,1,extra\n"
+    "\"EQ-8\",2024-12-05T15:00:07Z,8\n"
+    "EQ-9,2024-12-05,9\n"
+    "EQ-10,2024-12-05T15:00:08.5+05:30,-0.25"
+).encode()
+
+@pytest.mark.parametrize("size", [5, 64, len(MESSY_CSV)])
+def test_columnar_parser_matches_row_parser(size):
+    expected = feed_in_chunks(CSVStreamParser(), MESSY_CSV, size)
+    columnar = ColumnarCSVParser()
+    rows, errors = feed_in_chunks(columnar, MESSY_CSV, size)
+
+    assert errors == expected[1]
+    assert [e["line"] for e in errors] == [7, 8, 9, 10]
+    # repr: nan != nan
+    assert [(r["equipmentId"], r["timestamp"], repr(r["value"])) for r in rows] == \
+        [(r["equipmentId"], r["timestamp"], repr(r["value"])) for r in expected[0]]
+    assert columnar.offset == len(MESSY_CSV)
+
+@pytest.mark.parametrize("parts", [1, 3, 8])
+def test_columnar_parser_splits_chunks_into_line_aligned_blocks(parts):
+    lines = [f"EQ-{i % 5},2024-12-05T15:{i // 60 % 60:02d}:{i % 60:02d}Z,{i}" for i in range(200)]
+    lines[17] = "EQ-1,bad,1"
+    data = ("equipmentId,timestamp,value\n" + "\n".join(lines) + "\n").encode()
+    expected_rows, expected_errors = feed_in_chunks(CSVStreamParser(), data, 1000)
+
+    parser = ColumnarCSVParser()
+    rows, errors = [], []
+    for i in range(0, len(data), 1000):
+        blocks, header_errors = parser.split(data[i:i + 1000], parts)
+        assert len(blocks) <= parts
+        chunk_rows, chunk_errors = parser.merge([parse_block(*block) for block in blocks], header_errors)
+        rows.extend(documents(chunk_rows))
+        errors.extend(chunk_errors)
+    blocks, header_errors = parser.split_last(parts)
+    chunk_rows, chunk_errors = parser.merge([parse_block(*block) for block in blocks], header_errors)
+
+    assert rows + documents(chunk_rows) == expected_rows
+    assert errors + chunk_errors == expected_errors == [{"line": 19, "error": expected_errors[0]["error"]}]
+    assert parser.offset == len(data)
@@ -0,0 +1,23 @@
+import numpy as np
+from utils.downsampling import lttb
+
+def test_lttb_keeps_endpoints_and_size():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+    kept = lttb(x, y, 100)
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+
+def test_lttb_preserves_spikes():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.zeros(10000)
+    y[1234] = 50.0
+    y[8765] = -50.0
+    kept = lttb(x, y, 50)
+    assert 1234 in kept
+    assert 8765 in kept
+
+def test_lttb_returns_everything_below_threshold():
+    x = np.arange(10, dtype=np.float64)
+    assert lttb(x, x, 20).tolist() == list(range(10))
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import pytest
+from utils import metrics
+from utils.metrics import Counter, Gauge, Histogram, LoopLagMonitor, Registry
+
+def test_render_prometheus_text_format():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ("route",)))
+    depth = registry.register(Gauge("queue_depth", "Depth.", function=lambda: 3))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    for value in (0.05, 0.1, 0.5, 7.0):
+        latency.observe(value)
+
+    text = registry.render()
+
+    assert '# TYPE requests_total counter\nrequests_total{route="/a\\"b"} 3\n' in text
+    assert "queue_depth 3\n" in text
+    assert 'latency_seconds_bucket{le="0.1"} 2\n' in text
+    assert 'latency_seconds_bucket{le="1"} 3\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "latency_seconds_sum 7.65\nlatency_seconds_count 4" in text
+    assert depth.function() == 3
+
+def test_labels_must_match_names():
+    with pytest.raises(ValueError):
+        Counter("c_total", "C.", ("a", "b")).labels("x")
+
+@pytest.mark.asyncio
+async def test_track_names_the_running_function():
+    seen = []
+
+    @metrics.track("outer")
+    async def outer():
+        seen.append(metrics.current_function())
+        await inner()
+        seen.append(metrics.current_function())
+
+    @metrics.track("inner")
+    async def inner():
+        seen.append(metrics.current_function())
+
+    await outer()
+    assert seen == ["outer", "inner", "outer"]
+    assert metrics.current_function() == "other"
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_sees_a_blocked_loop():
+    histogram = Histogram("lag_seconds", "Lag.", buckets=(0.05,))
+    monitor = LoopLagMonitor(histogram, interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    child = histogram.labels()
+    assert child.counts[-1] >= 1
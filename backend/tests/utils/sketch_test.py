@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from utils.sketch import RELATIVE_ACCURACY, QuantileSketch, grouped_sketches
+
+def test_quantiles_within_relative_accuracy():
+    values = np.random.default_rng(7).lognormal(mean=2.0, sigma=1.5, size=20000)
+    values[:500] *= -1
+    sketch = QuantileSketch().add(values)
+
+    assert sketch.count == len(values)
+    for q in (0.0, 0.01, 0.5, 0.95, 0.99, 1.0):
+        exact = np.sort(values)[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=RELATIVE_ACCURACY * 1.01)
+
+def test_zero_and_empty_sketch():
+    assert QuantileSketch().quantile(0.5) is None
+    assert QuantileSketch().add(np.zeros(5)).quantile(0.5) == 0.0
+
+def test_merged_sketches_equal_one_sketch():
+    values = np.random.default_rng(1).normal(50, 10, 5000)
+    merged = QuantileSketch().add(values[:1234]).merge(QuantileSketch().add(values[1234:]))
+
+    assert merged.bins == QuantileSketch().add(values).bins
+    # Ida e volta pelo formato gravado no MongoDB
+    assert QuantileSketch(merged.to_dict()).bins == merged.bins
+
+def test_grouped_sketches():
+    values = np.random.default_rng(2).normal(0, 5, 3000)
+    groups = np.arange(3000) % 3
+
+    sketches = grouped_sketches(groups, values, 4)
+
+    for group in range(3):
+        assert sketches[group].bins == QuantileSketch().add(values[groups == group]).bins
+    assert sketches[3].count == 0
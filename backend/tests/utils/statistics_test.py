@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from utils.sketch import QuantileSketch
+from utils.statistics import grouped_statistics
+
+def test_grouped_statistics_match_numpy():
+    rng = np.random.default_rng(3)
+    times = np.sort(rng.integers(0, 10 * 3600 * 1000, 5000))
+    values = rng.normal(1e6, 3.0, 5000)
+
+    groups = grouped_statistics(times, values, 0, 3600 * 1000)
+
+    assert [group["index"] for group in groups] == list(range(10))
+    for group in groups:
+        chunk = values[times // (3600 * 1000) == group["index"]]
+        assert group["count"] == len(chunk)
+        assert group["mean"] == pytest.approx(chunk.mean())
+        assert group["stddev"] == pytest.approx(chunk.std(), rel=1e-6)
+        assert (group["min"], group["max"]) == (chunk.min(), chunk.max())
+
+def test_partials_merge_into_their_group():
+    values = np.arange(1.0, 101.0)
+    times = np.arange(100) * 1000
+    old, recent = values[:40], values[40:]
+    partial = {
+        "timestamp": 0, "count": len(old), "sum": old.sum(), "sumsq": (old ** 2).sum(),
+        "min": old.min(), "max": old.max(), "sketch": QuantileSketch().add(old).to_dict(),
+    }
+
+    [group] = grouped_statistics(times[40:], recent, 0, 10 ** 6, [partial])
+
+    assert group["count"] == 100
+    assert group["mean"] == pytest.approx(values.mean())
+    assert group["stddev"] == pytest.approx(values.std())
+    assert (group["min"], group["max"]) == (1.0, 100.0)
+    assert group["sketch"].quantile(0.5) == pytest.approx(50.0, rel=0.02)
@@ -1,8 +1,11 @@
 import os
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jwt.exceptions import InvalidTokenError
 from dotenv import load_dotenv
+from config import settings
 
 load_dotenv()
 
@@ -18,9 +21,32 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire, "sub": data.get("username")})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# Payloads já verificados, por token (LRU); cada um vale até o seu "exp"
+_token_cache = OrderedDict()
+
 def decode_access_token(token: str):
+    """
+    Verifies a token and returns its payload, or `None` if it is invalid or expired.
+
+    Verified payloads are kept in a bounded LRU keyed by the token itself and
+    served until their `exp`, so the signature is checked once per token rather
+    than once per request. Invalid tokens are never cached.
+    """
+    cached = _token_cache.get(token)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at > time.time():
+            _token_cache.move_to_end(token)
+            return payload
+        del _token_cache[token]
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except InvalidTokenError:
         return None
+
+    if settings.AUTH_TOKEN_CACHE_SIZE > 0 and "exp" in payload:
+        _token_cache[token] = (payload, payload["exp"])
+        while len(_token_cache) > settings.AUTH_TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return payload
@@ -0,0 +1,145 @@
+import json
+import math
+from datetime import datetime, timedelta
+import msgpack
+import numpy as np
+from utils.csv_parser import parse_timestamp
+
+# Registro binário de largura fixa (little-endian, 32 bytes):
+# equipmentId (16 bytes UTF-8, completado com NUL), timestamp (int64, ms desde a época UTC), value (float64)
+READING_DTYPE = np.dtype([("equipmentId", "S16"), ("timestamp", "<i8"), ("value", "<f8")])
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+MSGPACK = "application/msgpack"
+BINARY = "application/octet-stream"
+
+MEDIA_TYPES = {
+    "application/json": JSON,
+    "application/x-ndjson": NDJSON,
+    "application/ndjson": NDJSON,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/octet-stream": BINARY,
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+class BatchFormatError(Exception):
+    """Raised when a batch body cannot be decoded at all (as opposed to a bad item)."""
+
+def media_type(content_type: str):
+    """Returns the canonical batch media type for a Content-Type header, or `None`."""
+    return MEDIA_TYPES.get((content_type or "").split(";")[0].strip().lower())
+
+def _to_timestamp(value):
+    if isinstance(value, str):
+        return parse_timestamp(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return EPOCH + timedelta(milliseconds=value)
+    if isinstance(value, datetime):
+        return value
+    raise ValueError("timestamp must be an ISO 8601 string or epoch milliseconds")
+
+def _to_value(value) -> float:
+    if isinstance(value, bool):
+        raise ValueError("value must be a number")
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("value must be finite")
+    return value
+
+def validate_items(items):
+    """
+    Validates decoded items and builds the documents to insert.
+
+    An item is a mapping with `equipmentId`, `timestamp` and `value`, or a
+    `[equipmentId, timestamp, value]` array. Timestamps are ISO 8601 strings or
+    epoch milliseconds (UTC).
+
+    Returns:
+    - tuple: `(docs, errors)`, where `docs[i]` is the document of item `i` or
+      `None` when it is invalid, and `errors` lists `{"index", "error"}`.
+    """
+    docs = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, dict):
+                equipment_id, timestamp, value = item["equipmentId"], item["timestamp"], item["value"]
+            elif isinstance(item, (list, tuple)) and len(item) == 3:
+                equipment_id, timestamp, value = item
+            else:
+                raise ValueError("expected an object with equipmentId, timestamp and value")
+            if not isinstance(equipment_id, str) or not equipment_id:
+                raise ValueError("equipmentId must be a non-empty string")
+            docs.append({"equipmentId": equipment_id, "timestamp": _to_timestamp(timestamp), "value": _to_value(value)})
+        except KeyError as e:
+            docs.append(None)
+            errors.append({"index": index, "error": f"missing field {e}"})
+        except (TypeError, ValueError, OverflowError) as e:
+            docs.append(None)
+            errors.append({"index": index, "error": str(e)})
+    return docs, errors
+
+def decode_binary(body: bytes):
+    """
+    Decodes fixed-width binary records (`READING_DTYPE`) with NumPy.
+
+    Returns the same `(docs, errors)` pair as `validate_items`.
+    """
+    if len(body) % READING_DTYPE.itemsize:
+        raise BatchFormatError(f"Binary body length must be a multiple of {READING_DTYPE.itemsize} bytes.")
+    records = np.frombuffer(body, dtype=READING_DTYPE)
+    # Validação vetorizada: valor finito e equipmentId não vazio
+    valid = np.isfinite(records["value"]) & (records["equipmentId"] != b"")
+    timestamps = records["timestamp"].astype("datetime64[ms]").tolist()
+    values = records["value"].tolist()
+    equipment_ids = records["equipmentId"].tolist()
+
+    docs = []
+    errors = []
+    for index, ok in enumerate(valid.tolist()):
+        if not ok:
+            docs.append(None)
+            errors.append({"index": index, "error": "value must be finite and equipmentId non-empty"})
+            continue
+        if not isinstance(timestamps[index], datetime):
+            # Fora do intervalo de datetime, o NumPy devolve um inteiro
+            docs.append(None)
+            errors.append({"index": index, "error": "timestamp out of range"})
+            continue
+        try:
+            equipment_id = equipment_ids[index].decode("utf-8")
+        except UnicodeDecodeError:
+            docs.append(None)
+            errors.append({"index": index, "error": "equipmentId is not valid UTF-8"})
+            continue
+        docs.append({"equipmentId": equipment_id, "timestamp": timestamps[index], "value": values[index]})
+    return docs, errors
+
+def decode_batch(body: bytes, kind: str):
+    """
+    Decodes a batch body of the given canonical media type.
+
+    Returns:
+    - tuple: `(docs, errors)` as in `validate_items`.
+
+    Raises:
+    - BatchFormatError: If the body is not valid JSON/NDJSON/msgpack or a whole
+      number of binary records.
+    """
+    if kind == BINARY:
+        return decode_binary(body)
+    try:
+        if kind == JSON:
+            items = json.loads(body)
+        elif kind == NDJSON:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = msgpack.unpackb(body, raw=False, timestamp=3)
+    except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        raise BatchFormatError(f"Malformed body: {e}")
+    if not isinstance(items, list):
+        raise BatchFormatError("Body must be an array of readings.")
+    return validate_items(items)
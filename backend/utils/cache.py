@@ -0,0 +1,258 @@
+import asyncio
+import fcntl
+import functools
+import inspect
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+ALL_STATIONS = "*"
+SHARED_SLOTS = 4096
+
+def estimate_size(value) -> int:
+    """Approximate memory used by a response made of dicts, lists and scalars."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+class LocalGenerations:
+    """Invalidation counter of each tag, seen by this process only."""
+
+    def __init__(self):
+        self._counts = {}
+
+    def get(self, tag: str) -> int:
+        return self._counts.get(tag, 0)
+
+    def bump(self, tags):
+        for tag in tags:
+            self._counts[tag] = self._counts.get(tag, 0) + 1
+
+    def clear(self):
+        self._counts.clear()
+
+class SharedGenerations:
+    """
+    Invalidation counters in a shared memory segment, seen by every worker.
+
+    Tags are hashed (CRC32) into `slots` 64-bit counters, so two stations in the
+    same slot only invalidate each other more often. Increments take an
+    exclusive `flock` on a lock file next to the segment, so concurrent
+    invalidations from two workers are never lost; reads take no lock.
+
+    The first process to open `name` creates the segment. It is never unlinked
+    here: the process that owns the server's lifetime (the gunicorn master, see
+    `gunicorn.conf.py`) calls `unlink`.
+
+    Parameters:
+    - name (str): Name of the shared memory segment.
+    - slots (int): Number of counters.
+    """
+
+    def __init__(self, name: str, slots: int = SHARED_SLOTS):
+        try:
+            self._memory = shared_memory.SharedMemory(name=name, create=True, size=slots * 8)
+        except FileExistsError:
+            self._memory = shared_memory.SharedMemory(name=name)
+        # O resource tracker apagaria o segmento quando o primeiro worker saísse
+        resource_tracker.unregister(self._memory._name, "shared_memory")
+        self._counts = np.ndarray((self._memory.size // 8,), dtype=np.int64, buffer=self._memory.buf)
+        self._lock = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+
+    def _slot(self, tag: str) -> int:
+        return zlib.crc32(tag.encode()) % len(self._counts)
+
+    def get(self, tag: str) -> int:
+        return int(self._counts[self._slot(tag)])
+
+    def bump(self, tags):
+        slots = {self._slot(tag) for tag in tags}
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        try:
+            for slot in slots:
+                self._counts[slot] += 1
+        finally:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+
+    def clear(self):
+        # Os contadores são de todos os workers: limpar o cache local não os zera
+        pass
+
+    def unlink(self):
+        """Removes the segment and its lock file (the workers keep their mappings)."""
+        self._memory.unlink()
+        try:
+            os.unlink(os.path.join(tempfile.gettempdir(), f"{self._memory.name}.lock"))
+        except FileNotFoundError:
+            pass
+
+class ResponseCache:
+    """
+    In-process LRU cache with a TTL and a memory bound, for service responses.
+
+    - Concurrent misses on the same key share one load (single-flight). The load
+      runs in its own task, so a caller that goes away does not cancel it for
+      the others.
+    - Every entry is tagged with the equipmentId it depends on, or with
+      `ALL_STATIONS`. `invalidate` bumps the counters of the given stations;
+      their entries are dropped when next read, and a load that was running
+      when its tag was invalidated is returned to its callers but not stored.
+    - `ALL_STATIONS` entries are not invalidated by ingest: under steady ingest
+      some station changes with almost every write, which would drop them on
+      nearly every request. They are served for `all_stations_ttl` seconds
+      instead, which bounds how stale they can be.
+    - Responses bigger than `max_bytes / 8` are never stored, so a single huge
+      response cannot flush the whole cache.
+
+    The entries live in the worker process. Each one records the invalidation
+    counters of its tags when it was loaded and is only served while they are
+    unchanged; with `SharedGenerations` the counters are shared, so an ingest
+    in any worker invalidates the entries of every worker.
+
+    Parameters:
+    - max_entries (int): Maximum number of entries.
+    - max_bytes (int): Maximum estimated size of all entries.
+    - ttl (float): Seconds an entry stays valid.
+    - all_stations_ttl (float, optional): Seconds an `ALL_STATIONS` entry stays
+      valid; defaults to `ttl`.
+    - enabled (bool): When false, calls go straight to the wrapped function.
+    - generations (optional): `LocalGenerations` (default) or `SharedGenerations`.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: float = 5.0, enabled: bool = True, generations=None, all_stations_ttl: float = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.all_stations_ttl = ttl if all_stations_ttl is None else all_stations_ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._generations = generations if generations is not None else LocalGenerations()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else None,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+        self._generations.clear()
+        self._bytes = 0
+        self.hits = self.misses = self.coalesced = self.evictions = self.invalidations = 0
+
+    def invalidate(self, equipment_ids):
+        """
+        Invalidates the entries of the given stations, in O(stations).
+
+        Their entries are dropped when next read (or evicted as least recently
+        used); all-stations entries only expire (see `all_stations_ttl`).
+        """
+        self._generations.bump(set(equipment_ids))
+
+    async def get_or_load(self, key, tag: str, load):
+        """
+        Returns the cached response for `key`, or awaits `load()` once for all callers.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[4] != self._generation(tag):
+                # Invalidada por uma ingestão em outro worker
+                self._remove(key)
+                self.invalidations += 1
+            elif entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            else:
+                self._remove(key)
+
+        future = self._loading.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        generation = self._generation(tag)
+        future = asyncio.ensure_future(load())
+        self._loading[key] = future
+        future.add_done_callback(lambda done: self._store(key, tag, generation, done))
+        return await asyncio.shield(future)
+
+    def cached(self, namespace: str, station_arg: str = None):
+        """
+        Decorator caching an async service function by its arguments.
+
+        Parameters:
+        - namespace (str): Prefix of the cache keys of this function.
+        - station_arg (str, optional): Argument holding the equipmentId the response
+          depends on. Without it the response depends on every station.
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = (namespace,) + tuple(bound.arguments.values())
+                tag = bound.arguments[station_arg] if station_arg else ALL_STATIONS
+                return await self.get_or_load(key, tag, lambda: func(*args, **kwargs))
+
+            return wrapper
+        return decorator
+
+    def _store(self, key, tag, generation, future):
+        if self._loading.get(key) is future:
+            del self._loading[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        # Uma ingestão durante a carga pode ter deixado o resultado desatualizado
+        if generation != self._generation(tag):
+            return
+        value = future.result()
+        size = estimate_size(value)
+        if size > self.max_bytes // 8:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.all_stations_ttl if tag == ALL_STATIONS else self.ttl
+        self._entries[key] = (value, time.monotonic() + ttl, size, tag, generation)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _generation(self, tag: str) -> int:
+        # Cada entrada só depende da própria tag; ALL_STATIONS nunca é incrementada
+        return self._generations.get(tag)
+
+    def _remove(self, key):
+        _, _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
@@ -1,18 +1,526 @@
 import csv
-from datetime import datetime
-
-def parse_csv(data: bytes):
-    try:
-        decoded = data.decode("utf-8")
-        reader = csv.DictReader(decoded.splitlines())
-        result = []
-        for row in reader:
-            result.append({
-                "equipmentId": row["equipmentId"],
-                "timestamp": datetime.fromisoformat(row["timestamp"]),
-                "value": float(row["value"])
-            })
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+REQUIRED_COLUMNS = ("equipmentId", "timestamp", "value")
+PARSERS = ("columnar", "rows")
+
+class CSVFormatError(Exception):
+    """Raised when the CSV header does not contain the required columns."""
+
+def parse_timestamp(value: str) -> datetime:
+    # datetime.fromisoformat só aceita o sufixo "Z" a partir do Python 3.11
+    value = value.strip()
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+class CSVStreamParser:
+    """
+    Incremental CSV parser fed with raw byte chunks.
+
+    Only complete lines are parsed; a trailing partial line is kept until the next
+    chunk arrives, so memory use is bounded by the chunk size rather than the file
+    size. Rows that fail to parse are reported with their line number instead of
+    invalidating the whole file.
+
+    A parser can resume a file part-way through: pass the `offset`, `line_number`
+    and `header` saved from an earlier parser and feed it the bytes from `offset`.
+
+    Attributes:
+    - offset (int): Byte offset just past the last complete line parsed.
+    - line_number (int): Number of the last complete line parsed (header is line 1).
+    """
+
+    def __init__(self, offset: int = 0, line_number: int = 0, header=None):
+        self.offset = offset
+        self.line_number = line_number
+        self._columns = None
+        self._pending = b""
+        if header is not None:
+            self._set_header(header)
+
+    @property
+    def header(self):
+        return list(self._columns) if self._columns else None
+
+    def _set_header(self, columns):
+        columns = [column.strip().lstrip("\ufeff") for column in columns]
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise CSVFormatError(f"Missing columns: {', '.join(missing)}")
+        self._columns = columns
+        self._indexes = [columns.index(column) for column in REQUIRED_COLUMNS]
+
+    def feed(self, chunk: bytes):
+        """
+        Parses every complete line in `chunk` (plus what was pending).
+
+        Returns:
+        - tuple: (rows, errors) where rows are dicts ready to insert and errors are
+          `{"line": int, "error": str}` dicts.
+
+        Raises:
+        - CSVFormatError: If the header is invalid.
+        """
+        data = self._pending + chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._pending = data
+            return [], []
+        self._pending = data[end + 1:]
+        self.offset += end + 1
+        return self._parse_lines(data[:end + 1].splitlines())
+
+    def close(self):
+        """Parses the last line when the file does not end with a newline."""
+        data, self._pending = self._pending, b""
+        if not data.strip():
+            if self._columns is None:
+                raise CSVFormatError("Empty CSV file.")
+            return [], []
+        self.offset += len(data)
+        rows, errors = self._parse_lines([data])
+        if self._columns is None:
+            raise CSVFormatError("Empty CSV file.")
+        return rows, errors
+
+    def _parse_lines(self, lines):
+        rows = []
+        errors = []
+        equipment_index, timestamp_index, value_index = (None, None, None)
+        if self._columns is not None:
+            equipment_index, timestamp_index, value_index = self._indexes
+        for raw in lines:
+            self.line_number += 1
+            try:
+                line = raw.decode("utf-8").rstrip("\r")
+            except UnicodeDecodeError:
+                errors.append({"line": self.line_number, "error": "Invalid UTF-8."})
+                continue
+            if not line.strip():
+                continue
+            fields = next(csv.reader([line]))
+            if self._columns is None:
+                self._set_header(fields)
+                equipment_index, timestamp_index, value_index = self._indexes
+                continue
+            try:
+                equipment_id = fields[equipment_index].strip()
+                if not equipment_id:
+                    raise ValueError("Empty equipmentId.")
+                rows.append({
+                    "equipmentId": equipment_id,
+                    "timestamp": parse_timestamp(fields[timestamp_index]),
+                    "value": float(fields[value_index]),
+                })
+            except IndexError:
+                errors.append({"line": self.line_number, "error": "Missing fields."})
+            except ValueError as e:
+                errors.append({"line": self.line_number, "error": str(e)})
+        return rows, errors
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+# Posições dos dígitos de "YYYY-MM-DDTHH:MM:SS"
+_DATE_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+
+def _epoch_ms(ts: datetime) -> int:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (ts - _EPOCH) // _MILLISECOND
+
+def parse_timestamps(values) -> tuple:
+    """
+    Parses ISO-8601 timestamps to epoch milliseconds (UTC), all at once with NumPy.
+
+    Covers the layout the stations send, `YYYY-MM-DDTHH:MM:SS` (`T`, `t` or a
+    space between date and time) with optional fractional seconds and an
+    optional `Z` or `+HH:MM`/`-HH:MM` offset; timestamps without an offset are
+    UTC. Fractions are truncated to the millisecond, the resolution the
+    readings are stored with.
+
+    Parameters:
+    - values: Sequence or array of stripped ASCII `bytes`.
+
+    Returns:
+    - tuple: `(milliseconds, parsed)`: an int64 array and a bool array, False
+      where the value is not in that layout or is not a valid date; those are
+      left to `parse_timestamp`.
+    """
+    values = np.asarray(values, dtype=bytes)
+    count = len(values)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    # Colunas de folga (NUL) para as posições variáveis da fração e do fuso
+    width = max(values.dtype.itemsize, 23) + 7
+    # Uma linha por posição: cada coluna do texto vira um vetor contíguo
+    chars = np.ascontiguousarray(values.astype(f"S{width}").view(np.uint8).reshape(count, width).T)
+
+    def is_digit(column):
+        return (column - 48) <= 9
+
+    def number(first, size):
+        result = np.zeros(count, dtype=np.int64)
+        for column in range(first, first + size):
+            result = result * 10 + chars[column] - 48
         return result
-    except Exception as e:
-        print(f"Error parsing CSV: {e}")
-        return None
+
+    parsed = is_digit(chars[_DATE_DIGITS]).all(axis=0)
+    parsed &= np.isin(chars[10], (ord("T"), ord("t"), ord(" ")))
+    for column, separator in ((4, "-"), (7, "-"), (13, ":"), (16, ":")):
+        parsed &= chars[column] == ord(separator)
+    year, month, day = number(0, 4), number(5, 2), number(8, 2)
+    hour, minute, second = number(11, 2), number(14, 2), number(17, 2)
+
+    has_fraction = chars[19] == ord(".")
+    # Primeiro não dígito depois do ponto: a coluna final é sempre NUL
+    fraction_size = np.where(has_fraction, np.argmin(is_digit(chars[20:]), axis=0), 0)
+    milliseconds = np.zeros(count, dtype=np.int64)
+    for position in range(3):
+        milliseconds = milliseconds * 10 + np.where(position < fraction_size, chars[20 + position] - 48, 0)
+    parsed &= ~has_fraction | (fraction_size > 0)
+
+    # O fuso começa numa posição que depende da fração; num arquivo são poucas posições
+    zone = np.where(has_fraction, 20 + fraction_size, 19)
+    offset = np.zeros(count, dtype=np.int64)
+    valid_zone = np.zeros(count, dtype=bool)
+    positions = [int(zone[0])] if zone.min() == zone.max() else np.unique(zone).tolist()
+    for position in positions:
+        rows = zone == position
+        first = chars[position]
+        end = first == 0
+        end |= np.isin(first, (ord("Z"), ord("z"))) & (chars[position + 1] == 0)
+        signed = (
+            np.isin(first, (ord("+"), ord("-"))) & (chars[position + 3] == ord(":")) & (chars[position + 6] == 0)
+            & is_digit(chars[position + 1]) & is_digit(chars[position + 2])
+            & is_digit(chars[position + 4]) & is_digit(chars[position + 5])
+        )
+        if signed[rows].any():
+            hours = number(position + 1, 2)
+            minutes = number(position + 4, 2)
+            signed &= (hours < 24) & (minutes < 60)
+            sign = np.where(first == ord("-"), -1, 1)
+            offset = np.where(rows & signed, sign * (hours * 60 + minutes) * 60000, offset)
+        valid_zone |= rows & (end | signed)
+    parsed &= valid_zone
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_month = _DAYS_IN_MONTH[np.clip(month - 1, 0, 11)] + ((month == 2) & leap)
+    parsed &= (
+        (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month)
+        & (hour < 24) & (minute < 60) & (second < 60)
+    )
+
+    # Dias desde a época pelo calendário gregoriano proléptico (algoritmo days_from_civil)
+    shifted = year - (month <= 2)
+    era = shifted // 400
+    year_of_era = shifted - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+
+    result = (((days * 24 + hour) * 60 + minute) * 60 + second) * 1000 + milliseconds - offset
+    return np.where(parsed, result, 0), parsed
+
+class ReadingColumns:
+    """
+    Parsed readings as parallel arrays, without a dict or a datetime per row.
+
+    Attributes:
+    - equipment_ids (np.ndarray): Station ids (str).
+    - timestamps (np.ndarray): Epoch milliseconds (UTC), int64.
+    - values (np.ndarray): float64.
+    """
+
+    def __init__(self, equipment_ids, timestamps, values):
+        self.equipment_ids = equipment_ids
+        self.timestamps = timestamps
+        self.values = values
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=str), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+    @classmethod
+    def concatenate(cls, parts):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            np.concatenate([part.equipment_ids for part in parts]),
+            np.concatenate([part.timestamps for part in parts]),
+            np.concatenate([part.values for part in parts]),
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return ReadingColumns(self.equipment_ids[index], self.timestamps[index], self.values[index])
+
+    def to_documents(self) -> list:
+        """Readings as the documents the storage inserts (naive UTC datetimes)."""
+        return [
+            {"equipmentId": equipment_id, "timestamp": timestamp, "value": value}
+            for equipment_id, timestamp, value in zip(
+                self.equipment_ids.tolist(),
+                self.timestamps.astype("datetime64[ms]").tolist(),
+                self.values.tolist(),
+            )
+        ]
+
+def _rows_to_columns(rows) -> ReadingColumns:
+    if not rows:
+        return ReadingColumns.empty()
+    return ReadingColumns(
+        np.array([row["equipmentId"] for row in rows], dtype=str),
+        np.array([_epoch_ms(row["timestamp"]) for row in rows], dtype=np.int64),
+        np.array([row["value"] for row in rows], dtype=np.float64),
+    )
+
+def _parse_lines_by_row(data: bytes, header, first_line: int):
+    parser = CSVStreamParser(line_number=first_line - 1, header=header)
+    rows, errors = parser._parse_lines(data.splitlines())
+    return _rows_to_columns(rows), errors
+
+# Bytes nulos depois do bloco: as janelas dos últimos campos não passam do fim
+_SLACK = 64
+# Espaços removidos por str.strip() na faixa ASCII
+_SPACES = np.zeros(256, dtype=bool)
+_SPACES[[9, 11, 12, 28, 29, 30, 31, 32]] = True
+
+def _strip(buffer, begin, end):
+    """Moves the `[begin, end)` field limits past leading and trailing spaces."""
+    while True:
+        leading = (begin < end) & _SPACES[buffer[np.minimum(begin, len(buffer) - 1)]]
+        if not leading.any():
+            break
+        begin = begin + leading
+    while True:
+        trailing = (end > begin) & _SPACES[buffer[np.maximum(end - 1, 0)]]
+        if not trailing.any():
+            break
+        end = end - trailing
+    return begin, end
+
+def _slice_bytes(buffer, begin, end, text: bool = False):
+    """
+    Array of the `[begin, end)` ranges of `buffer`: `bytes` (`S` dtype), or
+    `str` (`U` dtype) for ASCII text when `text` is set.
+    """
+    sizes = end - begin
+    width = max(int(sizes.max()), 1)
+    if int(begin.max()) + width > len(buffer):
+        buffer = np.concatenate((buffer, np.zeros(width, dtype=np.uint8)))
+    # Uma janela de `width` bytes a partir de cada início (visão, sem cópia do texto)
+    chars = np.lib.stride_tricks.sliding_window_view(buffer, width)[begin]
+    # Campos mais curtos que o mais longo: zera o que passa do fim de cada um
+    if int(sizes.min()) < width:
+        chars[np.arange(width) >= sizes[:, None]] = 0
+    if text:
+        return chars.astype(np.uint32).view(f"U{width}").ravel()
+    return chars.view(f"S{width}").ravel()
+
+def parse_block(data: bytes, header, first_line: int):
+    """
+    Parses complete CSV lines (no header) into `ReadingColumns`, a block at a time.
+
+    Plain blocks (ASCII, no quotes, LF or CRLF line ends) are cut at the
+    positions of their commas and converted column by column with NumPy; rows with an unexpected number
+    of fields, timestamps outside the `parse_timestamps` layout and values NumPy
+    cannot convert fall back to the row-by-row rules of `CSVStreamParser`, so
+    both parsers accept the same rows and report the same errors. A pure
+    function of its arguments: it runs as well in a pool process.
+
+    Parameters:
+    - data (bytes): Complete lines, each ending with a newline.
+    - header (list[str]): Columns of the file.
+    - first_line (int): Line number of the first line of `data`.
+
+    Returns:
+    - tuple: `(columns, errors)` with `{"line": int, "error": str}` errors in line order.
+    """
+    if not data:
+        return ReadingColumns.empty(), []
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n")
+    if not data.isascii() or b'"' in data or b"\r" in data:
+        return _parse_lines_by_row(data, header, first_line)
+
+    columns = len(header)
+    equipment_index, timestamp_index, value_index = [header.index(column) for column in REQUIRED_COLUMNS]
+    buffer = np.frombuffer(data + bytes(_SLACK), dtype=np.uint8)
+    index_type = np.int32 if len(buffer) < 2 ** 31 else np.int64
+    ends = np.flatnonzero(buffer == ord("\n")).astype(index_type)
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(index_type)
+    commas = np.flatnonzero(buffer == ord(",")).astype(index_type)
+    blank = ends == starts
+    # Linhas só com espaços também são irregulares: a regra linha a linha as ignora
+    first_commas = np.searchsorted(commas, starts)
+    regular = ~blank & (np.searchsorted(commas, ends) - first_commas == columns - 1)
+
+    errors = []
+    # (números das linhas, leituras) de cada parte, reordenadas no fim como no arquivo
+    parts = []
+    # Linhas com outro número de campos seguem as regras linha a linha (raras)
+    for line in np.flatnonzero(~blank & ~regular).tolist():
+        part, part_errors = _parse_lines_by_row(data[starts[line]:ends[line] + 1], header, first_line + line)
+        parts.append((np.full(len(part), line), part))
+        errors.extend(part_errors)
+
+    lines = np.flatnonzero(regular)
+    if len(lines):
+        # Limites de cada campo pelas posições das vírgulas, sem separar o texto em objetos
+        first_comma = first_commas[lines]
+
+        def field(index, strip=False, text=False):
+            begin = starts[lines] if index == 0 else commas[first_comma + index - 1] + 1
+            end = ends[lines] if index == columns - 1 else commas[first_comma + index]
+            if strip:
+                begin, end = _strip(buffer, begin, end)
+            return _slice_bytes(buffer, begin, end, text)
+
+        equipment_ids = field(equipment_index, strip=True, text=True)
+        timestamps = field(timestamp_index, strip=True)
+        values = field(value_index)
+
+        # Primeiro erro de cada linha, na ordem de CSVStreamParser: equipmentId, timestamp, valor
+        failed = {row: "Empty equipmentId." for row in np.flatnonzero(equipment_ids == "").tolist()}
+        milliseconds, parsed = parse_timestamps(timestamps)
+        for row in np.flatnonzero(~parsed).tolist():
+            if row in failed:
+                continue
+            try:
+                milliseconds[row] = _epoch_ms(parse_timestamp(timestamps[row].decode()))
+            except ValueError as e:
+                failed[row] = str(e)
+        try:
+            numbers = values.astype(np.float64)
+        except ValueError:
+            numbers = np.zeros(len(values), dtype=np.float64)
+            for row, value in enumerate(values.tolist()):
+                try:
+                    numbers[row] = float(value.decode())
+                except ValueError as e:
+                    failed.setdefault(row, str(e))
+
+        keep = np.ones(len(lines), dtype=bool)
+        if failed:
+            keep[list(failed)] = False
+            errors.extend({"line": first_line + int(lines[row]), "error": error} for row, error in failed.items())
+        part = ReadingColumns(equipment_ids, milliseconds, numbers)
+        parts.append((lines[keep], part[keep]))
+
+    errors.sort(key=lambda error: error["line"])
+    if len(parts) == 1:
+        return parts[0][1], errors
+    readings = ReadingColumns.concatenate([part for _, part in parts])
+    if not len(readings):
+        return readings, errors
+    order = np.argsort(np.concatenate([line for line, part in parts if len(part)]), kind="stable")
+    return readings[order], errors
+
+class ColumnarCSVParser(CSVStreamParser):
+    """
+    `CSVStreamParser` that returns `ReadingColumns` instead of a dict per row.
+
+    `feed` and `close` parse in the calling thread. To parse in other
+    processes, `split` (or `split_last` at the end of the file) takes the
+    complete lines of a chunk, advancing the position as `feed` would, and cuts
+    them into blocks of whole lines; each block is a tuple of `parse_block`
+    arguments and `merge` joins the results in order.
+    """
+
+    def _take_header(self, data: bytes):
+        # Linhas até o cabeçalho seguem as regras de CSVStreamParser
+        errors = []
+        while self._columns is None and data:
+            end = data.find(b"\n")
+            line, data = (data, b"") if end < 0 else (data[:end], data[end + 1:])
+            errors.extend(self._parse_lines([line])[1])
+        return data, errors
+
+    def _cut(self, data: bytes, parts: int):
+        data, errors = self._take_header(data)
+        if not data:
+            return [], errors
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        blocks = []
+        start = 0
+        for part in range(1, parts + 1):
+            end = len(data) if part == parts else data.find(b"\n", max(len(data) * part // parts, start)) + 1
+            if end <= start:
+                continue
+            block = data[start:end]
+            blocks.append((block, self.header, self.line_number + 1))
+            self.line_number += block.count(b"\n")
+            start = end
+        return blocks, errors
+
+    def split(self, chunk: bytes, parts: int = 1):
+        """
+        Takes the complete lines of `chunk` (plus what was pending).
+
+        Returns:
+        - tuple: `(blocks, errors)`: up to `parts` `parse_block` argument tuples,
+          and the errors of the lines before the header.
+
+        Raises:
+        - CSVFormatError: If the header is invalid.
+        """
+        data = self._pending + chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._pending = data
+            return [], []
+        self._pending = data[end + 1:]
+        self.offset += end + 1
+        return self._cut(data[:end + 1], parts)
+
+    def split_last(self, parts: int = 1):
+        """Like `split` for the last line, when the file does not end with a newline."""
+        data, self._pending = self._pending, b""
+        if not data.strip():
+            if self._columns is None:
+                raise CSVFormatError("Empty CSV file.")
+            return [], []
+        self.offset += len(data)
+        blocks, errors = self._cut(data, parts)
+        if self._columns is None:
+            raise CSVFormatError("Empty CSV file.")
+        return blocks, errors
+
+    @staticmethod
+    def merge(results, errors=()):
+        """Joins the `parse_block` results of consecutive blocks into `(columns, errors)`."""
+        merged = list(errors)
+        for _, block_errors in results:
+            merged.extend(block_errors)
+        return ReadingColumns.concatenate([columns for columns, _ in results]), merged
+
+    def feed(self, chunk: bytes):
+        blocks, errors = self.split(chunk)
+        return self.merge([parse_block(*block) for block in blocks], errors)
+
+    def close(self):
+        blocks, errors = self.split_last()
+        return self.merge([parse_block(*block) for block in blocks], errors)
+
+def create_parser(kind: str, offset: int = 0, line_number: int = 0, header=None) -> CSVStreamParser:
+    """
+    Builds the CSV parser selected by `CSV_PARSER`.
+
+    Parameters:
+    - kind (str): "columnar" (`ColumnarCSVParser`) or "rows" (`CSVStreamParser`).
+    - offset, line_number, header: Position to resume from (see `CSVStreamParser`).
+    """
+    if kind == "columnar":
+        return ColumnarCSVParser(offset, line_number, header)
+    if kind == "rows":
+        return CSVStreamParser(offset, line_number, header)
+    raise ValueError(f"Unknown CSV_PARSER {kind!r}; use one of {', '.join(PARSERS)}.")
@@ -0,0 +1,48 @@
+import numpy as np
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, for each of the `threshold - 2` buckets
+    in between, the point forming the largest triangle with the point kept in the
+    previous bucket and the average of the next bucket. Peaks and dips survive,
+    unlike with a plain average per bucket.
+
+    The loop runs once per output bucket; the work inside each bucket is
+    vectorized, so the cost is O(n) numpy operations over the input.
+
+    Parameters:
+    - x (np.ndarray): Ascending x coordinates (e.g. timestamps in ms).
+    - y (np.ndarray): Values, same length as `x`.
+    - threshold (int): Number of points to keep (at least 3).
+
+    Returns:
+    - np.ndarray: Indices of the points kept, ascending.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Limites dos buckets intermediários (o primeiro e o último ponto ficam sempre)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        px, py = x[previous], y[previous]
+        areas = np.abs((px - next_x) * (y[start:end] - py) - (px - x[start:end]) * (next_y - py))
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+    return kept
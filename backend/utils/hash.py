@@ -1,9 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
+from config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt é CPU-bound e libera o GIL: roda num pool próprio para não travar o event loop
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    """`hash_password` on the password hashing pool (at most `PASSWORD_HASH_WORKERS` at once)."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """`verify_password` on the password hashing pool (at most `PASSWORD_HASH_WORKERS` at once)."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, verify_password, plain_password, hashed_password)
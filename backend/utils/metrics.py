@@ -0,0 +1,251 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import math
+import time
+from typing import Callable, Optional, Sequence
+
+# Limites (segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Limites dos histogramas de tamanho de lote
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        """Returns the child for these label values, created on first use (keep the values few)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Counter(_Metric):
+    """Monotonic counter. Updated from the event loop thread only."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _samples(self):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._children.items()]
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down, set directly or read from `function` at scrape time.
+
+    Parameters:
+    - function (callable, optional): Returns the current value; for gauges without labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def _samples(self):
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return [f"{self.name}{_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._children.items()]
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # Um bisect e dois incrementos: barato o bastante para o caminho de ingestão
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Histogram(_Metric):
+    """Histogram with fixed bucket upper bounds (inclusive), exported cumulatively."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _samples(self):
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+class Registry:
+    """Metrics exported by `/metrics`, in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), function=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, function))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+_function = contextvars.ContextVar("metrics_function", default="other")
+
+def current_function() -> str:
+    """Name of the service function being run (see `track`), for storage metrics."""
+    return _function.get()
+
+def track(name: str):
+    """
+    Decorator naming the service function an async call runs in.
+
+    Storage operations awaited inside it are labeled with `name`. Put it
+    closest to the function, below any caching decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _function.set(name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _function.reset(token)
+        return wrapper
+    return decorator
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: how late a `sleep(interval)` wakes up.
+
+    A blocked loop (CPU-bound work, a synchronous call) shows up as lag for
+    every request it delays.
+
+    Parameters:
+    - histogram (Histogram): Receives every measurement, in seconds.
+    - interval (float): Seconds between measurements.
+    """
+
+    def __init__(self, histogram: Histogram, interval: float = 0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.histogram.observe(lag)
@@ -0,0 +1,103 @@
+import math
+import numpy as np
+
+# Erro relativo máximo dos quantis. Os bins ficam gravados nos rollups: não mude
+# sem reconstruí-los, sketches com precisões diferentes não podem ser somados
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# Valores com magnitude abaixo disso contam como zero (bin 0)
+MIN_VALUE = 1e-9
+
+_LOG_GAMMA = math.log(GAMMA)
+# Desloca os índices para que todo valor >= MIN_VALUE caia num bin >= 1
+_OFFSET = 1 - math.ceil(math.log(MIN_VALUE) / _LOG_GAMMA)
+
+def bin_keys(values) -> np.ndarray:
+    """
+    Sketch bin of each value, vectorized.
+
+    Bin `k > 0` holds the positive values in `(GAMMA^(k-1-offset), GAMMA^(k-offset)]`,
+    bin `-k` the negative values of the same magnitude and bin 0 the values
+    near zero, so bins sort in the same order as the values they hold.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    magnitudes = np.abs(values)
+    keys = np.zeros(len(values), dtype=np.int64)
+    nonzero = magnitudes >= MIN_VALUE
+    keys[nonzero] = np.ceil(np.log(magnitudes[nonzero]) / _LOG_GAMMA).astype(np.int64) + _OFFSET
+    return np.where(values < 0, -keys, keys)
+
+def bin_values(keys) -> np.ndarray:
+    """Value reported for each bin: within `RELATIVE_ACCURACY` of anything in it."""
+    keys = np.asarray(keys, dtype=np.int64)
+    magnitudes = np.abs(keys)
+    values = 2 * np.power(GAMMA, magnitudes - _OFFSET, dtype=np.float64) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * values)
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a relative-error guarantee (DDSketch-style).
+
+    Values are counted in logarithmic bins (`bin_keys`); any quantile is
+    answered within `RELATIVE_ACCURACY` of the true value, whatever the number
+    of values, and the size only grows with the range of magnitudes seen.
+    Sketches merge by adding bin counts, so partial sketches (per hour, per
+    batch) combine exactly, including through MongoDB `$inc` on `to_dict`.
+
+    Parameters:
+    - bins (dict, optional): `{bin: count}`, with int or str keys.
+    """
+
+    def __init__(self, bins=None):
+        self.bins = {}
+        for key, count in (bins or {}).items():
+            self.bins[int(key)] = self.bins.get(int(key), 0) + int(count)
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def add(self, values):
+        keys, counts = np.unique(bin_keys(values), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+        return self
+
+    def merge(self, other: "QuantileSketch"):
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        return self
+
+    def quantile(self, q: float):
+        """Returns the `q` quantile (0 <= q <= 1), or `None` for an empty sketch."""
+        if not self.bins:
+            return None
+        keys = np.fromiter(sorted(self.bins), dtype=np.int64)
+        ranks = np.cumsum([self.bins[key] for key in keys.tolist()])
+        index = int(np.searchsorted(ranks, q * (ranks[-1] - 1), side="right"))
+        return float(bin_values(keys[min(index, len(keys) - 1)]))
+
+    def to_dict(self) -> dict:
+        """Bins with string keys, as stored in MongoDB."""
+        return {str(key): count for key, count in self.bins.items()}
+
+def grouped_sketches(groups, values, n_groups: int):
+    """
+    Builds one sketch per group in a single vectorized pass.
+
+    Parameters:
+    - groups (np.ndarray): Group number (0..n_groups-1) of each value.
+    - values (np.ndarray): Values.
+    - n_groups (int): Number of groups.
+
+    Returns:
+    - list[QuantileSketch]: Sketch of each group (empty for groups without values).
+    """
+    sketches = [QuantileSketch() for _ in range(n_groups)]
+    if not len(values):
+        return sketches
+    pairs, counts = np.unique(np.stack([np.asarray(groups, dtype=np.int64), bin_keys(values)]),
+                              axis=1, return_counts=True)
+    for group, key, count in zip(pairs[0].tolist(), pairs[1].tolist(), counts.tolist()):
+        sketches[group].bins[key] = count
+    return sketches
@@ -0,0 +1,75 @@
+import math
+import numpy as np
+from utils.sketch import QuantileSketch, grouped_sketches
+
+def _merge(target: dict, other: dict):
+    """Merges count/mean/M2 (Chan et al.), min/max and sketches of two partial groups."""
+    count = target["count"] + other["count"]
+    delta = other["mean"] - target["mean"]
+    target["m2"] += other["m2"] + delta * delta * target["count"] * other["count"] / count
+    target["mean"] += delta * other["count"] / count
+    target["count"] = count
+    target["min"] = min(target["min"], other["min"])
+    target["max"] = max(target["max"], other["max"])
+    target["sketch"].merge(other["sketch"])
+
+def grouped_statistics(times, values, start_ms: int, width_ms: int, partials=()):
+    """
+    Count, mean, min, max, standard deviation and a quantile sketch per interval.
+
+    The readings are grouped into intervals of `width_ms` counted from
+    `start_ms` and reduced with NumPy in one pass over the arrays (the
+    deviation is accumulated around each group's mean, not from a sum of
+    squares). Pre-aggregated partials are then merged into their interval.
+
+    Parameters:
+    - times (np.ndarray): Timestamps in epoch ms.
+    - values (np.ndarray): Values, same length as `times`.
+    - start_ms (int): Start of the first interval.
+    - width_ms (int): Interval width.
+    - partials (iterable[dict]): Summaries with `timestamp` (epoch ms), `count`,
+      `sum`, `sumsq`, `min`, `max` and `sketch` bins, e.g. retention rollups.
+
+    Returns:
+    - list[dict]: Non-empty intervals in order, with `index`, `count`, `mean`,
+      `min`, `max`, `stddev` (population) and `sketch` (`QuantileSketch`).
+    """
+    groups = {}
+    if len(values):
+        indexes, inverse = np.unique((times - start_ms) // width_ms, return_inverse=True)
+        counts = np.bincount(inverse)
+        means = np.bincount(inverse, weights=values) / counts
+        m2 = np.bincount(inverse, weights=(values - means[inverse]) ** 2)
+        mins = np.full(len(indexes), np.inf)
+        maxs = np.full(len(indexes), -np.inf)
+        np.minimum.at(mins, inverse, values)
+        np.maximum.at(maxs, inverse, values)
+        sketches = grouped_sketches(inverse, values, len(indexes))
+        for i, index in enumerate(indexes.tolist()):
+            groups[index] = {"count": int(counts[i]), "mean": float(means[i]), "m2": float(m2[i]),
+                             "min": float(mins[i]), "max": float(maxs[i]), "sketch": sketches[i]}
+
+    for partial in partials:
+        if not partial["count"]:
+            continue
+        mean = partial["sum"] / partial["count"]
+        group = {
+            "count": partial["count"],
+            "mean": mean,
+            # Somas de quadrados perdem precisão com médias grandes: nunca negativo
+            "m2": max(partial.get("sumsq", 0.0) - partial["sum"] * mean, 0.0),
+            "min": partial["min"],
+            "max": partial["max"],
+            "sketch": QuantileSketch(partial.get("sketch")),
+        }
+        index = (partial["timestamp"] - start_ms) // width_ms
+        if index in groups:
+            _merge(groups[index], group)
+        else:
+            groups[index] = group
+
+    return [
+        {"index": index, "count": group["count"], "mean": group["mean"], "min": group["min"],
+         "max": group["max"], "stddev": math.sqrt(group["m2"] / group["count"]), "sketch": group["sketch"]}
+        for index, group in sorted(groups.items())
+    ]
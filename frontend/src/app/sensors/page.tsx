@@ -36,7 +36,7 @@ const SensorsPage = () => {
   const [sortDirection, setSortDirection] = useState<"asc" | "desc">("asc");
 
   const router = useRouter();
-  const periods = ["24h", "48h", "1w", "1m"];
+  const periods = ["24h", "48h", "1w", "1m", "1y"];
 
   useEffect(() => {
     const token = Cookies.get("token");
@@ -101,7 +101,7 @@ const SensorsPage = () => {
     try {
       const token = Cookies.get("token");
       const response = await fetch(
-        `${process.env.NEXT_PUBLIC_API_URL}/sensors/${equipmentId}/data?period=${selectedPeriod}`,
+        `${process.env.NEXT_PUBLIC_API_URL}/sensors/${equipmentId}/data?period=${selectedPeriod}&max_points=500&method=lttb`,
         {
           headers: { Authorization: `Bearer ${token}` },
         }
@@ -124,6 +124,33 @@ const SensorsPage = () => {
     fetchStationsData();
   }, [selectedPeriod]);
 
+  // Recebe as novas leituras da estação selecionada em vez de recarregar todo o período
+  const selectedEquipmentId = selectedStation?.equipmentId;
+  useEffect(() => {
+    const token = Cookies.get("token");
+    if (!selectedEquipmentId || !token) return;
+
+    const wsUrl = `${process.env.NEXT_PUBLIC_API_URL}`.replace(/^http/, "ws");
+    const socket = new WebSocket(
+      `${wsUrl}/sensors/ws?equipmentId=${encodeURIComponent(selectedEquipmentId)}&token=${token}`
+    );
+
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type !== "reading") return;
+      setSelectedStation((station: any) =>
+        station && station.equipmentId === event.equipmentId
+          ? {
+              ...station,
+              values: [...station.values, { timestamp: event.timestamp, value: event.value }],
+            }
+          : station
+      );
+    };
+
+    return () => socket.close();
+  }, [selectedEquipmentId]);
+
   const sortedStations = [...stations].sort((a, b) => {
     const valueA = a[sortColumn];
     const valueB = b[sortColumn];
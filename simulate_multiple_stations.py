@@ -1,46 +1,286 @@
-import requests
+import argparse
+import asyncio
+import json
 import random
+import signal
 import time
+from collections import Counter
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+import httpx
 
-# Configurações
-BACKEND_URL = "http://localhost:8000/sensors/data"
+# Configurações padrão
+BACKEND_URL = "http://localhost:8000"
 NUM_STATIONS = 2000
-INTERVAL = 2
-MAX_WORKERS = 100
+RATE = 1000.0
+CONNECTIONS = 100
+REPORT_INTERVAL = 1.0
+# Amostras de latência guardadas para o resumo final (amostragem de reservatório)
+RESERVOIR_SIZE = 100_000
 
 def generate_value():
     return round(random.uniform(20.0, 30.0), 2)
 
-def send_data(station_name):
-    value = generate_value()
-    timestamp = datetime.utcnow().isoformat() + "Z"
+def station_name(index):
+    # Nomes calculados sob demanda: centenas de milhares de estações sem lista em memória
+    return f"STATION_{index + 1}"
 
-    data = {
-        "equipmentId": station_name,
-        "timestamp": timestamp,
-        "value": value,
-    }
+def percentiles(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(latencies)
 
-    try:
-        response = requests.post(BACKEND_URL, json=data)
-        if response.status_code == 201:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] {station_name} Enviado: {data}")
+    def pick(q):
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+class Window:
+    """Contadores de um intervalo de relatório (ou da execução inteira, com reservatório)."""
+
+    def __init__(self, reservoir=None):
+        self.readings = 0
+        self.requests = 0
+        self.errors = Counter()
+        self.dropped = 0
+        self.latencies = []
+        self.events = 0
+        self.event_latencies = []
+        self._reservoir = reservoir
+        self._seen = {"latencies": 0, "event_latencies": 0}
+
+    def sample(self, name, value):
+        samples = getattr(self, name)
+        if self._reservoir is None:
+            samples.append(value)
+            return
+        self._seen[name] += 1
+        if len(samples) < self._reservoir:
+            samples.append(value)
         else:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] {station_name} Falha ({response.status_code}): {response.text}")
-    except requests.RequestException as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] {station_name} Erro ao enviar: {e}")
+            slot = random.randrange(self._seen[name])
+            if slot < self._reservoir:
+                samples[slot] = value
+
+class Simulator:
+    """
+    Gerador de carga em malha aberta: as leituras são agendadas a `rate` por
+    segundo desde o início, independentemente das respostas. A latência de cada
+    requisição conta a partir do instante agendado, então um servidor lento
+    aparece nos percentis em vez de só reduzir a taxa enviada.
+
+    As requisições compartilham um pool de `connections` conexões keep-alive; as
+    que esperam por uma conexão ficam num backlog limitado a `max_pending`, além
+    do qual as leituras são descartadas (e contadas).
+    """
+
+    def __init__(self, args, token):
+        self.args = args
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.client = httpx.AsyncClient(
+            base_url=args.url,
+            headers=self.headers,
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections),
+        )
+        self.window = Window()
+        self.total = Window(reservoir=RESERVOIR_SIZE)
+        self.pending = 0
+        self.stopping = asyncio.Event()
+        self._tasks = set()
+
+    def _record(self, name, value):
+        self.window.sample(name, value)
+        self.total.sample(name, value)
+
+    def _count(self, field, amount=1):
+        setattr(self.window, field, getattr(self.window, field) + amount)
+        setattr(self.total, field, getattr(self.total, field) + amount)
+
+    def _error(self, kind):
+        self.window.errors[kind] += 1
+        self.total.errors[kind] += 1
+
+    def _readings(self, first, count):
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        stations = self.args.stations
+        return [
+            {"equipmentId": station_name((first + i) % stations), "timestamp": timestamp, "value": generate_value()}
+            for i in range(count)
+        ]
+
+    async def _send(self, first, count, scheduled):
+        try:
+            readings = self._readings(first, count)
+            if self.args.batch_size > 1:
+                response = await self.client.post("/sensors/batch", json=readings)
+            else:
+                response = await self.client.post("/sensors/data", json=readings[0])
+            self._record("latencies", time.perf_counter() - scheduled)
+            self._count("requests")
+            if response.status_code in (200, 201):
+                self._count("readings", count)
+            else:
+                self._error(str(response.status_code))
+        except httpx.HTTPError as e:
+            self._count("requests")
+            self._error(type(e).__name__)
+        finally:
+            self.pending -= 1
+
+    def _dispatch(self, first, count, scheduled):
+        if self.pending >= self.args.max_pending:
+            self._count("dropped", count)
+            return
+        self.pending += 1
+        task = asyncio.get_running_loop().create_task(self._send(first, count, scheduled))
+        # Referência forte até o fim: o loop só guarda referências fracas das tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def generate(self):
+        rate = self.args.rate
+        batch = self.args.batch_size
+        started = time.perf_counter()
+        limit = int(self.args.duration * rate) if self.args.duration else None
+        scheduled = 0
+        while not self.stopping.is_set():
+            due = int((time.perf_counter() - started) * rate)
+            if limit is not None:
+                due = min(due, limit)
+            # Atrasado (o sleep acordou tarde): envia de uma vez tudo o que já venceu
+            while due - scheduled >= batch:
+                self._dispatch(scheduled, batch, started + (scheduled + batch) / rate)
+                scheduled += batch
+            if limit is not None and limit - scheduled < batch:
+                break
+            delay = started + (scheduled + batch) / rate - time.perf_counter()
+            try:
+                await asyncio.wait_for(self.stopping.wait(), max(delay, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def subscribe(self):
+        import websockets
+
+        url = self.args.url.replace("http", "ws", 1) + "/sensors/ws?token=" + self.args.token
+        while not self.stopping.is_set():
+            try:
+                async with websockets.connect(url) as websocket:
+                    async for message in websocket:
+                        event = json.loads(message)
+                        if event.get("type") == "reading":
+                            sent = datetime.fromisoformat(event["timestamp"])
+                            self._count("events")
+                            self._record("event_latencies", (datetime.utcnow() - sent).total_seconds())
+                        elif event.get("type") == "dropped":
+                            self._error("ws_dropped")
+            except (OSError, websockets.WebSocketException) as e:
+                self._error(f"ws_{type(e).__name__}")
+                await asyncio.sleep(1)
+
+    def _line(self, window, seconds):
+        parts = [
+            f"taxa {window.readings / seconds:.1f}/s (alvo {self.args.rate:g})",
+            f"req {window.requests}",
+            f"erros {sum(window.errors.values())}" + (f" {dict(window.errors)}" if window.errors else ""),
+            "latência p50/p95/p99 " + "/".join(str(v) for v in percentiles(window.latencies).values()) + " ms",
+            f"em voo {self.pending}",
+            f"descartadas {window.dropped}",
+        ]
+        if self.args.websockets:
+            parts.append(f"ws {window.events / seconds:.1f} ev/s p99 {percentiles(window.event_latencies)['p99_ms']} ms")
+        return " | ".join(parts)
+
+    async def report(self):
+        last = time.perf_counter()
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.args.report_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self.stopping.is_set():
+                # O intervalo final, incompleto, fica só no resumo
+                break
+            now = time.perf_counter()
+            window, self.window = self.window, Window()
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {self._line(window, now - last)}", flush=True)
+            last = now
+
+    def summary(self, seconds):
+        total = self.total
+        result = {
+            "seconds": round(seconds, 2),
+            "target_rate": self.args.rate,
+            "achieved_rate": round(total.readings / seconds, 2),
+            "readings": total.readings,
+            "requests": total.requests,
+            "errors": dict(total.errors),
+            "dropped": total.dropped,
+            **percentiles(total.latencies),
+        }
+        if self.args.websockets:
+            result["events"] = total.events
+            result["event_latency"] = percentiles(total.event_latencies)
+        return result
+
+    async def run(self):
+        subscribers = [asyncio.create_task(self.subscribe()) for _ in range(self.args.websockets)]
+        if subscribers:
+            # Dá tempo para as assinaturas abrirem antes das primeiras leituras
+            await asyncio.sleep(0.5)
+        started = time.perf_counter()
+        reporter = asyncio.create_task(self.report())
+        try:
+            await self.generate()
+            # Espera as requisições em voo antes do resumo
+            if self._tasks:
+                await asyncio.wait(set(self._tasks), timeout=self.args.timeout)
+        finally:
+            self.stopping.set()
+            for task in subscribers:
+                task.cancel()
+            await asyncio.gather(reporter, *subscribers, return_exceptions=True)
+            await self.client.aclose()
+        return self.summary(time.perf_counter() - started)
 
-def simulate_stations():
-    station_names = [f"STATION_{i}" for i in range(1, NUM_STATIONS + 1)]
+async def login(args):
+    if args.token or not args.username:
+        return args.token
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        response = await client.post("/auth/login", json={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        return response.json()["access_token"]
 
-    print(f"Simulando dados para {NUM_STATIONS} estações...")
+async def main(args):
+    args.token = await login(args)
+    if args.websockets and not args.token:
+        raise SystemExit("O modo WebSocket precisa de --token ou --username/--password.")
+    simulator = Simulator(args, args.token)
+    loop = asyncio.get_running_loop()
+    # Ctrl+C encerra a geração e ainda imprime o resumo
+    loop.add_signal_handler(signal.SIGINT, simulator.stopping.set)
+    loop.add_signal_handler(signal.SIGTERM, simulator.stopping.set)
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        while True:
-            executor.map(send_data, station_names)
-            print(f"Esperando {INTERVAL} segundos para o próximo envio...")
-            time.sleep(INTERVAL)
+    mode = f"lotes de {args.batch_size}" if args.batch_size > 1 else "uma leitura por requisição"
+    print(f"Simulando {args.stations} estações a {args.rate:g} leituras/s ({mode}) em {args.url}...", flush=True)
+    print(json.dumps(await simulator.run(), indent=2))
 
-simulate_stations()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simula muitas estações enviando dados para o backend, a uma taxa fixa.")
+    parser.add_argument("--url", default=BACKEND_URL, help="URL base do backend")
+    parser.add_argument("--stations", type=int, default=NUM_STATIONS, help="Número de estações (equipmentId)")
+    parser.add_argument("--rate", type=float, default=RATE, help="Leituras por segundo, no total")
+    parser.add_argument("--duration", type=float, default=0, help="Segundos de execução (0 = até Ctrl+C)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Leituras por requisição; acima de 1 usa POST /sensors/batch")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS, help="Conexões keep-alive do pool")
+    parser.add_argument("--max-pending", type=int, default=CONNECTIONS * 100,
+                        help="Requisições aguardando conexão antes de descartar leituras")
+    parser.add_argument("--websockets", type=int, default=0,
+                        help="Assinantes de /sensors/ws medindo a latência de entrega dos eventos")
+    parser.add_argument("--token", help="Token de acesso (ou use --username/--password)")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Timeout de cada requisição, em segundos")
+    parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL, help="Segundos entre relatórios")
+    asyncio.run(main(parser.parse_args()))
@@ -2,7 +2,7 @@
 
 echo "[REALTIME-SENSOR-DATA] Inicializando os testes das aplicações..."
 
-docker-compose run backend pytest --cache-clear --maxfail=5 --disable-warnings
+docker-compose run -e MONGO_TEST_URI=mongodb://mongo:27017 backend pytest --cache-clear --maxfail=5 --disable-warnings
 
 echo "[REALTIME-SENSOR-DATA] Testes finalizados com sucesso!"
 